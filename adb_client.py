@@ -0,0 +1,265 @@
+"""
+Talking to the adb server directly instead of running adb.
+
+The adb server (started by any adb command, or by us) listens on
+127.0.0.1:5037 and speaks a small text protocol: a request is its length in
+four hex digits followed by the text, and the reply starts with OKAY or
+FAIL (then a message, again prefixed with its hex length). AdbClient uses
+
+    devices()        host:devices - the serials adb knows and their state
+    track_devices()  host:track-devices - the same list again on every change
+    forward()        host-serial:<serial>:forward:tcp:<local>;tcp:<remote>
+
+so setting up a USB connection costs one local TCP round trip instead of an
+adb process. The adb binary (found once by find_adb) only runs when no
+server is up yet, to start one. DeviceWatcher follows track-devices on a
+background thread, so the USB receiver starts the moment a phone is
+plugged in instead of polling for it. phone_emulator.FakeAdbServer answers
+the same requests without adb.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import shutil
+import sys
+import threading
+
+ADB_HOST = '127.0.0.1'
+ADB_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT') or 5037)  # adb's own variable
+ONLINE = 'device'  # the state of a phone that is ready; others: unauthorized, offline, ...
+
+log = logging.getLogger("webcamo.usb")
+
+
+class AdbError(Exception):
+    """The adb server answered FAIL, or could not be reached or started."""
+
+
+@functools.lru_cache(maxsize=None)
+def find_adb():
+    """Bundled adb (PyInstaller), then ./adb/adb.exe, then adb on PATH."""
+    adb_cmd = 'adb'
+
+    if getattr(sys, 'frozen', False):
+        base = sys._MEIPASS  # temp folder PyInstaller extracts to
+        local_adb = os.path.join(base, "adb", "adb.exe")
+        if os.path.exists(local_adb):
+            adb_cmd = local_adb
+
+    # 2) Local project folder
+    local_adb = os.path.join(os.path.dirname(os.path.abspath(__file__)), "adb", "adb.exe")
+    if os.path.exists(local_adb):
+        adb_cmd = local_adb
+
+    # 3) System PATH
+    system_adb = shutil.which("adb")
+    if system_adb:
+        adb_cmd = system_adb
+    return adb_cmd
+
+
+def parse_device_list(text):
+    """``[(serial, state), ...]`` from a host:devices listing."""
+    devices = []
+    for line in text.splitlines():
+        serial, _, state = line.strip().partition('\t')
+        if serial:
+            devices.append((serial, state.strip()))
+    return devices
+
+
+def _request(service):
+    data = service.encode('utf-8')
+    return b'%04x' % len(data) + data
+
+
+async def _read_string(reader):
+    size = int(await reader.readexactly(4), 16)
+    return (await reader.readexactly(size)).decode('utf-8', 'replace')
+
+
+async def _read_status(reader):
+    status = await reader.readexactly(4)
+    if status == b'OKAY':
+        return
+    if status == b'FAIL':
+        raise AdbError(await _read_string(reader))
+    raise AdbError(f"unexpected reply from the adb server: {status!r}")
+
+
+class AdbClient:
+    """Requests to the adb server at ``host``:``port``. With ``start_server``
+    a server that isn't running is started with the adb binary (``adb``,
+    default find_adb()) once, like the adb command line does."""
+
+    def __init__(self, host=ADB_HOST, port=ADB_PORT, adb=None, start_server=True):
+        self.host = host
+        self.port = port
+        self.adb = adb
+        self.start_server = start_server
+
+    async def devices(self):
+        """``[(serial, state), ...]`` for every device adb knows about."""
+        reader, writer = await self._open('host:devices')
+        try:
+            return parse_device_list(await _read_string(reader))
+        except asyncio.IncompleteReadError as e:
+            raise AdbError("adb server closed the connection") from e
+        finally:
+            writer.close()
+
+    async def track_devices(self):
+        """Yields the device list now and again on every change, until the
+        server goes away (AdbError) or the generator is closed."""
+        reader, writer = await self._open('host:track-devices')
+        try:
+            while True:
+                yield parse_device_list(await _read_string(reader))
+        except asyncio.IncompleteReadError as e:
+            raise AdbError("adb server closed the connection") from e
+        finally:
+            writer.close()
+
+    async def forward(self, local, remote, serial=None):
+        """Forwards local TCP port ``local`` to ``remote`` on the device
+        (``serial``, or the only one connected)."""
+        target = f'host-serial:{serial}' if serial else 'host'
+        reader, writer = await self._open(f'{target}:forward:tcp:{local};tcp:{remote}')
+        try:
+            # The first OKAY is for finding the device, this one for the forward
+            await _read_status(reader)
+        except asyncio.IncompleteReadError as e:
+            raise AdbError("adb server closed the connection") from e
+        finally:
+            writer.close()
+
+    async def _open(self, service):
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError:
+            if not self.start_server:
+                raise AdbError(f"no adb server on port {self.port}") from None
+            await self._start_server()
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                raise AdbError(f"adb server did not start: {e}") from None
+        try:
+            writer.write(_request(service))
+            await _read_status(reader)
+        except asyncio.IncompleteReadError as e:
+            writer.close()
+            raise AdbError("adb server closed the connection") from e
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _start_server(self):
+        adb = self.adb or find_adb()
+        log.info("Starting the adb server")
+        env = dict(os.environ, ANDROID_ADB_SERVER_PORT=str(self.port))
+        try:
+            process = await asyncio.create_subprocess_exec(
+                adb, 'start-server', env=env,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        except OSError:
+            raise AdbError("ADB not found. Please install Android Platform Tools "
+                           "or place adb.exe in the adb folder.") from None
+        if await process.wait():
+            raise AdbError("'adb start-server' failed")
+
+
+class DeviceWatcher:
+    """Follows host:track-devices on a background thread.
+
+    ``devices`` is the latest {serial: state}; ``tracking`` is False while
+    the adb server can't be reached (it is retried every ``retry`` seconds).
+    wait_for_device() blocks until ``serial`` (or any phone, without one)
+    is online. ``on_change(devices)`` is called on the watcher's thread.
+    """
+
+    def __init__(self, serial=None, client=None, on_change=None, retry=1.0):
+        self.serial = serial
+        self.client = client or AdbClient()
+        self.on_change = on_change
+        self.retry = retry
+        self.devices = {}
+        self.tracking = False
+        self._changed = threading.Condition()
+        self._closing = False
+        self._loop = None
+        self._task = None
+        self._thread = threading.Thread(target=self._run, name="adb-devices", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def is_online(self):
+        with self._changed:
+            return self._online()
+
+    def wait_for_device(self, timeout=None):
+        """True once the device is online; False on timeout, stop(), or
+        when tracking is lost."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._online() or self._closing or not self.tracking, timeout)
+            return self._online()
+
+    def stop(self):
+        with self._changed:
+            self._closing = True
+            self._changed.notify_all()
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # already finished
+        if self._thread.is_alive():
+            self._thread.join(2.0)
+
+    def _online(self):
+        if self.serial:
+            return self.devices.get(self.serial) == ONLINE
+        return ONLINE in self.devices.values()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._task = self._loop.create_task(self._watch())
+            if self._closing:
+                self._task.cancel()
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _watch(self):
+        logged = False  # an unreachable server is logged once
+        while not self._closing:
+            try:
+                async for devices in self.client.track_devices():
+                    self._update(dict(devices), tracking=True)
+                    logged = False
+            except (AdbError, OSError) as e:
+                if not logged:
+                    log.warning(f"USB: can't follow adb devices ({e})")
+                    logged = True
+            self._update({}, tracking=False)
+            await asyncio.sleep(self.retry)
+
+    def _update(self, devices, tracking):
+        with self._changed:
+            changed = devices != self.devices
+            self.devices = devices
+            self.tracking = tracking
+            self._changed.notify_all()
+        if changed:
+            log.debug(f"adb devices: {devices}")
+            if self.on_change:
+                self.on_change(devices)
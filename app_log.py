@@ -0,0 +1,164 @@
+"""
+Logging for the receivers.
+
+Every module logs through the stdlib ``logging`` tree under "webcamo"
+(webcamo.usb, webcamo.wireless, webcamo.gui, ...), so each message carries
+a severity and one setup() decides where it goes. A corrupt stream can log
+once per frame, so whatever reaches an output is throttled first:
+
+    ThrottledHandler  wraps an output. Repeats of a message within
+                      REPEAT_WINDOW seconds are held back and come out as
+                      one "message (xN)" line when the window is over;
+                      beyond BURST distinct messages per second the rest
+                      are counted and summarised as "(N messages suppressed)".
+    file output       a QueueHandler in front of a FileHandler driven by a
+                      QueueListener, so disk writes happen on a background
+                      thread instead of the pipeline's.
+
+The desktop client shows the log in a QPlainTextEdit with a
+maximumBlockCount (a ring buffer: appending never touches the history) and
+writes a file when WEBCAMO_LOG_FILE is set; the headless receiver has
+--log-file. WEBCAMO_LOG_LEVEL (DEBUG, INFO, WARNING, ...) applies to both.
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+LOG_FILE = os.environ.get('WEBCAMO_LOG_FILE') or None
+LOG_LEVEL = (os.environ.get('WEBCAMO_LOG_LEVEL') or 'INFO').upper()
+REPEAT_WINDOW = 5.0  # seconds
+BURST = 20           # distinct messages per second
+
+ROOT = 'webcamo'
+FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+
+def _copy(record, msg, level=None):
+    copy = logging.makeLogRecord(record.__dict__)
+    copy.msg, copy.args, copy.exc_info, copy.exc_text = msg, None, None, None
+    if level is not None:
+        copy.levelno, copy.levelname = level, logging.getLevelName(level)
+    return copy
+
+
+class ThrottledHandler(logging.Handler):
+    """Passes records on to ``target``, collapsing repeats and limiting
+    bursts (see the module docstring). ``collapsed`` and ``suppressed``
+    count what was held back. flush() releases pending "(xN)" lines."""
+
+    def __init__(self, target, window=REPEAT_WINDOW, burst=BURST, clock=time.monotonic):
+        super().__init__(target.level)
+        self.target = target
+        self.window = window
+        self.burst = burst
+        self.clock = clock
+        self.collapsed = 0
+        self.suppressed = 0
+        self._recent = {}  # (logger, level, text) -> [shown_at, repeats, last record]
+        self._tokens = float(burst)
+        self._refilled = clock()
+        self._held = 0     # suppressed since the last summary
+        self._held_record = None
+
+    def emit(self, record):
+        now = self.clock()
+        key = (record.name, record.levelno, record.getMessage())
+        entry = self._recent.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            entry[2] = record
+            self.collapsed += 1
+            return
+        self._expire(now, skip=key)
+
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.burst)
+        self._refilled = now
+        if self._tokens < 1:
+            self._held += 1
+            self._held_record = record
+            self.suppressed += 1
+            return
+        self._tokens -= 1
+        self._release_held()
+
+        self._recent[key] = [now, 0, record]
+        if entry is not None and entry[1]:
+            # The window is over: this line stands for the whole run
+            record = _copy(record, f"{key[2]} (x{entry[1] + 1})")
+        self._forward(record)
+
+    def flush(self):
+        with self.lock:
+            self._expire(self.clock())
+            self._release_held()
+        self.target.flush()
+
+    def close(self):
+        self.flush()
+        self.target.close()
+        super().close()
+
+    def _expire(self, now, skip=None):
+        for key, (shown_at, repeats, record) in list(self._recent.items()):
+            if key != skip and now - shown_at >= self.window:
+                del self._recent[key]
+                if repeats:
+                    self._forward(_copy(record, f"{key[2]} (x{repeats})"))
+
+    def _release_held(self):
+        if self._held:
+            self._forward(_copy(self._held_record, f"({self._held} messages suppressed)", logging.WARNING))
+            self._held = 0
+            self._held_record = None
+
+    def _forward(self, record):
+        if record.levelno >= self.target.level:
+            self.target.handle(record)
+
+
+def flush():
+    """Releases pending "(xN)" lines; the desktop client calls this every second."""
+    for handler in logging.getLogger(ROOT).handlers:
+        handler.flush()
+
+
+def setup(handlers=(), level=LOG_LEVEL, file=LOG_FILE, fmt=FORMAT):
+    """Sends the "webcamo" loggers to ``handlers`` and, with ``file``, to
+    that file from a background thread, each through a ThrottledHandler.
+    Handlers without a formatter get ``fmt``. Returns a close() that
+    flushes pending lines and stops the file writer."""
+    logger = logging.getLogger(ROOT)
+    logger.setLevel(level)
+    logger.propagate = False
+    formatter = logging.Formatter(fmt)
+
+    outputs = list(handlers)
+    listener = None
+    if file:
+        # QueueHandler formats on the caller's thread; the file gets the text
+        writer = logging.FileHandler(file, encoding='utf-8')
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, writer)
+        listener.start()
+        outputs.append(logging.handlers.QueueHandler(records))
+
+    throttled = []
+    for handler in outputs:
+        if handler.formatter is None:
+            handler.setFormatter(formatter)
+        throttled.append(ThrottledHandler(handler))
+        logger.addHandler(throttled[-1])
+
+    def close():
+        for handler in throttled:
+            logger.removeHandler(handler)
+            handler.close()
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+
+    return close
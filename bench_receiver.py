@@ -0,0 +1,289 @@
+"""
+Throughput and latency benchmarks for the receivers, driven by phone_emulator.
+
+    python bench_receiver.py                          # USB: 720p/1080p x nv21/nv12/i420
+    python bench_receiver.py --fps 30 --frames 300    # at the phone's frame rate
+    python bench_receiver.py --codecs raw h264        # also the USB H.264 transport
+    python bench_receiver.py --wireless               # also the WebRTC receiver
+    python bench_receiver.py --convert-workers 0 3    # thread vs. a 3-process pool
+    python bench_receiver.py --fps 15 --pace          # paced 30 fps output from a 15 fps phone
+    python bench_receiver.py --stream-control         # phone follows the adaptive StreamConfig
+    python bench_receiver.py --json bench.json        # keep results for comparison
+    python bench_receiver.py --no-usb --replay phone.wcap   # a recorded phone (see capture.py)
+
+Each case runs the real UsbPipeline (or WirelessReceiver) against an
+in-process emulator and a sink (null by default, so the virtual camera
+driver is not measured). The emulator sends the layout and size asked
+for unless --stream-control lets it follow the receiver's StreamConfig
+(cropped I420 at the adaptive rate). --replay runs recordings through the same
+FrameGraph instead, one frame at a time, as fast as the sink takes them (--realtime: with their
+recorded timing). Reported per case:
+
+    fps        frames received / converted / sent per second of wall time
+    latency    p50 / p99 in ms from the emulator sending a frame to the sink
+               returning; for WebRTC, from the decoder handing it over
+    cpu        CPU seconds per stage thread, and for the whole process
+               (which includes the emulator)
+    alloc      receive buffers allocated, output images allocated / reused
+               from the BufferPool, and with --trace-malloc the peak traced
+               Python/NumPy memory
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from phone_emulator import LAYOUTS, UsbPhoneEmulator, WirelessPhoneEmulator, parse_size
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def _latency_ms(values):
+    return {'p50': percentile(values, 50) * 1000, 'p99': percentile(values, 99) * 1000}
+
+
+def bench_usb(width, height, layout, frames, fps, size=None, sink='null', trace_malloc=False, codec='raw',
+              convert_workers=0, pace=False, control=False):
+    from usb_pipeline import UsbPipeline, connect_device
+    from vcam_sinks import create_sink
+
+    emulator = UsbPhoneEmulator(port=0, width=width, height=height, layout=layout,
+                                fps=fps, frames=frames, codec=codec, control=control).start()
+    timings = []
+    sock = connect_device('127.0.0.1', emulator.port)
+    pipeline = UsbPipeline(sock, size=size, sink=create_sink(sink), on_timing=timings.append,
+                           convert_workers=convert_workers, pace=pace, adaptive=control)
+
+    if trace_malloc:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    try:
+        pipeline.run()
+    finally:
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        peak = tracemalloc.get_traced_memory()[1] if trace_malloc else None
+        if trace_malloc:
+            tracemalloc.stop()
+        sock.close()
+        emulator.stop()
+
+    sent_at = emulator.sent_at
+    st = pipeline.stats()
+    return {
+        'case': (f"usb {width}x{height} {layout if codec == 'raw' else codec}"
+                 + (f" pool{convert_workers}" if convert_workers else "") + (" paced" if pace else "")
+                 + (" controlled" if control else "")),
+        'frames': st['received'],
+        'fps': {'received': st['received'] / elapsed, 'converted': st['converted'] / elapsed,
+                'sent': st['sent'] / elapsed},
+        'latency_ms': {
+            'transfer': _latency_ms([t.received - sent_at[t.seq] for t in timings]),
+            'convert': _latency_ms([t.converted - t.received for t in timings]),
+            'sink': _latency_ms([t.sent - t.converted for t in timings]),
+            'end_to_end': _latency_ms([t.sent - sent_at[t.seq] for t in timings]),
+        },
+        'cpu_s': {'receive': st['cpu_receive'], 'convert': st['cpu_convert'],
+                  'sink': st['cpu_sink'], 'process': cpu},
+        'dropped': st['dropped_convert'] + st['dropped_sink'] + st['dropped_pacer'],
+        'repeated': st['repeated'],
+        'buffer_allocations': st['buffer_allocations'],
+        'images': {'allocated': st['buffers_allocated'], 'reused': st['buffers_reused']},
+        'peak_traced_mb': peak / 1e6 if peak is not None else None,
+    }
+
+
+async def _bench_wireless(width, height, frames, fps, size, sink, trace_malloc, pace):
+    from wireless_receiver import WirelessReceiver, signalling_url
+
+    emulator = await WirelessPhoneEmulator(port=0, width=width, height=height, fps=fps).start()
+    timings = []
+    done = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def on_timing(timing):  # sink thread
+        timings.append(timing)
+        if len(timings) == frames:
+            loop.call_soon_threadsafe(done.set)
+
+    receiver = WirelessReceiver(mirror=lambda: True, size=size or 720,
+                                sink_spec=sink, on_timing=on_timing, pace=pace)
+    if trace_malloc:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    try:
+        if not await receiver.connect(signalling_url('127.0.0.1', emulator.port)):
+            raise RuntimeError("wireless emulator: connection failed")
+        await asyncio.wait_for(done.wait(), timeout=30 + frames / fps * 2)
+    finally:
+        cpu = time.process_time() - cpu_start
+        peak = tracemalloc.get_traced_memory()[1] if trace_malloc else None
+        if trace_malloc:
+            tracemalloc.stop()
+        await receiver.close()
+        await emulator.stop()
+
+    # Skip connection setup: rate is measured between the first and last frame.
+    elapsed = timings[-1].sent - timings[0].received if len(timings) > 1 else float('nan')
+    rate = (len(timings) - 1) / elapsed
+    st = receiver.last_stats
+    return {
+        'case': f"webrtc {width}x{height}" + (" paced" if pace else ""),
+        'frames': len(timings),
+        'fps': {'received': rate, 'converted': rate, 'sent': rate},
+        'latency_ms': {
+            'convert': _latency_ms([t.converted - t.received for t in timings]),
+            'sink': _latency_ms([t.sent - t.converted for t in timings]),
+            'end_to_end': _latency_ms([t.sent - t.received for t in timings]),
+        },
+        'cpu_s': {'convert': st['cpu_convert'], 'sink': st['cpu_sink'], 'process': cpu},
+        'dropped': st['dropped_convert'] + st['dropped_sink'] + st['dropped_pacer'] + st['dropped_stale'],
+        'repeated': st['repeated'],
+        'buffer_allocations': None,
+        'images': {'allocated': st['buffers_allocated'], 'reused': st['buffers_reused']},
+        'peak_traced_mb': peak / 1e6 if peak is not None else None,
+    }
+
+
+def bench_wireless(width, height, frames, fps=30, size=None, sink='null', trace_malloc=False, pace=False):
+    return asyncio.run(_bench_wireless(width, height, frames, fps, size, sink, trace_malloc, pace))
+
+
+def bench_replay(path, size=None, sink='null', trace_malloc=False, convert_workers=0, pace=False,
+                 realtime=False):
+    from frame_graph import FrameGraph
+    from replay import open_source
+    from vcam_sinks import create_sink
+
+    source = open_source(path, realtime=realtime)
+    pool = None
+    if convert_workers:
+        from convert_pool import ConvertPool
+        pool = ConvertPool(convert_workers)
+    timings = []
+    graph = FrameGraph(source, create_sink(sink), size=size, on_timing=timings.append, pool=pool,
+                       pace=pace, fps=source.fps, name='replay')
+
+    if trace_malloc:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    try:
+        graph.run()
+    finally:
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        peak = tracemalloc.get_traced_memory()[1] if trace_malloc else None
+        if trace_malloc:
+            tracemalloc.stop()
+        if pool is not None:
+            pool.close()
+
+    st = graph.stats()
+    return {
+        'case': (f"replay {os.path.basename(path)}" + (f" pool{convert_workers}" if convert_workers else "")
+                 + (" paced" if pace else "") + (" realtime" if realtime else "")),
+        'frames': st['received'],
+        'fps': {'received': st['received'] / elapsed, 'converted': st['converted'] / elapsed,
+                'sent': st['sent'] / elapsed},
+        'latency_ms': {
+            'convert': _latency_ms([t.converted - t.received for t in timings]),
+            'sink': _latency_ms([t.sent - t.converted for t in timings]),
+            'end_to_end': _latency_ms([t.sent - t.received for t in timings]),
+        },
+        'cpu_s': {'convert': st['cpu_convert'], 'sink': st['cpu_sink'], 'process': cpu},
+        'dropped': st['dropped_convert'] + st['dropped_sink'] + st['dropped_pacer'],
+        'repeated': st['repeated'],
+        'buffer_allocations': None,
+        'images': {'allocated': st['buffers_allocated'], 'reused': st['buffers_reused']},
+        'peak_traced_mb': peak / 1e6 if peak is not None else None,
+    }
+
+
+def format_result(r):
+    fps = r['fps']
+    lat = r['latency_ms']['end_to_end']
+    cpu = r['cpu_s']
+    stages = ' '.join(f"{k} {v:.2f}s" for k, v in cpu.items())
+    line = (f"{r['case']:24} {r['frames']:5} frames  "
+            f"fps recv {fps['received']:6.1f} conv {fps['converted']:6.1f} sent {fps['sent']:6.1f}  "
+            f"e2e p50 {lat['p50']:6.1f} ms p99 {lat['p99']:6.1f} ms  cpu {stages}")
+    if r['repeated']:
+        line += f"  repeated {r['repeated']}"
+    if r['buffer_allocations'] is not None:
+        line += f"  buffers {r['buffer_allocations']}"
+    line += f"  images {r['images']['allocated']} new {r['images']['reused']} reused"
+    if r['peak_traced_mb'] is not None:
+        line += f"  peak {r['peak_traced_mb']:.1f} MB"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Webcamo receivers against phone_emulator")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(1280, 720), (1920, 1080)],
+                        metavar='WxH')
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument('--codecs', nargs='+', choices=('raw', 'h264'), default=['raw'],
+                        help="USB transports to run (h264 ignores --layouts)")
+    parser.add_argument('--convert-workers', type=int, nargs='+', default=[0],
+                        help="conversion processes per USB case (0 = convert on a thread)")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--fps', type=float, default=0,
+                        help="emulated camera rate; 0 = as fast as the receiver takes them (usb)")
+    parser.add_argument('--size', type=int, help="receiver output side length (default native / 720)")
+    parser.add_argument('--sink', default='null', help="sink spec, see vcam_sinks")
+    parser.add_argument('--pace', action='store_true',
+                        help="send at a constant 30 fps like the receivers do (default: as converted)")
+    parser.add_argument('--stream-control', action='store_true',
+                        help="let the emulated phone follow the receiver's adaptive StreamConfig (usb)")
+    parser.add_argument('--wireless', action='store_true', help="also benchmark the WebRTC receiver")
+    parser.add_argument('--no-usb', action='store_true')
+    parser.add_argument('--replay', nargs='+', default=[], metavar='PATH',
+                        help="also run these captures (--record) or Y4M files")
+    parser.add_argument('--realtime', action='store_true',
+                        help="replay with the recorded timing (default: as fast as conversion goes)")
+    parser.add_argument('--trace-malloc', action='store_true', help="report peak traced memory (slower)")
+    parser.add_argument('--json', help="write all results to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    if not args.no_usb:
+        for codec in args.codecs:
+            for width, height in args.sizes:
+                for layout in args.layouts if codec == 'raw' else args.layouts[:1]:
+                    for workers in args.convert_workers:
+                        r = bench_usb(width, height, layout, args.frames, args.fps, args.size, args.sink,
+                                      args.trace_malloc, codec, workers, args.pace, args.stream_control)
+                        print(format_result(r), flush=True)
+                        results.append(r)
+    if args.wireless:
+        for width, height in args.sizes:
+            r = bench_wireless(width, height, args.frames, args.fps or 30, args.size, args.sink,
+                               args.trace_malloc, args.pace)
+            print(format_result(r), flush=True)
+            results.append(r)
+
+    for path in args.replay:
+        for workers in args.convert_workers:
+            r = bench_replay(path, args.size, args.sink, args.trace_malloc, workers, args.pace, args.realtime)
+            print(format_result(r), flush=True)
+            results.append(r)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Recording what a receiver gets from the phone, for replaying it later.
+
+A capture holds the incoming stream exactly as received - raw USB packets
+with their strides and padding, H.264 chunks, or decoded WebRTC frames - so
+a performance problem can be reproduced without the phone it happened on
+(see replay.CaptureSource):
+
+    header   FILE_HEADER: b'WCAPTURE', version
+    records  RECORD header + payload, each padded to 8 bytes
+    index    one INDEX_DTYPE entry per record
+    footer   FOOTER: index offset, record count, b'WIDX'
+
+The index is a NumPy structured array the reader maps straight out of the
+file, so opening a capture and seeking to a time cost the same whatever
+its length. A capture whose writer never closed (the receiver was killed)
+has no footer; its index is rebuilt by walking the record headers.
+
+Payloads by kind:
+
+    KIND_RAW    the 41-byte VideoMeta as on the wire, padded to 48, then the
+                PacketReader slot (planes at VideoMeta.plane_layout())
+    KIND_H264   the Annex-B chunk; flags are the H264_* packet flags
+    KIND_I420   a packed (h * 3 // 2, w) I420 image; flag I420_MIRROR
+
+Times are time.perf_counter() seconds relative to the first record;
+``captured`` is NaN when the transport doesn't carry capture times.
+"""
+
+import dataclasses
+import logging
+import math
+import mmap
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from usb_protocol import (H264_END_OF_FRAME, H264_FRONT, METADATA, METADATA_SIZE, EncodedPacket, VideoMeta,
+                          VideoPacket)
+from yuv_convert import av_frame_planes, pack_i420
+
+CAPTURE_MAGIC = b'WCAPTURE'
+CAPTURE_VERSION = 1
+FILE_HEADER = struct.Struct('<8sII')            # magic, version, reserved
+RECORD_MAGIC = b'WREC'
+RECORD = struct.Struct('<4sBBHHHIIIdd')         # magic, kind, flags, width, height, reserved,
+                                                # seq, payload size, reserved, received, captured
+FOOTER = struct.Struct('<QI4s')                 # index offset, record count, magic
+FOOTER_MAGIC = b'WIDX'
+INDEX_DTYPE = np.dtype({
+    'names': ['offset', 'size', 'seq', 'kind', 'flags', 'width', 'height', 'received', 'captured'],
+    'formats': ['<u8', '<u4', '<u4', 'u1', 'u1', '<u2', '<u2', '<f8', '<f8'],
+    'offsets': [0, 8, 12, 16, 17, 18, 20, 24, 32],
+    'itemsize': 40,
+})
+
+KIND_RAW = 0
+KIND_H264 = 1
+KIND_I420 = 2
+RAW_META_SIZE = 48                              # METADATA_SIZE padded to 8
+I420_MIRROR = 1 << 0
+
+log = logging.getLogger("webcamo")
+
+
+def _padding(size):
+    return -size % 8
+
+
+class CaptureWriter:
+    """Appends frames to a capture at ``path`` (see the module docstring).
+
+    write_packet() takes USB packets on the receive thread, before they are
+    handed on; write_frame() takes decoded av.VideoFrames. Both only queue
+    the record (raw planes are copied into a reused buffer, as the packet's
+    goes back to the reader): a writer thread packs and writes it, so a
+    slow disk never holds up the stream. While ``queue_size`` records are
+    waiting, new ones are dropped and counted in ``dropped``. Disk errors
+    stop the recording (logged once) rather than the stream. close() writes
+    what is queued, then the index.
+    """
+
+    def __init__(self, path, queue_size=8):
+        self.path = path
+        self.frames = 0
+        self.bytes = 0
+        self.dropped = 0
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0))
+        self._offset = FILE_HEADER.size
+        self._index = []
+        self._base = None
+        self._i420 = None
+        self._free = []
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+
+    def write_packet(self, packet):
+        """A usb_protocol.VideoPacket or EncodedPacket."""
+        if not self._accepting():
+            return
+        if isinstance(packet, EncodedPacket):
+            flags = (H264_FRONT if packet.is_front else 0) | (H264_END_OF_FRAME if packet.end_of_frame else 0)
+            self._queue.put((KIND_H264, flags, 0, 0, packet.seq, packet.received_at, packet.captured_at,
+                             (bytes(packet.data),), None))
+            return
+        meta = packet.meta
+        _, _, (v_offset, v_size) = meta.plane_layout()
+        size = v_offset + v_size
+        buffer = self._take_buffer(size)
+        slot = memoryview(buffer)[:size]
+        slot[:] = memoryview(packet.buffer)[:size]
+        head = METADATA.pack(*dataclasses.astuple(meta)).ljust(RAW_META_SIZE, b'\0')
+        self._queue.put((KIND_RAW, 0, meta.width, meta.height, packet.seq, packet.received_at,
+                         packet.captured_at, (head, slot), buffer))
+
+    def write_frame(self, frame, seq, received, captured=None, mirror=False):
+        """A decoded av.VideoFrame, packed to I420 on the writer thread."""
+        if self._accepting():
+            self._queue.put((KIND_I420, I420_MIRROR if mirror else 0, frame.width, frame.height, seq,
+                             received, captured, frame, None))
+
+    def close(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+        f, self._file = self._file, None
+        if f is None:
+            return
+        try:
+            index = np.array(self._index, dtype=INDEX_DTYPE)
+            f.write(index.tobytes())
+            f.write(FOOTER.pack(self._offset, len(index), FOOTER_MAGIC))
+        finally:
+            f.close()
+        dropped = f", {self.dropped} dropped (disk too slow)" if self.dropped else ""
+        log.info(f"Recorded {self.frames} frames ({self.bytes / 1e6:.1f} MB) to {self.path}{dropped}")
+
+    def _accepting(self):
+        """False while the recording is stopped or the writer is behind
+        (one producer, so the queue can't fill between check and put)."""
+        if self._file is None or self._thread is None:
+            return False
+        if self._queue.full():
+            self.dropped += 1
+            if self.dropped == 1:
+                log.warning(f"Recording to {self.path} can't keep up; dropping frames")
+            return False
+        return True
+
+    def _take_buffer(self, size):
+        try:
+            buffer = self._free.pop()
+        except IndexError:
+            return bytearray(size)
+        return buffer if len(buffer) >= size else bytearray(size)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            kind, flags, width, height, seq, received, captured, chunks, buffer = item
+            if kind == KIND_I420:
+                self._i420 = pack_i420(*av_frame_planes(chunks), out=self._i420)
+                chunks = (self._i420.data,)
+            self._write(kind, flags, width, height, seq, received, captured, *chunks)
+            if buffer is not None:
+                self._free.append(buffer)
+
+    def _write(self, kind, flags, width, height, seq, received, captured, *chunks):
+        if self._file is None:
+            return
+        if self._base is None:
+            self._base = received
+        received -= self._base
+        captured = captured - self._base if captured is not None else math.nan
+        size = sum(memoryview(c).nbytes for c in chunks)
+        try:
+            self._file.write(RECORD.pack(RECORD_MAGIC, kind, flags, width, height, 0, seq & 0xFFFFFFFF,
+                                         size, 0, received, captured))
+            for chunk in chunks:
+                self._file.write(chunk)
+            self._file.write(b'\0' * _padding(size))
+        except OSError as e:
+            log.error(f"Recording to {self.path} stopped: {e}")
+            f, self._file = self._file, None
+            f.close()
+            return
+        payload = self._offset + RECORD.size
+        self._index.append((payload, size, seq & 0xFFFFFFFF, kind, flags, width, height, received, captured))
+        self._offset = payload + size + _padding(size)
+        self.frames += 1
+        self.bytes += size
+
+
+class CaptureReader:
+    """A capture mapped into memory.
+
+    ``index`` is the INDEX_DTYPE array (len() entries); payload(i) is a
+    writable view of record ``i`` - copy-on-write, so a converter that
+    patches a plane in place never touches the file. ``complete`` is False
+    for a capture without footer (see the module docstring).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        try:
+            magic, version, _ = FILE_HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = version = None
+        if magic != CAPTURE_MAGIC:
+            self._map.close()
+            raise ValueError("not a capture file")
+        if version != CAPTURE_VERSION:
+            self._map.close()
+            raise ValueError(f"unsupported capture version {version}")
+        self.index = self._read_index()
+        self.complete = self.index is not None
+        if self.index is None:
+            self.index = self._scan()
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def duration(self):
+        return float(self.index['received'][-1]) if len(self.index) else 0.0
+
+    def find(self, seconds):
+        """The first record received at or after ``seconds`` into the capture."""
+        return int(np.searchsorted(self.index['received'], seconds))
+
+    def payload(self, i):
+        entry = self.index[i]
+        offset = int(entry['offset'])
+        return memoryview(self._map)[offset:offset + int(entry['size'])]
+
+    def packet(self, i, received_at, captured_at=None):
+        """Record ``i`` (KIND_RAW) as a usb_protocol.VideoPacket over the map."""
+        payload = self.payload(i)
+        meta = VideoMeta.unpack(payload[:METADATA_SIZE])
+        return VideoPacket(meta, payload[RAW_META_SIZE:], seq=int(self.index[i]['seq']),
+                           header_at=received_at, received_at=received_at, captured_at=captured_at)
+
+    def close(self):
+        self.index = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # frames still refer to it; unmapped when they are gone
+
+    def _read_index(self):
+        end = len(self._map)
+        if end < FILE_HEADER.size + FOOTER.size:
+            return None
+        offset, count, magic = FOOTER.unpack_from(self._map, end - FOOTER.size)
+        if magic != FOOTER_MAGIC or offset + count * INDEX_DTYPE.itemsize != end - FOOTER.size:
+            return None
+        return np.frombuffer(self._map, dtype=INDEX_DTYPE, count=count, offset=offset)
+
+    def _scan(self):
+        entries = []
+        offset, end = FILE_HEADER.size, len(self._map)
+        while offset + RECORD.size <= end:
+            magic, kind, flags, width, height, _, seq, size, _, received, captured = \
+                RECORD.unpack_from(self._map, offset)
+            payload = offset + RECORD.size
+            if magic != RECORD_MAGIC or payload + size > end:
+                break  # the footer, or a record cut short
+            entries.append((payload, size, seq, kind, flags, width, height, received, captured))
+            offset = payload + size + _padding(size)
+        log.warning(f"{self.path} has no index (recording interrupted?); "
+                    f"rebuilt it from {len(entries)} records")
+        return np.array(entries, dtype=INDEX_DTYPE)
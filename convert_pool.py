@@ -0,0 +1,240 @@
+"""
+YUV -> BGR conversion in worker processes, over shared memory.
+
+At 4K, or with several streams in one process, the plane slicing and OpenCV
+calls of YuvConverter keep one core busy and the Python around them doesn't
+scale across threads. ConvertPool runs the same converter in a pool of
+processes:
+
+    submit()   copies the packet's planes into a free shared-memory input
+               slot and queues a small task (slot, metadata, geometry); no
+               frame data is ever pickled
+    worker     converts with its own YuvConverter and GeometryPlan straight
+               into the slot's shared-memory output
+    result()   waits for one job and returns the BGR image as a view of the
+               output slot; release() hands the slot back
+
+Jobs finish in any order; taking results in submission order (as UsbPipeline
+does) keeps frame order. The number of slots bounds the frames in flight,
+so submit() blocks while all of them are busy.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def default_workers():
+    """One process per core, leaving one for receiving and the sink."""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _attach(cache, key, name):
+    """Shared memory ``name`` for ``key``, re-attaching when the slot grew."""
+    entry = cache.get(key)
+    if entry is None or entry.name != name:
+        if entry is not None:
+            entry.close()
+        entry = cache[key] = shared_memory.SharedMemory(name=name)
+    return entry
+
+
+def _worker(tasks, results):
+    import signal
+    import time
+
+    from frame_geometry import GeometryPlan
+    from usb_protocol import VideoPacket
+    from yuv_convert import YuvConverter
+
+    # Ctrl+C reaches the whole process group; the owner shuts workers down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    converter = YuvConverter()
+    plans = {}
+    inputs = {}
+    outputs = {}
+    results.put(None)  # imported and ready
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job_id, slot, in_name, nbytes, meta, geometry, out_name, out_shape = task
+        bgr = dst = None  # no views may outlive a re-attach
+        try:
+            plan = None
+            if geometry is not None:
+                plan = plans.get(geometry)
+                if plan is None:
+                    plan = plans[geometry] = GeometryPlan(*geometry)
+            src = _attach(inputs, slot, in_name)
+            dst = np.ndarray(out_shape, dtype=np.uint8, buffer=_attach(outputs, slot, out_name).buf)
+
+            start = time.perf_counter()
+            bgr = converter.to_bgr(VideoPacket(meta, src.buf[:nbytes]), plan, dst=dst)
+            if bgr.ctypes.data != dst.ctypes.data:
+                np.copyto(dst, bgr)
+            elapsed = time.perf_counter() - start
+            results.put((job_id, None, converter.layout, converter.geometry_time, elapsed))
+        except Exception as e:
+            results.put((job_id, f"{type(e).__name__}: {e}", None, 0.0, 0.0))
+
+    for shm in (*inputs.values(), *outputs.values()):
+        shm.close()
+
+
+class PoolJob:
+    """One frame in the pool. After result(): ``layout``, and the worker's
+    ``geometry_time`` and ``convert_time`` in seconds."""
+
+    __slots__ = ('id', 'slot', 'shape', 'done', 'error', 'layout', 'geometry_time', 'convert_time')
+
+    def __init__(self, job_id, slot, shape):
+        self.id = job_id
+        self.slot = slot
+        self.shape = shape
+        self.done = threading.Event()
+        self.error = None
+        self.layout = None
+        self.geometry_time = 0.0
+        self.convert_time = 0.0
+
+
+class _Slot:
+    __slots__ = ('input', 'output')
+
+    def __init__(self):
+        self.input = None
+        self.output = None
+
+
+def _ensure(shm, size):
+    """``shm`` if it holds ``size`` bytes, else a new, larger block."""
+    if shm is not None and shm.size >= size:
+        return shm
+    if shm is not None:
+        _free_shm(shm)
+    return shared_memory.SharedMemory(create=True, size=size)
+
+
+def _free_shm(shm):
+    try:
+        shm.close()
+    except BufferError:
+        pass  # a view is still alive; the mapping goes with it
+    shm.unlink()
+
+
+class ConvertPool:
+    """``workers`` conversion processes sharing ``slots`` frame slots
+    (default: two more than workers, so the pool never waits on the caller).
+
+    The constructor returns once every worker has imported OpenCV, so the
+    first frames don't queue behind process start-up.
+    """
+
+    def __init__(self, workers=None, slots=None, start_timeout=30.0):
+        self.workers = workers or default_workers()
+        self.slots = slots or self.workers + 2
+        ctx = multiprocessing.get_context('spawn')
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._processes = [ctx.Process(target=_worker, args=(self._tasks, self._results),
+                                       name=f"convert-{i}", daemon=True) for i in range(self.workers)]
+        for p in self._processes:
+            p.start()
+        try:
+            for _ in self._processes:
+                self._results.get(timeout=start_timeout)
+        except queue.Empty:
+            for p in self._processes:
+                p.terminate()
+            raise RuntimeError("conversion workers did not start")
+
+        self._slots = [_Slot() for _ in range(self.slots)]
+        self._free = queue.Queue()
+        for i in range(self.slots):
+            self._free.put(i)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._closed = False
+        self._collector = threading.Thread(target=self._collect, name="convert-results", daemon=True)
+        self._collector.start()
+
+    def submit(self, packet, geometry=None):
+        """Queues ``packet`` (a VideoPacket) for conversion with ``geometry``
+        (a GeometryPlan or None). The packet can be released on return."""
+        meta = packet.meta
+        nbytes = sum(size for _, size in meta.plane_layout())
+        if geometry is not None:
+            out_shape = geometry.out_shape() + (3,)
+            geometry_args = (geometry.width, geometry.height, geometry.rotate, geometry.mirror, geometry.size)
+        else:
+            out_shape = (meta.height, meta.width, 3)
+            geometry_args = None
+
+        index = self._free.get()
+        slot = self._slots[index]
+        slot.input = _ensure(slot.input, nbytes)
+        slot.output = _ensure(slot.output, int(np.prod(out_shape)))
+        slot.input.buf[:nbytes] = memoryview(packet.buffer)[:nbytes]
+
+        with self._lock:
+            job = PoolJob(self._next_id, index, out_shape)
+            self._next_id += 1
+            self._jobs[job.id] = job
+        self._tasks.put((job.id, index, slot.input.name, nbytes, meta, geometry_args,
+                         slot.output.name, out_shape))
+        return job
+
+    def result(self, job):
+        """Waits for ``job`` and returns its BGR image, a view of the output
+        slot that stays valid until release(job)."""
+        while not job.done.wait(1.0):
+            if not all(p.is_alive() for p in self._processes):
+                raise RuntimeError("conversion worker exited")
+        if job.error:
+            raise RuntimeError(job.error)
+        return np.ndarray(job.shape, dtype=np.uint8, buffer=self._slots[job.slot].output.buf)
+
+    def release(self, job):
+        """Returns the job's slot to the pool."""
+        self._free.put(job.slot)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for p in self._processes:
+            p.join(2.0)
+            if p.is_alive():
+                p.terminate()
+        self._results.put(None)
+        self._collector.join(1.0)
+        for slot in self._slots:
+            for shm in (slot.input, slot.output):
+                if shm is not None:
+                    _free_shm(shm)
+            slot.input = slot.output = None
+
+    def _collect(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            job_id, error, layout, geometry_time, convert_time = message
+            with self._lock:
+                job = self._jobs.pop(job_id, None)
+            if job is None:
+                continue
+            job.error = error
+            job.layout = layout
+            job.geometry_time = geometry_time
+            job.convert_time = convert_time
+            job.done.set()
@@ -0,0 +1,208 @@
+"""
+Several phones at once: one receiver process per device.
+
+A device is addressed by its adb serial (USB) or its IP (wireless):
+
+    R58M1234XYZ                  usb, adb -s R58M1234XYZ forward
+    192.168.1.20:5555            usb over adb-over-wifi (still an adb serial)
+    192.168.1.21                 wireless (WebRTC), signalling on port 8080
+    wifi:192.168.1.21:8081       wireless, explicit signalling port
+    usb:emulator-5554@23240      usb, explicit local port
+    R58M1234XYZ=v4l2loopback:/dev/video3
+                                 ... with its own sink spec (see vcam_sinks)
+
+Each USB device gets its own local forward port (23233, 23234, ... unless
+given with @port); the phone side is always 23233. Each device runs the
+normal headless receiver in its own process, so four 1080p pipelines use
+four cores instead of sharing one interpreter.
+
+Every device after the first needs an output of its own. Without =SINK it
+gets a variant of the shared sink (--sink, else $WEBCAMO_SINK):
+
+    shm, file        a per-device suffix: shm:webcamo-1, file:out-1.y4m
+    v4l2loopback     without a device, the next free /dev/videoN (load the
+                     module with enough devices, e.g. devices=4)
+    unitycapture     "Unity Video Capture #2", #3, ... (install UnityCapture
+                     with that many devices)
+    obs, or a fixed  only one camera to go round, so these are refused:
+    v4l2loopback     give each device its own =SINK, or use shm:/file:
+    device
+"""
+
+import ipaddress
+import multiprocessing
+import os
+import sys
+
+USB_PORT = 23233
+WIRELESS_PORT = 8080
+
+
+class DeviceSpec:
+    """One phone: ``kind`` is 'usb' or 'wireless', ``address`` the adb serial
+    or IP, ``port`` the local forward port (usb) or signalling port."""
+
+    def __init__(self, kind, address, port=None, sink=None):
+        self.kind = kind
+        self.address = address
+        self.port = port
+        self.sink = sink
+
+    @property
+    def name(self):
+        return f"{self.kind}:{self.address}"
+
+    def __repr__(self):
+        return f"DeviceSpec({self.kind!r}, {self.address!r}, port={self.port}, sink={self.sink!r})"
+
+
+def _is_ip(text):
+    try:
+        ipaddress.ip_address(text)
+        return True
+    except ValueError:
+        return False
+
+
+def parse_device(text):
+    """Parses one device spec (see the module docstring); ports may be None."""
+    text, _, sink = text.strip().partition('=')
+    kind, sep, address = text.partition(':')
+    if sep and kind in ('usb', 'wifi', 'wireless'):
+        kind = 'usb' if kind == 'usb' else 'wireless'
+    else:
+        address = text
+        kind = 'wireless' if _is_ip(address) else 'usb'
+    if not address:
+        raise ValueError(f"Device spec without an address: {text!r}")
+
+    port = None
+    if kind == 'usb':
+        address, sep, local = address.partition('@')
+        if sep:
+            port = int(local)
+    else:
+        host, sep, remote = address.rpartition(':')
+        if sep and not _is_ip(address):
+            address, port = host, int(remote)
+    return DeviceSpec(kind, address, port, sink or None)
+
+
+def device_sink(sink, index):
+    """Per-device variant of a sink spec, so devices don't share one output
+    (see the module docstring). ValueError for a camera that can't be."""
+    if index == 0:
+        return sink
+    if not sink:
+        from vcam_sinks import DEFAULT_SINK
+        sink = DEFAULT_SINK
+    kind, _, arg = sink.partition(':')
+    if kind == 'auto':
+        # What create_sink picks: UnityCapture on Windows, else pyvirtualcam's default
+        kind = {'win32': 'unitycapture', 'darwin': 'obs'}.get(sys.platform, 'v4l2loopback')
+    if kind == 'shm':
+        return f"shm:{arg or 'webcamo'}-{index}"
+    if kind == 'file':
+        root, ext = os.path.splitext(arg)
+        return f"file:{root}-{index}{ext}"
+    if kind == 'unitycapture':
+        return f"unitycapture:{arg or 'Unity Video Capture'} #{index + 1}"
+    if kind == 'obs' or (kind == 'v4l2loopback' and arg):
+        raise ValueError(f"Sink {sink!r} is a single camera and can't be shared by several devices; "
+                         f"give each device its own (DEVICE=SINK) or use shm: or file:")
+    return sink
+
+
+def parse_devices(texts, sink=None):
+    """DeviceSpecs for ``texts`` with local ports and sinks filled in."""
+    devices = [parse_device(text) for text in texts]
+    taken = {d.port for d in devices if d.kind == 'usb' and d.port}
+    next_port = USB_PORT
+    for index, device in enumerate(devices):
+        if device.port is None:
+            if device.kind == 'usb':
+                while next_port in taken:
+                    next_port += 1
+                device.port = next_port
+                taken.add(next_port)
+            else:
+                device.port = WIRELESS_PORT
+        if device.sink is None:
+            device.sink = device_sink(sink, index)
+    return devices
+
+
+def parse_devices_or_first(texts, sink=None):
+    """parse_devices(), falling back to the first device alone when the
+    others can't be set up (a bad spec, or no camera of their own).
+    Returns (devices, error): the ValueError that cut the list short, else
+    None. Only an unusable first spec leaves no devices at all."""
+    try:
+        return parse_devices(texts, sink), None
+    except ValueError as e:
+        error = e
+    try:
+        return parse_devices(texts[:1], sink), error
+    except ValueError:
+        return [], error
+
+
+def headless_argv(device, size=None, stats_port=0, extra=()):
+    """headless_receiver arguments that stream ``device``."""
+    argv = ['--mode', device.kind, '--port', str(device.port), '--label', device.address]
+    if device.kind == 'usb':
+        argv += ['--serial', device.address]
+    else:
+        argv += ['--host', device.address]
+    if device.sink:
+        argv += ['--sink', device.sink]
+    if size:
+        argv += ['--size', str(size)]
+    if stats_port:
+        argv += ['--stats-port', str(stats_port)]
+    return argv + list(extra)
+
+
+def _device_main(argv, stop_event):
+    import headless_receiver
+    headless_receiver.main(argv, stop_event=stop_event)
+
+
+class DeviceProcess:
+    """Runs headless_receiver for one device in a child process."""
+
+    def __init__(self, device, argv):
+        ctx = multiprocessing.get_context('spawn')
+        self.device = device
+        self._stop = ctx.Event()
+        self.process = ctx.Process(target=_device_main, args=(argv, self._stop),
+                                   name=f"webcamo-{device.address}", daemon=True)
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1.0)
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+
+def start_devices(devices, size=None, stats_port=0, extra=()):
+    """Starts a DeviceProcess per device; stats ports count up from ``stats_port``."""
+    return [DeviceProcess(d, headless_argv(d, size, stats_port + i if stats_port else 0, extra)).start()
+            for i, d in enumerate(devices)]
+
+
+def stop_devices(processes, timeout=5.0):
+    for p in processes:
+        p.stop()
+    for p in processes:
+        p.join(timeout)
@@ -0,0 +1,106 @@
+"""
+Crop / rotate / mirror / scale, worked out once per stream geometry.
+
+A GeometryPlan is built for a source size and orientation and then applied
+to each plane separately, before colour conversion, so only pixels that
+end up in the output get converted. The crop is a free view; scaling and
+the rotate/mirror combination are at most two OpenCV passes per plane,
+written into buffers the plan keeps between frames. The output is always
+C-contiguous, so the virtual camera never has to copy it again.
+
+Rotations are clockwise degrees and are applied before the horizontal
+mirror, matching np.rot90 followed by cv2.flip(img, 1).
+"""
+
+import cv2
+import numpy as np
+
+
+def _transpose(src, dst):
+    return cv2.transpose(src, dst)
+
+
+def _flip(code):
+    return lambda src, dst: cv2.flip(src, code, dst)
+
+
+def _rotate(code):
+    return lambda src, dst: cv2.rotate(src, code, dst)
+
+
+# (rotate, mirror) -> OpenCV passes producing that orientation.
+ORIENTATION_OPS = {
+    (0, False): (),
+    (90, False): (_rotate(cv2.ROTATE_90_CLOCKWISE),),
+    (180, False): (_rotate(cv2.ROTATE_180),),
+    (270, False): (_rotate(cv2.ROTATE_90_COUNTERCLOCKWISE),),
+    (0, True): (_flip(1),),
+    (90, True): (_transpose,),
+    (180, True): (_flip(0),),
+    (270, True): (_transpose, _flip(-1)),
+}
+
+
+def _even(value):
+    return value & ~1
+
+
+class GeometryPlan:
+    """Centre square crop, orientation and optional resize for one geometry.
+
+    ``size`` is the output side length; None keeps the crop size.
+    """
+
+    def __init__(self, width, height, rotate=0, mirror=False, size=None):
+        if (rotate, mirror) not in ORIENTATION_OPS:
+            raise ValueError(f"Unsupported rotation: {rotate}")
+        self.width = width
+        self.height = height
+        self.rotate = rotate
+        self.mirror = mirror
+
+        side = _even(min(width, height))
+        self.crop = (_even((width - side) // 2), _even((height - side) // 2), side)
+        self.size = _even(size) if size else side
+        self._ops = ORIENTATION_OPS[(rotate, mirror)]
+        self._buffers = {}
+
+    def out_shape(self, chroma=False):
+        return (self.size // 2,) * 2 if chroma else (self.size,) * 2
+
+    def apply(self, plane, chroma=False, dst=None):
+        """Returns ``plane`` cropped, scaled and oriented.
+
+        ``chroma`` marks a half-resolution plane. With ``dst`` the result is
+        written there; otherwise into a buffer owned by the plan (valid until
+        the next call for the same plane shape). When no pass is needed and no
+        dst is given, the crop view itself is returned.
+        """
+        x, y, side = self.crop
+        size = self.size
+        if chroma:
+            x, y, side, size = x // 2, y // 2, side // 2, size // 2
+        src = plane[y:y + side, x:x + side]
+
+        steps = list(self._ops)
+        if size != side:
+            steps.insert(0, lambda s, d: cv2.resize(s, (size, size), d, interpolation=cv2.INTER_AREA))
+        if not steps:
+            if dst is None:
+                return src
+            np.copyto(dst, src)
+            return dst
+
+        shape = (size, size) + plane.shape[2:]
+        for i, step in enumerate(steps):
+            last = i == len(steps) - 1
+            out = dst if last and dst is not None else self._buffer(shape, plane.dtype, i % 2)
+            src = step(src, out)
+        return src
+
+    def _buffer(self, shape, dtype, index):
+        key = (shape, dtype, index)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = self._buffers[key] = np.empty(shape, dtype=dtype)
+        return buf
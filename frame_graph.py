@@ -0,0 +1,405 @@
+"""
+One frame type and one processing graph for every kind of input.
+
+    Frame        a frame from any source: its pixel data in the source's own
+                 format, size, sequence number, receive and capture times,
+                 and the rotation and mirroring that turn it upright.
+                 release() hands a pooled buffer back to the source.
+    FrameSource  produces Frames: usb_pipeline.UsbSource (raw or H.264 from
+                 the phone), wireless_receiver.WebRtcSource (an aiortc
+                 track), pc_reciever.H264StreamReceiver (a bare Annex-B
+                 stream) and replay.Y4mSource (a file from the file: sink)
+    FrameGraph   convert -> sink threads, the same for every source: crop,
+                 orient and scale with a GeometryPlan, convert (on a thread
+                 or in a ConvertPool), then pace into a Sink. Output images
+                 come from a frame_pipeline.BufferPool and are reused once
+                 the sink, pacer and preview are done with them
+
+Frame formats:
+
+    FMT_PACKET   usb_protocol.VideoPacket, Android YUV_420_888 planes with
+                 their strides, converted to BGR by YuvConverter
+    FMT_AV       av.VideoFrame from a decoder, packed into I420
+    FMT_I420     (h * 3 // 2, w) NumPy image
+    FMT_BGR      (h, w, 3) NumPy image
+
+So every mode gets the same stage timings in frame_stats, the same
+pacing and pooling, and can be benchmarked against the others.
+"""
+
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from frame_geometry import GeometryPlan
+from frame_pipeline import BufferPool, FrameTiming, LatestQueue, Pacer, Stage
+from frame_stats import FrameStats
+from vcam_sinks import FMT_BGR, FMT_I420, convert_frame, converted_shape
+from yuv_convert import YuvConverter, av_frame_planes, i420_planes, pack_i420
+
+FMT_PACKET = 'packet'
+FMT_AV = 'av'
+
+log = logging.getLogger("webcamo")
+
+
+class Frame:
+    """One input frame (see the module docstring).
+
+    ``received`` and ``captured`` are time.perf_counter() seconds; ``captured``
+    is None when the transport doesn't carry it. ``rotate`` (0, 90, 180 or
+    270, clockwise) and ``mirror`` are applied by the graph.
+    """
+
+    __slots__ = ('data', 'fmt', 'width', 'height', 'seq', 'received', 'captured', 'rotate', 'mirror',
+                 '_release')
+
+    def __init__(self, data, fmt, width, height, seq, received, captured=None, rotate=0, mirror=False,
+                 release=None):
+        self.data = data
+        self.fmt = fmt
+        self.width = width
+        self.height = height
+        self.seq = seq
+        self.received = received
+        self.captured = captured
+        self.rotate = rotate
+        self.mirror = mirror
+        self._release = release
+
+    def planes(self):
+        """Y, U and V as NumPy views (for FMT_BGR, just the image)."""
+        if self.fmt == FMT_AV:
+            return av_frame_planes(self.data)
+        if self.fmt == FMT_PACKET:
+            packet, meta = self.data, self.data.meta
+            uv_width = meta.width // 2
+            return (packet.y[:, :meta.width],
+                    packet.u[:, ::meta.u_pixel_stride][:, :uv_width],
+                    packet.v[:, ::meta.v_pixel_stride][:, :uv_width])
+        if self.fmt == FMT_I420:
+            return i420_planes(self.data, self.width, self.height)
+        return (self.data,)
+
+    def release(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+class FrameSource:
+    """Base class for the inputs of a FrameGraph.
+
+    run(emit) calls ``emit(frame)`` for every Frame until the stream ends or
+    close() is called; it blocks, or is a coroutine for sources that live on
+    an event loop (see FrameGraph.run_async). The graph owns emitted frames
+    and releases them. It reports back through frame_converted(seconds) and
+    frame_dropped(), for sources that adapt to load, and frame_done() once
+    a frame has left the graph (sent, dropped or lost to an error), for
+    sources that wait for it. stats() adds the source's counters to the
+    graph's.
+    """
+
+    name = 'source'
+
+    def run(self, emit):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def frame_converted(self, elapsed):
+        pass
+
+    def frame_dropped(self):
+        pass
+
+    def frame_done(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class FrameGraph:
+    """Runs a FrameSource into a Sink: a convert and a sink stage joined by
+    LatestQueues (see frame_pipeline), so a slow stage drops frames instead
+    of adding latency.
+
+    ``size`` is the side of the square output (None: the first frame's
+    short side, kept for the whole run so the camera doesn't change size).
+    ``fmt`` is the format sent to the sink; None keeps each frame in its
+    cheapest one (BGR for packets, I420 for everything else).
+    ``on_frame(img, code)`` gets every frame sent, from the sink thread,
+    with the cvtColor code that makes it BGR (None if it is).
+    ``on_timing`` gets a FrameTiming per frame sent; stage timings and
+    counters go to ``metrics``. With ``pool`` (a ConvertPool) packets are
+    converted in its processes, collected in order by a third thread.
+    ``pace`` sends to the sink at ``fps`` through a Pacer, repeating or
+    dropping frames. ``name`` prefixes the thread names; errors go to
+    ``logger``. The sink is closed when the source ends.
+    """
+
+    def __init__(self, source, sink, size=None, fmt=None, on_frame=None, on_timing=None, metrics=None,
+                 queue_size=1, pool=None, pace=True, fps=30, name='frames', logger=log):
+        self.source = source
+        self.sink = sink
+        self.size = size
+        self.fmt = fmt
+        self.on_frame = on_frame
+        self.on_timing = on_timing
+        self.metrics = metrics if metrics is not None else FrameStats()
+        self.pool = pool
+        self.fps = fps
+        self.log = logger
+        self.converter = YuvConverter()
+        self.buffers = BufferPool(metrics=self.metrics)
+        self.geometry = None
+        self._geometry_key = None
+        self._layout = None
+        self.received = 0
+
+        self.convert_queue = LatestQueue(queue_size, on_drop=self._drop_input)
+        self.sink_queue = LatestQueue(queue_size, on_drop=self._drop_converted)
+        self.metrics.gauge('queue_depth_convert', lambda: len(self.convert_queue))
+        self.metrics.gauge('queue_depth_sink', lambda: len(self.sink_queue))
+        def on_error(e):
+            logger.error(f"Error processing frame: {e}")
+            self.source.frame_done()
+
+        self.collect_stage = None
+        if pool:
+            # Every queued job holds a slot, so this queue never drops.
+            self.collect_queue = LatestQueue(pool.slots, on_drop=self._release_job)
+            self.convert_stage = Stage(f"{name}-convert", self._dispatch, self.convert_queue,
+                                       self.collect_queue, on_error=on_error)
+            self.collect_stage = Stage(f"{name}-collect", self._collect, self.collect_queue,
+                                       self.sink_queue, on_error=on_error)
+        else:
+            self.convert_stage = Stage(f"{name}-convert", self._convert, self.convert_queue,
+                                       self.sink_queue, on_error=on_error)
+        on_sink_error = lambda e: logger.error(f"Virtual camera error: {e}")  # noqa: E731
+        self.pacer = None
+        if pace:
+            self.pacer = Pacer(f"{name}-pacer", self._send_paced, fps, metrics=self.metrics,
+                               on_error=on_sink_error)
+        self.sink_stage = Stage(f"{name}-sink", self._pace if pace else self._send, self.sink_queue,
+                                on_error=on_sink_error)
+
+    def run(self):
+        """Runs the source on this thread until it ends, then drains the graph."""
+        self.start()
+        try:
+            self.source.run(self.emit)
+        finally:
+            self.close()
+
+    async def run_async(self):
+        """run() for a source whose run() is a coroutine; draining happens
+        off the event loop."""
+        import asyncio
+
+        self.start()
+        try:
+            await self.source.run(self.emit)
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def start(self):
+        self.convert_stage.start()
+        if self.collect_stage:
+            self.collect_stage.start()
+        self.sink_stage.start()
+        if self.pacer:
+            self.pacer.start()
+
+    def emit(self, frame):
+        """Takes a Frame from the source; never blocks."""
+        self.received += 1
+        self.metrics.count('frames_received')
+        self.convert_queue.put(frame)
+
+    def close(self):
+        """Lets the queued frames through, stops the threads and closes the sink."""
+        self.convert_queue.close()
+        self.convert_stage.join()
+        if self.collect_stage:
+            self.collect_stage.join()
+        self.sink_stage.join()
+        if self.pacer:
+            self.pacer.close()
+            self.pacer.join()
+        try:
+            self.sink.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'converted': (self.collect_stage or self.convert_stage).processed,
+            'sent': (self.pacer or self.sink_stage).processed,
+            'repeated': self.pacer.repeated if self.pacer else 0,
+            'dropped_convert': self.convert_queue.dropped,
+            'dropped_sink': self.sink_queue.dropped,
+            'dropped_pacer': self.pacer.dropped if self.pacer else 0,
+            'cpu_convert': self.convert_stage.cpu_time,
+            'cpu_sink': self.sink_stage.cpu_time + (self.pacer.cpu_time if self.pacer else 0.0),
+            'buffers_reused': self.buffers.hits,
+            'buffers_allocated': self.buffers.misses,
+            **self.source.stats(),
+        }
+
+    def _geometry(self, frame):
+        if self.size is None:
+            self.size = min(frame.width, frame.height)
+        key = (frame.width, frame.height, frame.rotate, frame.mirror)
+        if key != self._geometry_key:
+            self._geometry_key = key
+            self.geometry = GeometryPlan(frame.width, frame.height, frame.rotate, frame.mirror, self.size)
+        return self.geometry
+
+    def _convert(self, frame):
+        timing = FrameTiming(frame.seq, frame.received, frame.captured)
+        geometry = self._geometry(frame)
+        height, width = geometry.out_shape()
+        start = time.perf_counter()
+        try:
+            # Pooled output: take() skips images the sink or preview still hold
+            if frame.fmt == FMT_PACKET:
+                img = self.buffers.take((height, width, 3))
+                img, fmt = self.converter.to_bgr(frame.data, geometry, dst=img), FMT_BGR
+                geometry_time = self.converter.geometry_time
+                self._log_layout(frame.width, frame.height, self.converter.layout)
+            else:
+                planes = frame.planes()
+                planes_at = time.perf_counter()
+                if frame.fmt == FMT_BGR:
+                    img = self.buffers.take((height, width, 3))
+                    img, fmt = geometry.apply(planes[0], dst=img), FMT_BGR
+                else:
+                    img = self.buffers.take((height * 3 // 2, width))
+                    img, fmt = pack_i420(*planes, geometry, out=img), FMT_I420
+                geometry_time = time.perf_counter() - planes_at
+        finally:
+            frame.release()
+        if self.fmt and fmt != self.fmt:
+            img, fmt = self._convert_format(img, fmt), self.fmt
+        timing.converted = time.perf_counter()
+        elapsed = timing.converted - start
+        self.metrics.observe('geometry', geometry_time)
+        self.metrics.observe('convert', elapsed - geometry_time)
+        self.source.frame_converted(elapsed)
+        return img, fmt, timing, None
+
+    def _dispatch(self, frame):
+        """Pool mode: hands a packet to a worker (other frames are converted
+        here). The collect stage takes the results in this order."""
+        if frame.fmt != FMT_PACKET:
+            return self._convert(frame)
+        geometry = self._geometry(frame)
+        try:
+            job = self.pool.submit(frame.data, geometry)
+        finally:
+            frame.release()
+        return None, FMT_BGR, FrameTiming(frame.seq, frame.received, frame.captured), job
+
+    def _collect(self, item):
+        img, fmt, timing, job = item
+        if img is not None:
+            return item  # converted in _dispatch
+        try:
+            img = self.pool.result(job)
+        except Exception:
+            self.pool.release(job)
+            raise
+        timing.converted = time.perf_counter()
+        self.metrics.observe('geometry', job.geometry_time)
+        self.metrics.observe('convert', job.convert_time - job.geometry_time)
+        self.source.frame_converted(job.convert_time)
+        self._log_layout(*self._geometry_key[:2], job.layout)
+        if self.fmt and fmt != self.fmt:
+            img = self._convert_format(img, fmt)  # a new image; the slot can go
+            self.pool.release(job)
+            return img, self.fmt, timing, None
+        return img, fmt, timing, job
+
+    def _convert_format(self, img, fmt):
+        return convert_frame(img, fmt, self.fmt, out=self.buffers.take(converted_shape(img, fmt, self.fmt)))
+
+    def _copy(self, img):
+        copy = self.buffers.take(img.shape)
+        np.copyto(copy, img)
+        return copy
+
+    def _log_layout(self, width, height, layout):
+        if layout and layout != self._layout:
+            self._layout = layout
+            self.log.info(f"{self.source.name.upper()}: {width}x{height} chroma layout {layout}")
+
+    def _send(self, item):
+        img, fmt, timing, job = item
+        try:
+            self._send_frame(img, fmt, timing, job is not None)
+        finally:
+            if job is not None:
+                self.pool.release(job)
+            self.source.frame_done()
+
+    def _pace(self, item):
+        img, fmt, timing, job = item
+        if job is not None:
+            # The pacer may hold a frame for many ticks; free the slot now
+            img = self._copy(img)
+            self.pool.release(job)
+        self.pacer.push((img, fmt, timing), timing.captured if timing.captured is not None else timing.received)
+
+    def _send_paced(self, item, repeat):
+        img, fmt, timing = item
+        if repeat:
+            self.sink.send(img)  # same frame again, to keep the output rate
+            return
+        try:
+            self._send_frame(img, fmt, timing, False)
+        finally:
+            self.source.frame_done()
+
+    def _send_frame(self, img, fmt, timing, pooled):
+        width = img.shape[1]
+        height = img.shape[0] if fmt == FMT_BGR else img.shape[0] * 2 // 3
+        if self.sink.ensure_open(width, height, fps=self.fps, fmt=fmt):
+            self.log.info(f"Virtual camera started at {width}x{height} ({self.sink.describe()})")
+        start = time.perf_counter()
+        self.sink.send(img)
+        timing.sent = time.perf_counter()
+        self.metrics.observe('sink', timing.sent - start)
+        self.metrics.observe('end_to_end', timing.sent - timing.received)
+        if timing.captured is not None:
+            self.metrics.observe('glass_to_sink', timing.sent - timing.captured)
+        self.metrics.count('frames_sent')
+
+        if self.on_frame:
+            # A pooled frame's slot is reused once this returns
+            self.on_frame(self._copy(img) if pooled else img, None if fmt == FMT_BGR else cv2.COLOR_YUV2BGR_I420)
+        if self.on_timing:
+            self.on_timing(timing)
+
+    def _drop_input(self, frame):
+        frame.release()
+        self.metrics.count('frames_dropped_convert')
+        self.source.frame_dropped()
+        self.source.frame_done()
+
+    def _drop_converted(self, item):
+        self._release_job(item)
+        self.metrics.count('frames_dropped_sink')
+        self.source.frame_dropped()
+        self.source.frame_done()
+
+    def _release_job(self, item):
+        job = item[3]
+        if job is not None:
+            self.pool.release(job)
+
@@ -0,0 +1,300 @@
+"""
+Building blocks for running the receivers as a chain of threads.
+
+Each stage runs on its own thread and hands its output to the next stage
+through a LatestQueue. The queues are bounded and drop the oldest frame when
+full, so a slow stage loses frames instead of building up latency (or
+pushing TCP backpressure back to the phone). NumPy and OpenCV release the
+GIL for the heavy work, so the stages really do run in parallel.
+
+At the end of the chain a Pacer turns the uneven arrivals into a constant
+frame rate for the virtual camera, and a BufferPool hands the stages their
+output images so a steady stream stops allocating after the first frames.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+
+
+class FrameTiming:
+    """time.perf_counter() stamps of one frame as it moves through the stages.
+    ``captured`` is the phone's capture time, when the transport carries it."""
+
+    __slots__ = ('seq', 'captured', 'received', 'converted', 'sent')
+
+    def __init__(self, seq, received, captured=None):
+        self.seq = seq
+        self.captured = captured
+        self.received = received
+        self.converted = None
+        self.sent = None
+
+
+class LatestQueue:
+    """Bounded hand-off that keeps the newest ``maxsize`` items.
+
+    ``on_drop`` is called with every item that is discarded, either because
+    a newer one pushed it out or because the queue was closed with it still
+    inside; use it to return pooled buffers.
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if self._closed:
+                dropped = item
+            else:
+                if len(self._items) >= self.maxsize:
+                    dropped = self._items.popleft()
+                    self.dropped += 1
+                self._items.append(item)
+                self._cond.notify()
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Returns the oldest item, or None once the queue is closed and
+        empty (or the timeout expired)."""
+        with self._cond:
+            while not self._items and not self._closed:
+                if not self._cond.wait(timeout):
+                    break
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            leftover = list(self._items)
+            self._items.clear()
+            self._cond.notify_all()
+        if self.on_drop:
+            for item in leftover:
+                self.on_drop(item)
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class Stage(threading.Thread):
+    """Calls ``work(item)`` for everything taken from ``inbox`` and passes
+    results that are not None on to ``outbox``.
+
+    The stage ends when its inbox is closed, and then closes its outbox so
+    shutdown ripples down the chain. Exceptions from ``work`` are counted and
+    reported through ``on_error``; they never stop the stage. ``cpu_time`` is
+    the thread's CPU time in seconds, filled in when the stage ends.
+    """
+
+    def __init__(self, name, work, inbox, outbox=None, on_error=None):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.inbox = inbox
+        self.outbox = outbox
+        self.on_error = on_error
+        self.processed = 0
+        self.errors = 0
+        self.cpu_time = 0.0
+
+    def run(self):
+        try:
+            while True:
+                item = self.inbox.get()
+                if item is None:
+                    if self.inbox.closed:
+                        break
+                    continue
+                try:
+                    result = self.work(item)
+                except Exception as e:
+                    self.errors += 1
+                    if self.on_error:
+                        self.on_error(e)
+                    continue
+                self.processed += 1
+                if self.outbox is not None and result is not None:
+                    self.outbox.put(result)
+        finally:
+            self.cpu_time = time.thread_time()
+            if self.outbox is not None:
+                self.outbox.close()
+
+
+class Pacer(threading.Thread):
+    """Calls ``send(item, repeat)`` exactly ``fps`` times a second, whatever
+    rate frames arrive at.
+
+    push(item, timestamp) hands over a frame with its capture time (or
+    arrival time) in perf_counter seconds. A frame becomes due ``latency``
+    after its timestamp: the smallest arrival delay seen over the last
+    ``window`` seconds plus ``buffer`` (default half an output interval), so
+    frames keep the spacing they were captured with as long as transport
+    jitter stays within the buffer. On every tick the newest due frame is
+    sent; with none due the last one is sent again (repeat=True), and when
+    several came due at once all but the newest are dropped. The ticks
+    slowly shift towards just after frames come due, so a steady input
+    doesn't wait most of an interval for the next tick.
+
+    ``repeated``, ``dropped`` and ``late_ticks`` (ticks skipped because
+    send() overran) are counted here and in ``metrics`` (frames_repeated,
+    frames_dropped_pacer, late_ticks), which also gets
+    ``input_jitter`` (arrival spacing vs. timestamp spacing) and
+    ``tick_jitter`` (send time vs. tick) as stage timings. Exceptions from
+    ``send`` go to ``on_error``.
+    """
+
+    def __init__(self, name, send, fps, metrics=None, buffer=None, window=2.0, on_error=None):
+        super().__init__(name=name, daemon=True)
+        self.send = send
+        self.interval = 1.0 / fps
+        self.metrics = metrics
+        self.buffer = self.interval / 2 if buffer is None else buffer
+        self.window = window
+        self.on_error = on_error
+        self.latency = self.buffer
+        self.repeated = 0
+        self.dropped = 0
+        self.late_ticks = 0
+        self.processed = 0
+        self.cpu_time = 0.0
+        self._pending = deque()  # (timestamp, item), oldest first
+        self._delays = deque()   # (arrival, delay) for the latency estimate
+        self._last = None        # (timestamp, arrival) of the previous push
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+
+    def push(self, item, timestamp=None):
+        now = time.perf_counter()
+        if timestamp is None:
+            timestamp = now
+        with self._lock:
+            if self._last is not None and self.metrics is not None:
+                last_ts, last_arrival = self._last
+                self.metrics.observe('input_jitter', abs((now - last_arrival) - (timestamp - last_ts)))
+            self._last = (timestamp, now)
+
+            # Monotonic min over the window: drop entries a newer, smaller delay beats
+            delay = now - timestamp
+            while self._delays and self._delays[-1][1] >= delay:
+                self._delays.pop()
+            self._delays.append((now, delay))
+            while self._delays[0][0] < now - self.window:
+                self._delays.popleft()
+            self.latency = self._delays[0][1] + self.buffer
+
+            self._pending.append((timestamp, item))
+            if len(self._pending) > 1 + self.window / self.interval:
+                self._pending.popleft()  # not being drained; don't grow
+                self._count('dropped', 'frames_dropped_pacer')
+
+    def close(self):
+        self._closing.set()
+
+    def run(self):
+        current = None
+        next_tick = time.perf_counter() + self.interval
+        # How long fresh frames waited for their tick, over about half a second
+        slack = deque(maxlen=max(4, round(0.5 / self.interval)))
+        try:
+            while not self._closing.wait(max(0.0, next_tick - time.perf_counter())):
+                now = time.perf_counter()
+                due = None
+                with self._lock:
+                    while self._pending and self._pending[0][0] + self.latency <= now:
+                        if due is not None:
+                            self._count('dropped', 'frames_dropped_pacer')
+                        timestamp, due = self._pending.popleft()
+                    latency = self.latency
+                if due is not None:
+                    current = due
+                    slack.append(now - (timestamp + latency))
+                    if len(slack) == slack.maxlen:
+                        next_tick -= min(slack) / 2  # move the phase halfway
+                        slack.clear()
+                elif current is not None:
+                    self._count('repeated', 'frames_repeated')
+
+                if current is not None:
+                    if self.metrics is not None:
+                        self.metrics.observe('tick_jitter', now - next_tick)
+                    try:
+                        self.send(current, due is None)
+                        self.processed += due is not None
+                    except Exception as e:
+                        if self.on_error:
+                            self.on_error(e)
+
+                next_tick += self.interval
+                behind = time.perf_counter() - next_tick
+                if behind > 0:
+                    missed = int(behind / self.interval) + 1
+                    next_tick += missed * self.interval
+                    self._count('late_ticks', 'late_ticks', missed)
+        finally:
+            self.cpu_time = time.thread_time()
+
+    def _count(self, attr, metric, n=1):
+        setattr(self, attr, getattr(self, attr) + n)
+        if self.metrics is not None:
+            self.metrics.count(metric, n)
+
+
+class BufferPool:
+    """Reusable NumPy output buffers, keyed by shape and dtype.
+
+    take() returns a buffer nobody else refers to any more: once the sink,
+    the Pacer, the preview and any views of it have dropped the image it is
+    free again, without explicit release calls. Up to ``per_shape`` buffers
+    are kept per key; beyond that (everything still in use) take() allocates
+    one that isn't kept. ``hits`` and ``misses`` count reuses and
+    allocations, also as buffers_reused / buffers_allocated in ``metrics``.
+    """
+
+    def __init__(self, per_shape=6, metrics=None):
+        self.per_shape = per_shape
+        self.metrics = metrics
+        self.hits = 0
+        self.misses = 0
+        self._buffers = {}  # (shape, dtype) -> [ndarray, ...]
+        self._lock = threading.Lock()
+
+    def take(self, shape, dtype='uint8'):
+        key = (tuple(shape), dtype)
+        with self._lock:
+            buffers = self._buffers.setdefault(key, [])
+            for buf in buffers:
+                # References: the list, ``buf`` and getrefcount's argument
+                if sys.getrefcount(buf) <= 3:
+                    self._count('hits', 'buffers_reused')
+                    return buf
+            import numpy as np  # the GUI imports this module before NumPy is needed
+
+            self._count('misses', 'buffers_allocated')
+            buf = np.empty(shape, dtype=dtype)
+            if len(buffers) < self.per_shape:
+                buffers.append(buf)
+            return buf
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+
+    def _count(self, attr, metric):
+        setattr(self, attr, getattr(self, attr) + 1)
+        if self.metrics is not None:
+            self.metrics.count(metric)
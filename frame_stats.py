@@ -0,0 +1,215 @@
+"""
+Per-stage timings and counters for the receivers.
+
+Both receivers record how long every frame spends in each stage into rolling
+histograms, and count frames, drops and bytes, in a shared FrameStats:
+
+    recv        waiting for the next frame (phone / decoder hand-off)
+    reassembly  header to complete packet in its buffer (USB only)
+    convert     YUV -> BGR on the USB path, decoder plane extraction on WebRTC
+    geometry    crop / rotate / scale / mirror
+    sink        Sink.send
+    preview     colour conversion and downscale on the preview thread
+    end_to_end  complete frame received to sink send returning
+    input_jitter, tick_jitter
+                how unevenly frames arrive, and how late the pacer sends
+                (see frame_pipeline.Pacer)
+
+The numbers can be read three ways:
+
+    StatsServer     http://127.0.0.1:<port>/metrics (Prometheus text) and /stats (JSON)
+    StatsReporter   one JSON line every few seconds through a log callback
+    overlay_lines() a few lines of text for the preview (see preview.draw_overlay)
+
+The desktop client turns these on with WEBCAMO_STATS_PORT,
+WEBCAMO_STATS_INTERVAL (seconds) and WEBCAMO_STATS_OVERLAY=1; the headless
+receiver has --stats-port and --stats-interval.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATS_PORT = int(os.environ.get('WEBCAMO_STATS_PORT') or 0)
+STATS_INTERVAL = float(os.environ.get('WEBCAMO_STATS_INTERVAL') or 0)
+STATS_OVERLAY = os.environ.get('WEBCAMO_STATS_OVERLAY', '') not in ('', '0')
+
+QUANTILES = (0.5, 0.9, 0.99)
+RATE_WINDOW = 2.0  # seconds
+
+
+class Histogram:
+    """The last ``window`` observations, plus running count and sum."""
+
+    def __init__(self, window=512):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, qs=QUANTILES):
+        ordered = sorted(self.values)
+        if not ordered:
+            return [0.0] * len(qs)
+        return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in qs]
+
+
+class Counter:
+    """Running total plus a rate over the last RATE_WINDOW seconds."""
+
+    def __init__(self):
+        self.total = 0
+        self._recent = deque()
+
+    def add(self, n, now):
+        self.total += n
+        self._recent.append((now, n))
+
+    def rate(self, now):
+        recent = self._recent
+        while recent and recent[0][0] < now - RATE_WINDOW:
+            recent.popleft()
+        return sum(n for _, n in recent) / RATE_WINDOW
+
+
+class FrameStats:
+    """Thread-safe registry of stage histograms, counters and gauges.
+
+    Gauges are callables read when a snapshot is taken, e.g. queue depths.
+    """
+
+    def __init__(self, window=512):
+        self.window = window
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = Histogram(self.window)
+            hist.observe(seconds)
+
+    def count(self, name, n=1):
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self._counters[name] = Counter()
+            counter.add(n, now)
+
+    def gauge(self, name, read):
+        with self._lock:
+            self._gauges[name] = read
+
+    def snapshot(self):
+        """Plain-dict view of everything, times in milliseconds."""
+        now = time.monotonic()
+        with self._lock:
+            stages = {}
+            for name, hist in self._stages.items():
+                p50, p90, p99 = (round(v * 1000, 3) for v in hist.quantiles())
+                recent = hist.values
+                mean = sum(recent) / len(recent) * 1000 if recent else 0.0
+                stages[name] = {'count': hist.count, 'mean_ms': round(mean, 3),
+                                'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99}
+            counters = {name: c.total for name, c in self._counters.items()}
+            rates = {name: round(c.rate(now), 2) for name, c in self._counters.items()}
+            gauges = dict(self._gauges)
+        return {'uptime_s': round(now - self.started, 1), 'stages': stages, 'counters': counters,
+                'rates_per_s': rates, 'gauges': {name: read() for name, read in gauges.items()}}
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            stages = [(name, hist.quantiles(), hist.total, hist.count) for name, hist in self._stages.items()]
+            counters = [(name, c.total) for name, c in self._counters.items()]
+            gauges = list(self._gauges.items())
+
+        lines = ["# HELP webcamo_stage_seconds Time spent per frame in each stage.",
+                 "# TYPE webcamo_stage_seconds summary"]
+        for name, values, total, count in stages:
+            for q, v in zip(QUANTILES, values):
+                lines.append(f'webcamo_stage_seconds{{stage="{name}",quantile="{q}"}} {v:.6f}')
+            lines.append(f'webcamo_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'webcamo_stage_seconds_count{{stage="{name}"}} {count}')
+        for name, total in counters:
+            lines.append(f"# TYPE webcamo_{name}_total counter")
+            lines.append(f"webcamo_{name}_total {total}")
+        for name, read in gauges:
+            lines.append(f"# TYPE webcamo_{name} gauge")
+            lines.append(f"webcamo_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+    def overlay_lines(self):
+        """Short per-stage summary for drawing on the preview."""
+        snap = self.snapshot()
+        rates = snap['rates_per_s']
+        lines = [f"{rates.get('frames_sent', 0):.1f} fps  "
+                 f"{rates.get('bytes_received', 0) * 8 / 1e6:.1f} Mbit/s"]
+        for name, st in snap['stages'].items():
+            lines.append(f"{name:10} {st['p50_ms']:6.1f} / {st['p99_ms']:6.1f} ms")
+        return lines
+
+
+class StatsServer:
+    """Serves /metrics and /stats for a FrameStats from a daemon thread."""
+
+    def __init__(self, stats, port=STATS_PORT, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, kind = stats.prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/stats':
+                    body, kind = json.dumps(stats.snapshot()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stats-http", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StatsReporter:
+    """Calls ``log`` with a one-line JSON snapshot every ``interval`` seconds."""
+
+    def __init__(self, stats, log=print, interval=STATS_INTERVAL or 10.0):
+        self.stats = stats
+        self.log = log
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stats-report", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.log("stats " + json.dumps(self.stats.snapshot(), separators=(',', ':')))
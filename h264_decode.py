@@ -0,0 +1,59 @@
+"""
+Low-latency H.264 decoding for the USB transport.
+
+The phone sends its encoder output as Annex-B byte stream in
+PACKET_TYPE_H264 packets (see usb_protocol). Instead of wrapping the socket
+in a file and letting av.open() probe a container, a bare CodecContext is
+fed through its parser:
+
+  * no probing, so the first frame comes out as soon as the first IDR is in;
+  * LOW_DELAY output, so frames are not held back for reordering;
+  * slice threading by default; frame threading decodes faster when the
+    encoder doesn't emit slices, but adds a frame of delay per thread;
+  * packets flagged as ending an access unit flush the parser, which
+    otherwise only emits a frame once the start of the next one arrives.
+"""
+
+import av
+from av.codec.context import Flags
+
+
+class H264Decoder:
+    """Annex-B bytes in, av.VideoFrames out. Decode errors (e.g. joining a
+    stream between keyframes) are counted in ``errors`` and skipped.
+    ``thread_type`` is 'SLICE', 'FRAME' or 'AUTO'; ``threads`` 0 lets FFmpeg
+    pick the count."""
+
+    def __init__(self, threads=0, thread_type='SLICE'):
+        self.ctx = av.CodecContext.create('h264', 'r')
+        self.ctx.flags |= Flags.low_delay
+        self.ctx.thread_type = thread_type
+        self.ctx.thread_count = threads
+        self.frames = 0
+        self.errors = 0
+
+    def decode(self, data, end_of_frame=True):
+        """Returns the frames completed by ``data``."""
+        packets = self.ctx.parse(data)
+        if end_of_frame:
+            packets += self.ctx.parse(None)
+        frames = []
+        for packet in packets:
+            try:
+                frames.extend(self.ctx.decode(packet))
+            except av.FFmpegError:
+                self.errors += 1
+        self.frames += len(frames)
+        return frames
+
+    def flush(self):
+        """Frames still inside the parser and decoder at the end of the stream."""
+        frames = []
+        try:
+            for packet in self.ctx.parse(None):
+                frames.extend(self.ctx.decode(packet))
+            frames.extend(self.ctx.decode(None))
+        except av.FFmpegError:
+            self.errors += 1
+        self.frames += len(frames)
+        return frames
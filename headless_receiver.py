@@ -0,0 +1,301 @@
+"""
+Headless receiver: streams a phone straight into a sink, without Qt.
+
+    python headless_receiver.py --mode usb --sink v4l2loopback
+    python headless_receiver.py --mode wireless --host 192.168.1.20 --size 1080
+    python headless_receiver.py --mode usb --sink null     # throughput only
+    python headless_receiver.py --stats-port 9300 --stats-interval 10
+    python headless_receiver.py --device R58M1234XYZ --device 192.168.1.21 --sink shm
+    python headless_receiver.py --mode usb --record phone.wcap --sink null
+    python headless_receiver.py --mode file --input phone.wcap --sink null
+
+Runs the same UsbPipeline / WirelessReceiver as the desktop client and
+stops cleanly on SIGINT or SIGTERM. A phone that disconnects is reconnected
+automatically while the sink stays open (--no-reconnect to exit instead). With --device (repeatable) every phone
+gets its own process, port and sink; see devices.py for the spec format.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+import socket
+import sys
+import threading
+import time
+
+import app_log
+from app_log import LOG_FILE, LOG_LEVEL
+
+log = logging.getLogger("webcamo")
+
+
+def _start_stats(args):
+    """FrameStats for the run, plus the HTTP endpoint / periodic log line if asked for."""
+    from frame_stats import FrameStats, StatsReporter, StatsServer
+
+    metrics = FrameStats()
+    closers = []
+    if args.stats_port:
+        server = StatsServer(metrics, args.stats_port)
+        log.info(f"Stats on http://127.0.0.1:{server.port}/metrics")
+        closers.append(server.close)
+    if args.stats_interval:
+        closers.append(StatsReporter(metrics, log.info, args.stats_interval).close)
+    return metrics, closers
+
+
+def _start_recording(args, closers):
+    """A capture.CaptureWriter for --record (closed with the other closers), or None."""
+    if not args.record:
+        return None
+    from capture import CaptureWriter
+
+    writer = CaptureWriter(args.record)
+    log.info(f"Recording to {args.record}")
+    closers.append(writer.close)
+    return writer
+
+
+def _install_stop_handlers(stop, stop_event=None):
+    for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stop())
+    if stop_event is not None:
+        # Set by the parent when running as one of several devices. Polled:
+        # a process that exits inside Event.wait() blocks the parent's set().
+        def watch():
+            while not stop_event.is_set():
+                time.sleep(0.2)
+            stop()
+
+        threading.Thread(target=watch, name="stop-event", daemon=True).start()
+
+
+# Each mode imports only its own stack (see import_budget.py).
+def run_usb(args, stop_event=None):
+    from reconnect import UsbReconnector
+    from usb_pipeline import UsbPipeline, adb_forward, connect_device
+    from vcam_sinks import KeepAliveSink, create_sink
+
+    options = dict(size=args.size, h264=not args.no_h264, fps=args.fps,
+                   adaptive=not args.no_adaptive, pace=not args.no_pace)
+    if args.no_reconnect:
+        if not args.no_adb:
+            adb_forward(args.port, serial=args.serial)
+        sock = connect_device(args.host, args.port)
+        if sock is None:
+            return 1
+        metrics, closers = _start_stats(args)
+        pipeline = UsbPipeline(sock, sink=create_sink(args.sink), metrics=metrics,
+                               convert_workers=args.convert_workers,
+                               record=_start_recording(args, closers), **options)
+        target = pipeline.run
+
+        def stop():
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        closers.append(sock.close)
+    else:
+        metrics, closers = _start_stats(args)
+        sink = KeepAliveSink(create_sink(args.sink))
+        reconnector = UsbReconnector(args.host, args.port, serial=args.serial, adb=not args.no_adb,
+                                     sink=sink, convert_workers=args.convert_workers,
+                                     metrics=metrics, record=_start_recording(args, closers), **options)
+        target, stop = reconnector.run, reconnector.stop
+        closers.append(sink.shutdown)
+
+    _install_stop_handlers(stop, stop_event)
+
+    # The pipeline blocks in recv; keep the main thread free for signals.
+    thread = threading.Thread(target=target, name="usb-receive")
+    thread.start()
+    while thread.is_alive():
+        thread.join(0.2)
+    for close in closers:
+        close()
+    return 0
+
+
+async def _run_wireless(args, stop_event=None):
+    from wireless_receiver import WirelessReceiver, signalling_url
+
+    metrics, closers = _start_stats(args)
+    receiver = WirelessReceiver(mirror=lambda: args.mirror,
+                                size=args.size or 720, sink_spec=args.sink, metrics=metrics,
+                                pace=not args.no_pace, record=_start_recording(args, closers))
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    _install_stop_handlers(lambda: loop.call_soon_threadsafe(stopped.set), stop_event)
+
+    url = signalling_url(args.host, args.port)
+    try:
+        if args.no_reconnect:
+            if not await receiver.connect(url):
+                return 1
+            await stopped.wait()
+            return 0
+        session = asyncio.ensure_future(receiver.run(url))
+        await stopped.wait()
+        session.cancel()
+        return 0
+    finally:
+        await receiver.close()
+        for close in closers:
+            close()
+
+
+def run_wireless(args, stop_event=None):
+    return asyncio.run(_run_wireless(args, stop_event))
+
+
+def run_file(args, stop_event=None):
+    from frame_graph import FrameGraph
+    from replay import open_source
+    from vcam_sinks import create_sink
+
+    try:
+        source = open_source(args.input, realtime=args.realtime, start=args.start)
+    except (OSError, ValueError) as e:
+        log.error(f"Can't replay {args.input}: {e}")
+        return 1
+    log.info(f"Replaying {source.describe()}")
+    metrics, closers = _start_stats(args)
+    # A fixed-rate pacer would drop nearly every frame of an as-fast-as-possible replay
+    graph = FrameGraph(source, create_sink(args.sink), size=args.size, metrics=metrics,
+                       pace=args.realtime and not args.no_pace, fps=args.fps or source.fps, name='file')
+    _install_stop_handlers(source.close, stop_event)
+
+    thread = threading.Thread(target=graph.run, name="file-read")
+    thread.start()
+    while thread.is_alive():
+        thread.join(0.2)
+    for close in closers:
+        close()
+    st = graph.stats()
+    log.info(f"Replayed {st['frames_read']} frames, {st['sent']} sent, {st['repeated']} repeated")
+    return 0
+
+
+def run_devices(args):
+    from devices import parse_devices, start_devices, stop_devices
+
+    extra = []
+    if args.no_adb:
+        extra.append('--no-adb')
+    if args.no_h264:
+        extra.append('--no-h264')
+    if not args.mirror:
+        extra.append('--no-mirror')
+    if args.stats_interval:
+        extra += ['--stats-interval', str(args.stats_interval)]
+    if args.convert_workers:
+        extra += ['--convert-workers', str(args.convert_workers)]
+    if args.fps:
+        extra += ['--fps', str(args.fps)]
+    if args.no_adaptive:
+        extra.append('--no-adaptive')
+    if args.no_pace:
+        extra.append('--no-pace')
+    if args.no_reconnect:
+        extra.append('--no-reconnect')
+    if args.log_file:
+        extra += ['--log-file', args.log_file]  # shared; lines carry the device label
+    extra += ['--log-level', args.log_level]
+
+    try:
+        devices = parse_devices(args.device, args.sink)
+    except ValueError as e:
+        log.error(str(e))
+        return 1
+    for device in devices:
+        log.info(f"{device.name}: port {device.port}, sink {device.sink or 'default'}")
+    processes = start_devices(devices, args.size, args.stats_port, extra)
+    stopping = threading.Event()
+    _install_stop_handlers(stopping.set)
+    while not stopping.is_set() and any(p.is_alive() for p in processes):
+        time.sleep(0.2)
+    stop_devices(processes)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Webcamo receiver without the GUI")
+    parser.add_argument('--mode', choices=('usb', 'wireless', 'file'), default='usb')
+    parser.add_argument('--device', action='append',
+                        help="adb serial or phone IP; repeat for several phones (see devices.py)")
+    parser.add_argument('--serial', help="adb serial of the phone to forward to (usb)")
+    parser.add_argument('--label', help="prefix for log lines")
+    parser.add_argument('--input', help="capture (from --record) or Y4M file (from --sink file:x.y4m) to "
+                                        "replay in file mode")
+    parser.add_argument('--realtime', action=argparse.BooleanOptionalAction, default=True,
+                        help="replay with the recorded timing (file, default: on; "
+                             "--no-realtime also implies --no-pace)")
+    parser.add_argument('--start', type=float, default=0.0, help="seconds into a capture to start at (file)")
+    parser.add_argument('--record', metavar='PATH',
+                        help="also write what the phone sends to this capture file (usb, wireless)")
+    parser.add_argument('--host', help="phone IP (wireless) or forwarded host (usb, default 127.0.0.1)")
+    parser.add_argument('--port', type=int, help="default 23233 for usb, 8080 for wireless")
+    parser.add_argument('--size', type=int, help="output side length in pixels (default: usb native, wireless 720)")
+    parser.add_argument('--sink', help="sink spec, see vcam_sinks (default: $WEBCAMO_SINK or auto)")
+    parser.add_argument('--mirror', action=argparse.BooleanOptionalAction, default=True,
+                        help="mirror wireless video (default: on)")
+    parser.add_argument('--no-adb', action='store_true', help="don't run 'adb forward' in usb mode")
+    parser.add_argument('--no-h264', action='store_true', help="ask the phone for raw frames, not H.264 (usb)")
+    parser.add_argument('--convert-workers', type=int, default=0,
+                        help="convert raw frames in this many processes (usb, default: in a thread)")
+    parser.add_argument('--fps', type=int, help="frame rate to ask the phone for (usb raw, default 30; file: output rate)")
+    parser.add_argument('--no-adaptive', action='store_true',
+                        help="keep the requested size and rate instead of stepping them with load (usb raw)")
+    parser.add_argument('--no-pace', action='store_true',
+                        help="send frames as they arrive instead of at a constant --fps")
+    parser.add_argument('--no-reconnect', action='store_true',
+                        help="exit when the phone disconnects instead of waiting for it to return")
+    parser.add_argument('--stats-port', type=int, default=0,
+                        help="serve /metrics (Prometheus) and /stats (JSON) on this local port")
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help="log a JSON stats line every this many seconds")
+    parser.add_argument('--log-file', default=LOG_FILE,
+                        help="also write the log to this file (default: $WEBCAMO_LOG_FILE)")
+    parser.add_argument('--log-level', default=LOG_LEVEL, type=str.upper,
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="default: $WEBCAMO_LOG_LEVEL or INFO")
+    args = parser.parse_args(argv)
+
+    if args.mode == 'usb':
+        args.host = args.host or '127.0.0.1'
+        args.port = args.port or 23233
+    elif args.mode == 'file':
+        if not args.input:
+            parser.error("--input is required in file mode")
+    else:
+        if not args.host and not args.device:
+            parser.error("--host is required in wireless mode")
+        args.port = args.port or 8080
+    if args.record and (args.device or args.mode == 'file'):
+        parser.error("--record works with one phone, in usb or wireless mode")
+    return args
+
+
+def main(argv=None, stop_event=None):
+    args = parse_args(argv)
+    label = f"[{args.label}] " if args.label else ""
+    close_log = app_log.setup([logging.StreamHandler()], args.log_level, args.log_file,
+                              f"%(asctime)s %(levelname)s {label}%(message)s")
+    try:
+        if args.device:
+            return run_devices(args)
+        if args.mode == 'usb':
+            return run_usb(args, stop_event)
+        if args.mode == 'file':
+            return run_file(args, stop_event)
+        return run_wireless(args, stop_event)
+    finally:
+        close_log()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
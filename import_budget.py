@@ -0,0 +1,74 @@
+"""
+Checks cold-start import cost per entry path with ``python -X importtime``.
+
+    python import_budget.py            # report, exit 1 if a budget is blown
+    python import_budget.py --verbose  # also list the slowest imports
+
+Each path must stay under its time budget and must not pull in another
+mode's stack (e.g. USB mode importing aiortc, or the GUI importing OpenCV
+before a mode is picked). Times are machine dependent, so the budgets are
+generous; the forbidden-module checks are the part that catches regressions.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# name: (modules imported, budget in ms, modules that must not be loaded)
+# Measured on a desktop Linux box: gui-startup ~140 ms, usb ~175 ms,
+# wireless ~475 ms (aiortc alone is ~250 ms of that).
+PATHS = {
+    'gui-startup': (['usb_receiver_new'], 300,
+                    ['cv2', 'numpy', 'aiortc', 'av', 'websockets', 'pyvirtualcam']),
+    'usb': (['usb_pipeline', 'vcam_sinks'], 400,
+            ['aiortc', 'av', 'websockets', 'PyQt6', 'qasync']),
+    'wireless': (['wireless_receiver', 'vcam_sinks'], 900,
+                 ['PyQt6', 'qasync']),
+}
+
+
+def measure(modules):
+    """Returns (total ms, {module: cumulative ms}) for a fresh interpreter."""
+    code = "import " + ", ".join(modules)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    total = 0
+    loaded = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time:  self [us] | cumulative | <indent>name", two
+        # spaces of indent per nesting level below the first.
+        _, cumulative_us, name = line.split(':', 1)[1].split('|')
+        cumulative = int(cumulative_us) / 1000
+        loaded[name.strip()] = cumulative
+        if not name.startswith('   '):
+            total += cumulative
+    return total, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path, (modules, budget, forbidden) in PATHS.items():
+        total, loaded = measure(modules)
+        leaked = [m for m in forbidden if m in loaded]
+        ok = total <= budget and not leaked
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {path:12} {total:7.1f} ms (budget {budget} ms)"
+              + (f"  loads {', '.join(leaked)}" if leaked else ""))
+        if args.verbose:
+            for name, ms in sorted(loaded.items(), key=lambda kv: -kv[1])[:8]:
+                print(f"       {ms:7.1f} ms  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
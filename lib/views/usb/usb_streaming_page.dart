@@ -1,5 +1,7 @@
 import 'dart:async';
 import 'dart:io';
+import 'dart:isolate';
+import 'dart:math' as math;
 import 'dart:typed_data';
 import 'package:camera/camera.dart';
 import 'package:flutter/material.dart';
@@ -38,6 +40,34 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
 
   static const int _packetTypeVideo = 0;
 
+  // USB protocol v2 (see usb_protocol.py on the PC side). The PC sends a
+  // hello when it connects; we answer it and switch that client to v2
+  // framing. Clients that stay silent for a second get the old v1 packets.
+  static const int _protocolVersion = 2;
+  static const List<int> _helloMagic = [0x57, 0x43, 0x41, 0x4D]; // 'WCAM'
+  static const List<int> _frameSync = [0x57, 0x43, 0x46, 0x32]; // 'WCF2'
+  static const int _helloSize = 17;
+  static const int _metadataSize = 41;
+  static const int _headerV2Size = 24;
+
+  // Back-channel: a PC that sets _capControl in its hello may send
+  // StreamConfig messages (crop, size, fps). Each PC's latest one applies
+  // to the frames sent to that PC until it disconnects; other PCs keep
+  // getting full frames.
+  static const int _capControl = 1 << 1;
+  static const int _packetTypeStreamConfig = 0x10;
+  static const int _streamConfigSize = 13;
+
+  // 0 while waiting for the client's hello, then 1 or 2.
+  final Map<Socket, int> _clientVersions = {};
+  final Map<Socket, BytesBuilder> _helloBuffers = {};
+  final Map<Socket, BytesBuilder> _controlBuffers = {};
+  final Map<Socket, _StreamConfig> _streamConfigs = {};
+  final Map<Socket, int> _lastSentUs = {};
+  final Map<Socket, int> _frameSeqs = {};
+  final Stopwatch _clock = Stopwatch()..start();
+  bool _scaling = false;
+
   final FirebaseAnalyticsService _analyticsService = FirebaseAnalyticsService();
 
   final TimerService _timerService = TimerService();
@@ -133,6 +163,20 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
       _serverSocket!.listen((socket) {
         debugPrint("Client connected: ${socket.remoteAddress.address}");
         _clients.add(socket);
+        _clientVersions[socket] = 0;
+        _helloBuffers[socket] = BytesBuilder();
+        _controlBuffers[socket] = BytesBuilder();
+        socket.listen(
+          (data) => _onClientData(socket, data),
+          onError: (_) {},
+          cancelOnError: true,
+        );
+        Timer(const Duration(seconds: 1), () {
+          if (_clientVersions[socket] == 0) {
+            _clientVersions[socket] = 1; // PC client without a handshake
+            _helloBuffers.remove(socket);
+          }
+        });
         if (mounted) {
           setState(() {
             _isConnected = true; // <-- NEW: Client connected
@@ -141,7 +185,7 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
 
         socket.done.then((_) {
           debugPrint("Client disconnected");
-          _clients.remove(socket);
+          _forgetClient(socket);
           if (mounted && _clients.isEmpty) {
             setState(() {
               _isConnected = false; // <-- NEW: Client disconnected
@@ -151,7 +195,7 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
 
         socket.handleError((error) {
           debugPrint("Socket error: $error");
-          _clients.remove(socket);
+          _forgetClient(socket);
           if (mounted && _clients.isEmpty) {
             setState(() {
               _isConnected = false; // <-- NEW: Client disconnected
@@ -180,9 +224,28 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
 
     int frameCount = 0;
     _cameraController!.startImageStream((CameraImage image) async {
+      final int captureUs = _clock.elapsedMicroseconds;
       frameCount++;
-      if (frameCount % 2 != 0) return;
-      if (_clients.isEmpty) return;
+
+      // The clients this frame goes to, each at its own StreamConfig's rate
+      final Map<Socket, _StreamConfig?> due = {};
+      for (final client in _clients) {
+        final int version = _clientVersions[client] ?? 1;
+        if (version == 0) continue; // still waiting for its hello
+        final _StreamConfig? config = _streamConfigs[client];
+        if (config == null) {
+          if (frameCount % 2 != 0) continue;
+        } else if (config.fps > 0) {
+          // 2 ms of slack so camera jitter doesn't halve the requested rate
+          final int? lastUs = _lastSentUs[client];
+          if (lastUs != null &&
+              captureUs - lastUs < 1000000 ~/ config.fps - 2000) {
+            continue;
+          }
+        }
+        due[client] = config != null && config.changesFrame ? config : null;
+      }
+      if (due.isEmpty) return;
 
       try {
         if (Platform.isAndroid &&
@@ -191,43 +254,21 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
               _cameraController!.description.lensDirection ==
               CameraLensDirection.front;
 
-          final int width = image.width;
-          final int height = image.height;
-
-          final Plane planeY = image.planes[0];
-          final Plane planeU = image.planes[1];
-          final Plane planeV = image.planes[2];
-
-          final Uint8List yBytes = planeY.bytes;
-          final Uint8List uBytes = planeU.bytes;
-          final Uint8List vBytes = planeV.bytes;
-
-          final int metadataSize = 41;
-          final int payloadSize =
-              metadataSize + yBytes.length + uBytes.length + vBytes.length;
-
-          final List<int> header = [];
-          header.add(_packetTypeVideo);
-          header.addAll(_int32ToBytes(payloadSize));
-
-          header.addAll(_int32ToBytes(width));
-          header.addAll(_int32ToBytes(height));
-          header.addAll(_int32ToBytes(yBytes.length));
-          header.addAll(_int32ToBytes(uBytes.length));
-          header.addAll(_int32ToBytes(vBytes.length));
-          header.addAll(_int32ToBytes(planeY.bytesPerRow));
-          header.addAll(_int32ToBytes(planeU.bytesPerRow));
-          header.addAll(_int32ToBytes(planeV.bytesPerRow));
-          header.addAll(_int32ToBytes(planeU.bytesPerPixel ?? 1));
-          header.addAll(_int32ToBytes(planeV.bytesPerPixel ?? 1));
-          header.add(isFront ? 1 : 0);
-
-          for (final client in _clients) {
-            client.add(header);
-            client.add(yBytes);
-            client.add(uBytes);
-            client.add(vBytes);
-            await client.flush();
+          // One frame per distinct config, shared by the clients that sent it
+          final Map<_StreamConfig?, _Frame?> frames = {};
+          for (final MapEntry<Socket, _StreamConfig?> entry in due.entries) {
+            final _StreamConfig? config = entry.value;
+            if (!frames.containsKey(config)) {
+              frames[config] = config == null
+                  ? _Frame.fromImage(image)
+                  : await _cropFrame(image, config);
+            }
+            final _Frame? frame = frames[config];
+            final Socket client = entry.key;
+            // Skipped while the previous frame is still being scaled
+            if (frame == null || !_clients.contains(client)) continue;
+            _lastSentUs[client] = captureUs;
+            await _sendFrame(client, frame, isFront, captureUs);
           }
         }
       } catch (e) {
@@ -238,6 +279,146 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
     });
   }
 
+  Future<void> _sendFrame(
+    Socket client,
+    _Frame frame,
+    bool isFront,
+    int captureUs,
+  ) async {
+    final int payloadSize =
+        _metadataSize + frame.y.length + frame.u.length + frame.v.length;
+
+    final List<int> metadata = [];
+    metadata.addAll(_int32ToBytes(frame.width));
+    metadata.addAll(_int32ToBytes(frame.height));
+    metadata.addAll(_int32ToBytes(frame.y.length));
+    metadata.addAll(_int32ToBytes(frame.u.length));
+    metadata.addAll(_int32ToBytes(frame.v.length));
+    metadata.addAll(_int32ToBytes(frame.yStride));
+    metadata.addAll(_int32ToBytes(frame.uStride));
+    metadata.addAll(_int32ToBytes(frame.vStride));
+    metadata.addAll(_int32ToBytes(frame.uPixelStride));
+    metadata.addAll(_int32ToBytes(frame.vPixelStride));
+    metadata.add(isFront ? 1 : 0);
+
+    final List<int> header;
+    if ((_clientVersions[client] ?? 1) >= 2) {
+      // Sequence numbers count this client's frames, so the PC only
+      // reports frames lost on its own connection.
+      final int seq = _frameSeqs[client] ?? 0;
+      _frameSeqs[client] = (seq + 1) & 0xFFFFFFFF;
+      final ByteData prefix = ByteData(24);
+      for (int i = 0; i < 4; i++) {
+        prefix.setUint8(i, _frameSync[i]);
+      }
+      prefix.setUint8(4, _packetTypeVideo);
+      prefix.setUint32(8, seq);
+      prefix.setUint64(12, captureUs);
+      prefix.setUint32(20, payloadSize);
+      header = prefix.buffer.asUint8List().toList()..addAll(metadata);
+    } else {
+      header = [_packetTypeVideo, ..._int32ToBytes(payloadSize), ...metadata];
+    }
+
+    client.add(header);
+    client.add(frame.y);
+    client.add(frame.u);
+    client.add(frame.v);
+    await client.flush();
+  }
+
+  void _onClientData(Socket socket, Uint8List data) {
+    final BytesBuilder? buffer = _helloBuffers[socket];
+    if (buffer == null) {
+      _onControlData(socket, data); // handshake already done
+      return;
+    }
+    buffer.add(data);
+    if (buffer.length < _helloSize) return;
+
+    final Uint8List bytes = buffer.takeBytes();
+    final Uint8List hello = Uint8List.sublistView(bytes, 0, _helloSize);
+    _helloBuffers.remove(socket);
+    for (int i = 0; i < 4; i++) {
+      if (hello[i] != _helloMagic[i]) {
+        _clientVersions[socket] = 1;
+        return;
+      }
+    }
+    final int version =
+        hello[4] < _protocolVersion ? hello[4] : _protocolVersion;
+
+    final ByteData reply = ByteData(_helloSize);
+    for (int i = 0; i < 4; i++) {
+      reply.setUint8(i, _helloMagic[i]);
+    }
+    reply.setUint8(4, version);
+    reply.setUint32(5, _capControl); // capabilities
+    reply.setUint64(9, _clock.elapsedMicroseconds);
+    socket.add(reply.buffer.asUint8List());
+    _clientVersions[socket] = version < 1 ? 1 : version;
+    if (bytes.length > _helloSize) {
+      _onControlData(socket, Uint8List.sublistView(bytes, _helloSize));
+    }
+  }
+
+  // Messages from the PC after the handshake: v2 headers, so far only
+  // carrying StreamConfig (see usb_protocol.py).
+  void _onControlData(Socket socket, Uint8List data) {
+    final BytesBuilder? buffer = _controlBuffers[socket];
+    if (buffer == null) return;
+    buffer.add(data);
+    final Uint8List bytes = buffer.takeBytes();
+    int offset = 0;
+    while (bytes.length - offset >= _headerV2Size) {
+      final ByteData header =
+          ByteData.sublistView(bytes, offset, offset + _headerV2Size);
+      for (int i = 0; i < 4; i++) {
+        if (header.getUint8(i) != _frameSync[i]) {
+          _controlBuffers.remove(socket); // not a v2 client after all
+          return;
+        }
+      }
+      final int type = header.getUint8(4);
+      final int size = header.getUint32(20);
+      final int start = offset + _headerV2Size;
+      if (bytes.length - start < size) break;
+      if (type == _packetTypeStreamConfig && size >= _streamConfigSize) {
+        _streamConfigs[socket] = _StreamConfig.parse(
+          ByteData.sublistView(bytes, start, start + _streamConfigSize),
+        );
+      }
+      offset = start + size;
+    }
+    buffer.add(Uint8List.sublistView(bytes, offset));
+  }
+
+  void _forgetClient(Socket socket) {
+    _clients.remove(socket);
+    _clientVersions.remove(socket);
+    _helloBuffers.remove(socket);
+    _controlBuffers.remove(socket);
+    _streamConfigs.remove(socket);
+    _lastSentUs.remove(socket);
+    _frameSeqs.remove(socket);
+  }
+
+  // Cuts the requested crop out of the camera image. A plain crop is a
+  // row copy per plane, in the camera's own chroma layout; scaling it down
+  // runs on a background isolate, and while that is busy with an earlier
+  // frame this one is skipped (null).
+  Future<_Frame?> _cropFrame(CameraImage image, _StreamConfig config) async {
+    final _Crop crop = _Crop(image.width, image.height, config);
+    if (!crop.scales) return _copyCrop(image.planes, crop);
+    if (_scaling) return null;
+    _scaling = true;
+    try {
+      return await _scaleInBackground(_ScaleJob(image.planes, crop));
+    } finally {
+      _scaling = false;
+    }
+  }
+
   List<int> _int32ToBytes(int value) {
     return [
       (value >> 24) & 0xFF,
@@ -263,6 +444,12 @@ class _UsbStreamingPageState extends ConsumerState<UsbStreamingPage>
       client.destroy();
     }
     _clients.clear();
+    _clientVersions.clear();
+    _helloBuffers.clear();
+    _controlBuffers.clear();
+    _streamConfigs.clear();
+    _lastSentUs.clear();
+    _frameSeqs.clear();
 
     await _serverSocket?.close();
     _serverSocket = null;
@@ -805,3 +992,244 @@ class _ControlIcon extends StatelessWidget {
     );
   }
 }
+
+/// Where a StreamConfig's crop lands in a camera frame, and the size it is
+/// scaled down to. Never scales up: the PC does that if it wants more
+/// pixels than this. Everything is even, for the half-size chroma planes.
+class _Crop {
+  final int x, y, width, height, outWidth, outHeight;
+
+  const _Crop._(
+    this.x,
+    this.y,
+    this.width,
+    this.height,
+    this.outWidth,
+    this.outHeight,
+  );
+
+  factory _Crop(int frameWidth, int frameHeight, _StreamConfig config) {
+    int even(double value) => value.round() & ~1;
+    final int x = math.min(even(config.cropX * frameWidth), frameWidth - 2);
+    final int y = math.min(even(config.cropY * frameHeight), frameHeight - 2);
+    final int w = math.min(
+      config.cropW > 0 ? even(config.cropW * frameWidth) : frameWidth,
+      frameWidth - x,
+    );
+    final int h = math.min(
+      config.cropH > 0 ? even(config.cropH * frameHeight) : frameHeight,
+      frameHeight - y,
+    );
+    return _Crop._(
+      x,
+      y,
+      w,
+      h,
+      config.width > 0 && config.width < w ? config.width & ~1 : w,
+      config.height > 0 && config.height < h ? config.height & ~1 : h,
+    );
+  }
+
+  bool get scales => outWidth != width || outHeight != height;
+}
+
+/// An unscaled crop: whole rows copied out of each plane, keeping the
+/// chroma pixel stride so NV21/NV12 stay interleaved for the PC.
+_Frame _copyCrop(List<Plane> planes, _Crop crop) {
+  Uint8List rows(Plane plane, int x, int y, int count, int length) {
+    final Uint8List src = plane.bytes;
+    final int pixelStride = plane.bytesPerPixel ?? 1;
+    final int stride = length * pixelStride;
+    final Uint8List out = Uint8List(count * stride);
+    for (int r = 0; r < count; r++) {
+      final int from = (y + r) * plane.bytesPerRow + x * pixelStride;
+      // Android leaves the padding (and the last byte of an interleaved
+      // plane) off the last row.
+      final int n = math.min(stride, src.length - from);
+      out.setRange(r * stride, r * stride + n, src, from);
+    }
+    return out;
+  }
+
+  final int uPixelStride = planes[1].bytesPerPixel ?? 1;
+  final int vPixelStride = planes[2].bytesPerPixel ?? 1;
+  final int cw = crop.width ~/ 2;
+  final int ch = crop.height ~/ 2;
+  return _Frame(
+    width: crop.width,
+    height: crop.height,
+    y: rows(planes[0], crop.x, crop.y, crop.height, crop.width),
+    u: rows(planes[1], crop.x ~/ 2, crop.y ~/ 2, ch, cw),
+    v: rows(planes[2], crop.x ~/ 2, crop.y ~/ 2, ch, cw),
+    yStride: crop.width,
+    uStride: cw * uPixelStride,
+    vStride: cw * vPixelStride,
+    uPixelStride: uPixelStride,
+    vPixelStride: vPixelStride,
+  );
+}
+
+// Top level, so the isolate's closure captures nothing but the job.
+Future<_Frame> _scaleInBackground(_ScaleJob job) => Isolate.run(job.run);
+
+/// A crop scaled down (nearest neighbour) to tight I420 planes. Holds only
+/// bytes and numbers, so handing it to another isolate copies the planes
+/// once and nothing else.
+class _ScaleJob {
+  final _Crop crop;
+  final Uint8List y, u, v;
+  final int yRowStride, uRowStride, vRowStride, uPixelStride, vPixelStride;
+
+  _ScaleJob(List<Plane> planes, this.crop)
+    : y = planes[0].bytes,
+      u = planes[1].bytes,
+      v = planes[2].bytes,
+      yRowStride = planes[0].bytesPerRow,
+      uRowStride = planes[1].bytesPerRow,
+      vRowStride = planes[2].bytesPerRow,
+      uPixelStride = planes[1].bytesPerPixel ?? 1,
+      vPixelStride = planes[2].bytesPerPixel ?? 1;
+
+  _Frame run() {
+    final int x0 = crop.x, y0 = crop.y, w = crop.width, h = crop.height;
+    final int outW = crop.outWidth, outH = crop.outHeight;
+
+    final Int32List cols = Int32List(outW);
+    for (int i = 0; i < outW; i++) {
+      cols[i] = x0 + i * w ~/ outW;
+    }
+
+    final Uint8List yOut = Uint8List(outW * outH);
+    for (int r = 0; r < outH; r++) {
+      final int row = (y0 + r * h ~/ outH) * yRowStride;
+      final int o = r * outW;
+      if (outW == w) {
+        yOut.setRange(o, o + outW, y, row + x0);
+      } else {
+        for (int i = 0; i < outW; i++) {
+          yOut[o + i] = y[row + cols[i]];
+        }
+      }
+    }
+
+    final int cw = outW ~/ 2;
+    final int ch = outH ~/ 2;
+    Uint8List chroma(Uint8List src, int rowStride, int pixelStride) {
+      final Uint8List out = Uint8List(cw * ch);
+      for (int r = 0; r < ch; r++) {
+        final int row = ((y0 + 2 * r * h ~/ outH) ~/ 2) * rowStride;
+        final int o = r * cw;
+        for (int i = 0; i < cw; i++) {
+          out[o + i] = src[row + (cols[2 * i] ~/ 2) * pixelStride];
+        }
+      }
+      return out;
+    }
+
+    return _Frame(
+      width: outW,
+      height: outH,
+      y: yOut,
+      u: chroma(u, uRowStride, uPixelStride),
+      v: chroma(v, vRowStride, vPixelStride),
+      yStride: outW,
+      uStride: cw,
+      vStride: cw,
+      uPixelStride: 1,
+      vPixelStride: 1,
+    );
+  }
+}
+
+/// What the PC asked for (usb_protocol.StreamConfig): a crop of the camera
+/// frame as fractions, the size to scale it down to and a frame rate; 0
+/// means "as captured" for the size and fps.
+class _StreamConfig {
+  final double cropX, cropY, cropW, cropH;
+  final int width, height, fps;
+
+  const _StreamConfig(
+    this.cropX,
+    this.cropY,
+    this.cropW,
+    this.cropH,
+    this.width,
+    this.height,
+    this.fps,
+  );
+
+  factory _StreamConfig.parse(ByteData data) {
+    double fraction(int offset) => data.getUint16(offset) / 65535.0;
+    return _StreamConfig(
+      fraction(0),
+      fraction(2),
+      fraction(4),
+      fraction(6),
+      data.getUint16(8),
+      data.getUint16(10),
+      data.getUint8(12),
+    );
+  }
+
+  // Equal configs from different PCs share one cropped frame.
+  @override
+  bool operator ==(Object other) =>
+      other is _StreamConfig &&
+      other.cropX == cropX &&
+      other.cropY == cropY &&
+      other.cropW == cropW &&
+      other.cropH == cropH &&
+      other.width == width &&
+      other.height == height &&
+      other.fps == fps;
+
+  @override
+  int get hashCode =>
+      Object.hash(cropX, cropY, cropW, cropH, width, height, fps);
+
+  bool get changesFrame =>
+      cropX > 0 ||
+      cropY > 0 ||
+      (cropW > 0 && cropW < 1) ||
+      (cropH > 0 && cropH < 1) ||
+      width > 0 ||
+      height > 0;
+}
+
+/// The planes and layout that go into one frame's metadata.
+class _Frame {
+  final int width, height;
+  final Uint8List y, u, v;
+  final int yStride, uStride, vStride, uPixelStride, vPixelStride;
+
+  const _Frame({
+    required this.width,
+    required this.height,
+    required this.y,
+    required this.u,
+    required this.v,
+    required this.yStride,
+    required this.uStride,
+    required this.vStride,
+    required this.uPixelStride,
+    required this.vPixelStride,
+  });
+
+  factory _Frame.fromImage(CameraImage image) {
+    final Plane planeY = image.planes[0];
+    final Plane planeU = image.planes[1];
+    final Plane planeV = image.planes[2];
+    return _Frame(
+      width: image.width,
+      height: image.height,
+      y: planeY.bytes,
+      u: planeU.bytes,
+      v: planeV.bytes,
+      yStride: planeY.bytesPerRow,
+      uStride: planeU.bytesPerRow,
+      vStride: planeV.bytesPerRow,
+      uPixelStride: planeU.bytesPerPixel ?? 1,
+      vPixelStride: planeV.bytesPerPixel ?? 1,
+    );
+  }
+}
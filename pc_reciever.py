@@ -1,52 +1,246 @@
+"""
+Receiver for a raw H.264 (Annex-B) stream from the phone.
+
+    python pc_reciever.py                          # connect to 127.0.0.1:23233 and show it
+    python pc_reciever.py --thread-type FRAME      # frame threading for big streams
+    python pc_reciever.py --no-display             # decode only, print the metrics
+    python pc_reciever.py --sink auto              # into a virtual camera instead
+
+The socket is read on a decode thread that feeds a bare CodecContext
+(h264_decode.H264Decoder: no container probing, low delay, threaded). The
+newest decoded frame is handed to the display loop through a LatestQueue,
+so a slow window skips frames instead of delaying them, and BGR conversion
+only happens for frames that are actually shown. With --sink the receiver
+is a FrameSource instead and runs through the same FrameGraph as the other
+receivers (crop, scale, pace into a vcam_sinks sink).
+
+Reported when the stream ends:
+
+    time to first frame   connect -> first decoded frame (and first shown)
+    frames behind         how many newer frames had been decoded by the time
+                          a frame was shown, plus frames skipped outright
+"""
+
+import argparse
 import socket
-import av
-import cv2
 import sys
+import threading
+import time
+
+from frame_graph import FMT_AV, Frame, FrameGraph, FrameSource
+from frame_pipeline import LatestQueue
+from frame_stats import FrameStats
+from h264_decode import H264Decoder
 
 HOST = '127.0.0.1'  # This means you MUST use 'adb reverse'
 PORT = 23233        # Make sure this matches the port in your Android app
 
-print("Connecting to Android device...")
+RECV_CHUNK = 256 * 1024
 
-try:
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((HOST, PORT))
-    print("Connected!")
-except ConnectionRefusedError:
-    print(f"Connection failed. Did you forget to run 'adb reverse tcp:{PORT} tcp:{PORT}'?")
-    sys.exit(1)
-
-
-# Turn the socket into a file-like object
-# pyav will read from this just like a file
-fileobj = s.makefile('rb')
-
-try:
-    # 'h264' is the format hint for the raw stream
-    with av.open(fileobj, 'r', format='h264') as container:
-        print("Opened video stream. Waiting for frames...")
-        
-        # We decode the first (and only) video stream
-        for frame in container.decode(video=0):
-            # Convert the frame to a NumPy array for OpenCV
-            img = frame.to_ndarray(format='bgr24')
-            
-            # print(f"Displaying frame: {frame.pts} (Size: {frame.width}x{frame.height})")
-
-            cv2.imshow('Phone Camera Stream', img)
-            
-            # Exit on 'ESC' key
-            if cv2.waitKey(1) & 0xFF == 27:
+
+class H264StreamReceiver(FrameSource):
+    """Decodes an Annex-B stream from ``sock``: run(emit) on the caller's
+    thread, or start() on its own.
+
+    After start(), ``frames`` yields the newest FMT_AV Frame (``seq`` counts
+    from 1, ``received`` is when it was decoded); ``decoded`` counts every
+    frame the decoder produced.
+    """
+
+    name = 'h264'
+
+    def __init__(self, sock, threads=0, thread_type='SLICE', metrics=None):
+        self.sock = sock
+        self.decoder = H264Decoder(threads, thread_type)
+        self.metrics = metrics if metrics is not None else FrameStats()
+        self.frames = LatestQueue(1)
+        self.started_at = time.perf_counter()
+        self.first_frame_at = None
+        self.decoded = 0
+        self.bytes_received = 0
+        self._thread = threading.Thread(target=self._run, name="h264-decode", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {'decoded': self.decoded, 'decode_errors': self.decoder.errors,
+                'bytes_received': self.bytes_received}
+
+    @property
+    def time_to_first_frame(self):
+        if self.first_frame_at is None:
+            return None
+        return self.first_frame_at - self.started_at
+
+    def run(self, emit):
+        buffer = bytearray(RECV_CHUNK)
+        view = memoryview(buffer)
+        while True:
+            try:
+                n = self.sock.recv_into(buffer)
+            except OSError:
                 break
+            if n == 0:
+                break
+            self.bytes_received += n
+            self.metrics.count('bytes_received', n)
+
+            # A raw stream has no frame boundaries, so the parser holds
+            # each frame until the next one starts.
+            start = time.perf_counter()
+            frames = self.decoder.decode(view[:n], end_of_frame=False)
+            self.metrics.observe('decode', time.perf_counter() - start)
+            self._publish(frames, emit)
+        self._publish(self.decoder.flush(), emit)
+
+    def _run(self):
+        try:
+            self.run(self._put)
+        finally:
+            self.frames.close()
+
+    def _put(self, frame):
+        self.metrics.count('frames_received')
+        self.frames.put(frame)
+
+    def _publish(self, frames, emit):
+        for frame in frames:
+            now = time.perf_counter()
+            if self.first_frame_at is None:
+                self.first_frame_at = now
+            self.decoded += 1
+            emit(Frame(frame, FMT_AV, frame.width, frame.height, self.decoded, now))
+
+
+def consume(receiver, show=None):
+    """Takes the newest frames until the stream ends. ``show(img)`` gets BGR
+    frames and returns False to stop. Returns a dict of metrics."""
+    metrics = receiver.metrics
+    shown = 0
+    behind_total = 0
+    first_shown_at = None
+    last_index = 0
+    metrics.gauge('frames_behind', lambda: receiver.decoded - last_index)
+    while True:
+        item = receiver.frames.get(timeout=0.05)
+        if item is None:
+            if receiver.frames.closed:
+                break
+            if show is not None and show(None) is False:
+                break
+            continue
+
+        last_index = item.seq
+        behind = receiver.decoded - item.seq
+        behind_total += behind
+        metrics.observe('queue', time.perf_counter() - item.received)
+
+        start = time.perf_counter()
+        img = item.data.to_ndarray(format='bgr24')
+        metrics.observe('convert', time.perf_counter() - start)
+        if first_shown_at is None:
+            first_shown_at = time.perf_counter()
+        shown += 1
+        metrics.count('frames_sent')
+        if show is not None and show(img) is False:
+            break
+
+    ttff = receiver.time_to_first_frame
+    return {
+        'time_to_first_frame_ms': ttff * 1000 if ttff is not None else None,
+        'time_to_first_shown_ms': (first_shown_at - receiver.started_at) * 1000 if first_shown_at else None,
+        'decoded': receiver.decoded,
+        'shown': shown,
+        'skipped': receiver.frames.dropped,
+        'mean_frames_behind': behind_total / shown if shown else 0.0,
+        'decode_errors': receiver.decoder.errors,
+    }
+
+
+def imshow_window(title='Phone Camera Stream'):
+    import cv2
+
+    def show(img):
+        if img is not None:
+            cv2.imshow(title, img)
+        # Exit on 'ESC' key
+        return (cv2.waitKey(1) & 0xFF) != 27
+
+    return show
+
+
+def run_sink(receiver, spec, size=None):
+    """Runs ``receiver`` through a FrameGraph into the ``spec`` sink until
+    the stream ends or Ctrl+C."""
+    from vcam_sinks import create_sink
+
+    graph = FrameGraph(receiver, create_sink(spec), size=size, metrics=receiver.metrics, name='h264')
+    try:
+        graph.run()
+    except KeyboardInterrupt:
+        print("Stream stopped by user.")
+    finally:
+        receiver.sock.close()
+    for key, value in graph.stats().items():
+        print(f"{key:24} {value:.2f}" if isinstance(value, float) else f"{key:24} {value}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show a raw H.264 stream from the phone")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--threads', type=int, default=0, help="decoder threads (0 = auto)")
+    parser.add_argument('--thread-type', choices=('SLICE', 'FRAME', 'AUTO'), default='SLICE')
+    parser.add_argument('--no-display', action='store_true', help="decode only, then print the metrics")
+    parser.add_argument('--sink', metavar='SPEC',
+                        help="send to a virtual camera instead of a window (see vcam_sinks)")
+    parser.add_argument('--size', type=int, help="square output side with --sink (default: the frame's short side)")
+    args = parser.parse_args(argv)
+
+    print("Connecting to Android device...")
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.connect((args.host, args.port))
+        print("Connected!")
+    except ConnectionRefusedError:
+        print(f"Connection failed. Did you forget to run 'adb reverse tcp:{args.port} tcp:{args.port}'?")
+        return 1
+
+    receiver = H264StreamReceiver(s, args.threads, args.thread_type)
+    if args.sink:
+        return run_sink(receiver, args.sink, args.size)
+    receiver.start()
+    try:
+        # Display stays on the main thread (required by some GUI backends).
+        result = consume(receiver, None if args.no_display else imshow_window())
+    except KeyboardInterrupt:
+        print("Stream stopped by user.")
+        result = None
+    finally:
+        print("Cleaning up...")
+        s.close()
+        receiver.join(1.0)
+        if not args.no_display:
+            import cv2
+            cv2.destroyAllWindows()
+
+    if result:
+        for key, value in result.items():
+            print(f"{key:24} {value:.1f}" if isinstance(value, float) else f"{key:24} {value}")
+    return 0
+
 
-except av.error.EOFError:
-    print("End of stream.")
-except KeyboardInterrupt:
-    print("Stream stopped by user.")
-except Exception as e:
-    print(f"An error occurred: {e}")
-finally:
-    print("Cleaning up...")
-    fileobj.close()
-    s.close()
-    cv2.destroyAllWindows()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,581 @@
+"""
+Stand-in for the phone app, for trying the receivers without a device.
+
+    python phone_emulator.py                                # USB, 1920x1080 NV21 at 30 fps
+    python phone_emulator.py --size 1280x720 --layout i420 --stride-align 64
+    python phone_emulator.py --fps 0 --frames 600           # as fast as possible
+    python phone_emulator.py --protocol 1                   # the original v1 sender
+    python phone_emulator.py --corrupt-every 50             # garbage between packets
+    python phone_emulator.py --codec h264                   # H.264 transport (needs PyAV)
+    python phone_emulator.py --no-control                   # ignore the receiver's StreamConfig
+    python phone_emulator.py --mode wireless --port 8080    # WebRTC over ws://.../ws
+
+USB mode listens where 'adb forward' would (127.0.0.1:23233) and sends the
+same 0x00 packets as the Android sender, with the plane lengths, strides and
+pixel strides an ImageReader frame of the chosen layout has; point the
+receiver at it with --no-adb. With --protocol 2 (the default) it answers the
+receiver's hello like the current app and sends v2 framing, falling back to
+v1 when no hello arrives within a second. Like the app, it takes the
+receiver's StreamConfig (crop, size, fps) for raw frames. Wireless mode
+answers the receiver's offer with a synthetic aiortc video track.
+FakeAdbServer stands in for the adb server that adb_client talks to.
+
+A handful of frames are built up front and sent in turn, so the emulator
+costs next to nothing per frame and does not skew benchmarks.
+"""
+
+import argparse
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+from usb_protocol import (CAP_CONTROL, CAP_H264, FRAME_SYNC, H264_END_OF_FRAME, H264_FRONT, HEADER,
+                          HEADER_V2, HELLO, HELLO_MAGIC, METADATA, PACKET_TYPE_H264,
+                          PACKET_TYPE_STREAM_CONFIG, PACKET_TYPE_VIDEO, StreamConfig)
+
+USB_PORT = 23233
+WIRELESS_PORT = 8080
+
+# nv21 / nv12: semi-planar (pixel stride 2, V or U first), what most phones
+# send; i420: fully planar (pixel stride 1).
+LAYOUTS = ('nv21', 'nv12', 'i420')
+
+
+def _align(n, alignment):
+    return (n + alignment - 1) // alignment * alignment
+
+
+def synthetic_i420(width, height, index=0):
+    """A moving diagonal gradient as (y, u, v) planes, shifted by ``index``."""
+    rows = np.arange(height, dtype=np.uint32)[:, None]
+    cols = np.arange(width, dtype=np.uint32)[None, :]
+    y = ((rows + cols + 8 * index) & 0xFF).astype(np.uint8)
+    u = np.broadcast_to((64 + (cols[:, ::2] // 4) % 128).astype(np.uint8), (height // 2, width // 2))
+    v = np.broadcast_to((64 + (rows[::2] // 4 + 4 * index) % 128).astype(np.uint8), (height // 2, width // 2))
+    return y, u, v
+
+
+def _strided(plane, stride, length):
+    """``plane`` laid out with ``stride`` bytes per row, cut to ``length``."""
+    rows, width = plane.shape
+    padded = np.zeros((rows, stride), np.uint8)
+    padded[:, :width] = plane
+    return padded.reshape(-1)[:length]
+
+
+def build_packet(width, height, layout='nv21', index=0, is_front=False, stride_align=1):
+    """One complete v1 0x00 packet (header, metadata, planes) as bytes."""
+    payload = build_payload(width, height, layout, index, is_front, stride_align)
+    return HEADER.pack(PACKET_TYPE_VIDEO, len(payload)) + payload
+
+
+def _even(value):
+    # round() first: crop fractions travel as n/65535 and come back a hair small
+    return round(value) & ~1
+
+
+def apply_config(planes, config):
+    """Crops and (nearest-neighbour) scales i420 planes the way the app
+    applies a StreamConfig, never larger than the crop. Returns the planes
+    and whether they were scaled."""
+    y, u, v = planes
+    height, width = y.shape
+    cx, cy, cw, ch = config.crop
+    x0, y0 = min(_even(cx * width), width - 2), min(_even(cy * height), height - 2)
+    w = min(_even(cw * width) or width, width - x0)
+    h = min(_even(ch * height) or height, height - y0)
+    out_w, out_h = min(_even(config.width) or w, w), min(_even(config.height) or h, h)
+    rows = y0 + np.arange(out_h) * h // out_h
+    cols = x0 + np.arange(out_w) * w // out_w
+    return (y[np.ix_(rows, cols)], u[np.ix_(rows[::2] // 2, cols[::2] // 2)],
+            v[np.ix_(rows[::2] // 2, cols[::2] // 2)]), (out_w, out_h) != (w, h)
+
+
+def build_payload(width, height, layout='nv21', index=0, is_front=False, stride_align=1, config=None):
+    """The payload of a 0x00 packet (metadata, planes) as bytes.
+
+    Like Android, the last row of each plane has no padding, and in the
+    semi-planar layouts the U and V planes overlap by all but one byte.
+    With a StreamConfig the frame is cropped and scaled first, like the app
+    does: a plain crop keeps the layout with tight rows, a scaled one is
+    sent as tight I420.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+    y, u, v = synthetic_i420(width, height, index)
+    if config is not None:
+        (y, u, v), scaled = apply_config((y, u, v), config)
+        height, width = y.shape
+        stride_align = 1
+        if scaled:
+            layout = 'i420'
+    uv_rows = height // 2
+
+    y_stride = _align(width, stride_align)
+    y_bytes = _strided(y, y_stride, y_stride * (height - 1) + width)
+
+    if layout == 'i420':
+        c_stride = _align(width // 2, stride_align)
+        length = c_stride * (uv_rows - 1) + width // 2
+        u_bytes, v_bytes = _strided(u, c_stride, length), _strided(v, c_stride, length)
+        pixel_stride = 1
+    else:
+        c_stride = y_stride
+        interleaved = np.empty((uv_rows, width), np.uint8)
+        first, second = (v, u) if layout == 'nv21' else (u, v)
+        interleaved[:, 0::2] = first
+        interleaved[:, 1::2] = second
+        data = _strided(interleaved, c_stride, c_stride * (uv_rows - 1) + width)
+        first_bytes, second_bytes = data[:-1], data[1:]
+        u_bytes, v_bytes = (second_bytes, first_bytes) if layout == 'nv21' else (first_bytes, second_bytes)
+        pixel_stride = 2
+
+    meta = METADATA.pack(width, height, len(y_bytes), len(u_bytes), len(v_bytes),
+                         y_stride, c_stride, c_stride, pixel_stride, pixel_stride, int(is_front))
+    return b''.join((meta, y_bytes.tobytes(), u_bytes.tobytes(), v_bytes.tobytes()))
+
+
+def encode_h264(width, height, count=30, is_front=False, bitrate=8_000_000):
+    """``count`` frames as H.264 payloads (flags byte + one access unit each),
+    a single closed GOP so the list can be sent in a loop."""
+    from fractions import Fraction
+
+    import av
+
+    enc = av.CodecContext.create('libx264', 'w')
+    enc.width, enc.height, enc.pix_fmt = width, height, 'yuv420p'
+    enc.time_base = Fraction(1, 30)
+    enc.bit_rate = bitrate
+    enc.gop_size = count
+    enc.options = {'preset': 'ultrafast', 'tune': 'zerolatency', 'bf': '0'}
+
+    flags = bytes([H264_END_OF_FRAME | (H264_FRONT if is_front else 0)])
+    payloads = []
+    for i in range(count):
+        frame = av.VideoFrame.from_ndarray(
+            np.concatenate([p.reshape(-1) for p in synthetic_i420(width, height, i)]).reshape(-1, width),
+            format='yuv420p')
+        frame.pts = i
+        payloads.append(flags + b''.join(bytes(p) for p in enc.encode(frame)))
+    return payloads
+
+
+class UsbPhoneEmulator:
+    """Serves synthetic video packets over TCP, one client at a time.
+
+    ``fps`` 0 sends as fast as the receiver reads. After ``frames`` packets
+    (0 = unlimited) the connection is closed, which ends a UsbPipeline run.
+    ``sent_at[i]`` is the time.perf_counter() at which packet i of the
+    current connection started going out, matching VideoPacket.seq. The v2
+    capture timestamps use the same clock. ``corrupt_every`` N writes a few
+    garbage bytes before every Nth packet. With ``codec='h264'``, receivers
+    that offer CAP_H264 get H.264 instead of raw frames. With ``control``
+    the latest StreamConfig from the receiver (``config``) is applied to raw
+    frames; its fps is capped at ``fps``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=USB_PORT, width=1920, height=1080, layout='nv21',
+                 fps=30, frames=0, is_front=False, stride_align=1, variants=8, protocol=2,
+                 corrupt_every=0, codec='raw', control=True):
+        self.fps = fps
+        self.frames = frames
+        self.protocol = protocol
+        self.corrupt_every = corrupt_every
+        self.control = control
+        self.config = None
+        self.configs = []
+        self._frame_args = (width, height, layout, is_front, stride_align, variants)
+        self.payloads = [build_payload(width, height, layout, i, is_front, stride_align)
+                         for i in range(variants)]
+        self.h264_payloads = encode_h264(width, height, is_front=is_front) if codec == 'h264' else None
+        self.sent_at = []
+        self.version = None
+        self.codec = None
+
+        self._server = socket.create_server((host, port))
+        # Closing a socket doesn't wake a blocked accept(); poll so stop() works.
+        self._server.settimeout(0.2)
+        self.port = self._server.getsockname()[1]
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="phone-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._server.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def serve_forever(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.settimeout(None)
+            with conn:
+                self._stream(conn)
+                # close() alone leaves the connection up while _read_control is in recv
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _handshake(self, conn):
+        """Like the app: wait briefly for a hello, answer it, else speak v1.
+        Returns (version, the receiver's capability bits)."""
+        if self.protocol < 2:
+            return 1, 0
+        conn.settimeout(1.0)
+        data = b''
+        try:
+            while len(data) < HELLO.size:
+                chunk = conn.recv(HELLO.size - len(data))
+                if not chunk:
+                    break
+                data += chunk
+        except socket.timeout:
+            pass
+        conn.settimeout(None)
+        if len(data) < HELLO.size or not data.startswith(HELLO_MAGIC):
+            return 1, 0
+        _, version, capabilities, _ = HELLO.unpack(data)
+        version = min(version, self.protocol)
+        ours = CAP_CONTROL if self.control else 0
+        conn.sendall(HELLO.pack(HELLO_MAGIC, version, ours, int(time.perf_counter() * 1e6)))
+        return version, capabilities
+
+    def _read_control(self, conn):
+        """Collects StreamConfig messages until the connection closes."""
+        data = b''
+        while True:
+            try:
+                chunk = conn.recv(4096)
+            except OSError:
+                return
+            if not chunk:
+                return
+            data += chunk
+            while len(data) >= HEADER_V2.size:
+                sync, packet_type, _, _, _, _, size = HEADER_V2.unpack_from(data)
+                if sync != FRAME_SYNC:
+                    return
+                if len(data) < HEADER_V2.size + size:
+                    break
+                payload, data = data[HEADER_V2.size:HEADER_V2.size + size], data[HEADER_V2.size + size:]
+                if packet_type == PACKET_TYPE_STREAM_CONFIG:
+                    self.configs.append(StreamConfig.unpack(payload))
+                    self.config = self.configs[-1]
+
+    def _payloads_for(self, config, cache):
+        if config not in cache:
+            width, height, layout, is_front, stride_align, variants = self._frame_args
+            cache.clear()
+            cache[config] = [build_payload(width, height, layout, i, is_front, stride_align, config)
+                             for i in range(variants)]
+        return cache[config]
+
+    def _stream(self, conn):
+        self.sent_at = []
+        self.config = None
+        self.configs = []
+        try:
+            version, capabilities = self._handshake(conn)
+        except OSError:
+            return
+        self.version = version
+        payloads, packet_type = self.payloads, PACKET_TYPE_VIDEO
+        if self.h264_payloads and version >= 2 and capabilities & CAP_H264:
+            payloads, packet_type = self.h264_payloads, PACKET_TYPE_H264
+        self.codec = 'h264' if packet_type == PACKET_TYPE_H264 else 'raw'
+        controlled = self.control and version >= 2 and capabilities & CAP_CONTROL
+        if controlled:
+            threading.Thread(target=self._read_control, args=(conn,), name="emulator-control",
+                             daemon=True).start()
+
+        interval = 1.0 / self.fps if self.fps else 0.0
+        due = time.perf_counter()
+        count = 0
+        cache = {}
+        while not self._stopped.is_set() and (not self.frames or count < self.frames):
+            config = self.config
+            if config is not None and packet_type == PACKET_TYPE_VIDEO:
+                payloads = self._payloads_for(config, cache)
+                if config.fps:
+                    interval = 1.0 / min(config.fps, self.fps) if self.fps else 1.0 / config.fps
+            if interval:
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # A camera doesn't catch up on frames it was too slow for.
+                due = max(due + interval, time.perf_counter())
+            now = time.perf_counter()
+            self.sent_at.append(now)
+            payload = payloads[count % len(payloads)]
+            if version >= 2:
+                header = HEADER_V2.pack(FRAME_SYNC, packet_type, 0, 0, count & 0xFFFFFFFF,
+                                        int(now * 1e6), len(payload))
+            else:
+                header = HEADER.pack(PACKET_TYPE_VIDEO, len(payload))
+            try:
+                if self.corrupt_every and count and count % self.corrupt_every == 0:
+                    conn.sendall(b'\xde\xad\xbe\xef' * 3)
+                conn.sendall(header)
+                conn.sendall(payload)
+            except OSError:
+                return
+            count += 1
+
+
+def _synthetic_track(width, height, fps):
+    import asyncio
+    from fractions import Fraction
+
+    from aiortc import VideoStreamTrack
+    from av import VideoFrame
+
+    frames = [np.concatenate([p.reshape(-1) for p in synthetic_i420(width, height, i)]).reshape(-1, width)
+              for i in range(8)]
+
+    class SyntheticTrack(VideoStreamTrack):
+        def __init__(self):
+            super().__init__()
+            self.count = 0
+            self._start = None
+
+        async def recv(self):
+            if self._start is None:
+                self._start = time.perf_counter()
+            delay = self._start + self.count / fps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            frame = VideoFrame.from_ndarray(frames[self.count % len(frames)], format='yuv420p')
+            frame.pts = int(self.count * 90000 / fps)
+            frame.time_base = Fraction(1, 90000)
+            self.count += 1
+            return frame
+
+    return SyntheticTrack()
+
+
+class WirelessPhoneEmulator:
+    """WebSocket signalling plus an aiortc sender, like the phone's wireless mode.
+
+    Run it on an asyncio loop with ``await start()``; ``port`` is the bound
+    port afterwards.
+    """
+
+    def __init__(self, host='127.0.0.1', port=WIRELESS_PORT, width=1280, height=720, fps=30):
+        self.host = host
+        self.port = port
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._server = None
+        self._pcs = set()
+
+    async def start(self):
+        import websockets
+
+        self._server = await websockets.serve(self._signalling, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for pc in list(self._pcs):
+            await pc.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _signalling(self, ws, *_):
+        import json
+
+        from aiortc import RTCPeerConnection, RTCSessionDescription
+
+        pc = RTCPeerConnection()
+        self._pcs.add(pc)
+        try:
+            async for message in ws:
+                data = json.loads(message)
+                if data.get('type') != 'offer':
+                    continue
+                await pc.setRemoteDescription(RTCSessionDescription(data['sdp'], 'offer'))
+                pc.addTrack(_synthetic_track(self.width, self.height, self.fps))
+                await pc.setLocalDescription(await pc.createAnswer())
+                await ws.send(json.dumps({'type': 'answer', 'sdp': pc.localDescription.sdp}))
+        except Exception:
+            pass
+        finally:
+            self._pcs.discard(pc)
+            await pc.close()
+
+
+class FakeAdbServer:
+    """The adb server's side of host:devices, host:track-devices and
+    forward (see adb_client), for trying the client without adb.
+
+    ``devices`` maps serial -> state; set_device() and remove_device()
+    (called on the server's loop) notify trackers like a plug or unplug
+    would. Forwards are recorded in ``forwards`` as (serial, local, remote)
+    but not opened; with ``forward_error`` set they fail with it after the
+    device was found, like adb's "cannot bind listener". Run it with
+    ``await start()``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, devices=None):
+        self.host = host
+        self.port = port
+        self.devices = dict(devices or {})
+        self.forwards = []
+        self.forward_error = None
+        self.requests = []
+        self._trackers = set()
+        self._server = None
+
+    async def start(self):
+        import asyncio
+
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for queue in list(self._trackers):
+                queue.put_nowait(None)
+            await self._server.wait_closed()
+
+    def set_device(self, serial, state='device'):
+        self.devices[serial] = state
+        self._notify()
+
+    def remove_device(self, serial):
+        self.devices.pop(serial, None)
+        self._notify()
+
+    def _listing(self):
+        return ''.join(f"{serial}\t{state}\n" for serial, state in self.devices.items())
+
+    def _notify(self):
+        for queue in self._trackers:
+            queue.put_nowait(self._listing())
+
+    @staticmethod
+    def _message(text):
+        data = text.encode()
+        return b'%04x' % len(data) + data
+
+    async def _serve(self, reader, writer):
+        import asyncio
+
+        try:
+            size = int(await reader.readexactly(4), 16)
+            service = (await reader.readexactly(size)).decode()
+            self.requests.append(service)
+            if service == 'host:devices':
+                writer.write(b'OKAY' + self._message(self._listing()))
+            elif service == 'host:track-devices':
+                queue = asyncio.Queue()
+                self._trackers.add(queue)
+                try:
+                    writer.write(b'OKAY' + self._message(self._listing()))
+                    while (listing := await queue.get()) is not None:
+                        writer.write(self._message(listing))
+                        await writer.drain()
+                finally:
+                    self._trackers.discard(queue)
+            elif ':forward:' in service:
+                target, _, spec = service.partition(':forward:')
+                serial = target.partition('host-serial:')[2] or None
+                online = [s for s, state in self.devices.items() if state == 'device']
+                if serial is None and len(online) == 1:
+                    serial = online[0]
+                if serial not in online:
+                    error = (f"device '{serial}' not found" if serial else
+                             "more than one device/emulator" if online else "no devices/emulators found")
+                    writer.write(b'FAIL' + self._message(error))
+                elif self.forward_error:
+                    writer.write(b'OKAYFAIL' + self._message(self.forward_error))
+                else:
+                    local, _, remote = spec.partition(';')
+                    self.forwards.append((serial, local, remote))
+                    writer.write(b'OKAYOKAY')
+            else:
+                writer.write(b'FAIL' + self._message(f"unknown host service {service!r}"))
+            await writer.drain()
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic phone for the Webcamo receivers")
+    parser.add_argument('--mode', choices=('usb', 'wireless'), default='usb')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help="default 23233 for usb, 8080 for wireless")
+    parser.add_argument('--size', type=parse_size, default=None, help="WxH (default 1920x1080 usb, 1280x720 wireless)")
+    parser.add_argument('--layout', choices=LAYOUTS, default='nv21')
+    parser.add_argument('--stride-align', type=int, default=1, help="round row strides up to this many bytes")
+    parser.add_argument('--fps', type=float, default=30, help="0 sends as fast as possible (usb only)")
+    parser.add_argument('--frames', type=int, default=0, help="close the connection after this many (usb)")
+    parser.add_argument('--front', action='store_true', help="flag frames as front camera (usb)")
+    parser.add_argument('--protocol', type=int, choices=(1, 2), default=2, help="highest USB protocol to speak")
+    parser.add_argument('--corrupt-every', type=int, default=0, metavar='N',
+                        help="inject garbage before every Nth packet (usb)")
+    parser.add_argument('--codec', choices=('raw', 'h264'), default='raw',
+                        help="h264: send H.264 to receivers that support it (usb)")
+    parser.add_argument('--no-control', action='store_true',
+                        help="don't offer stream control (crop/size/fps requests) to the receiver (usb)")
+    args = parser.parse_args(argv)
+
+    if args.mode == 'usb':
+        width, height = args.size or (1920, 1080)
+        emulator = UsbPhoneEmulator(args.host, args.port or USB_PORT, width, height, args.layout,
+                                    args.fps, args.frames, args.front, args.stride_align,
+                                    protocol=args.protocol, corrupt_every=args.corrupt_every,
+                                    codec=args.codec, control=not args.no_control)
+        print(f"Emulating USB phone on {args.host}:{emulator.port}: {width}x{height} {args.layout}")
+        try:
+            emulator.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    import asyncio
+
+    async def serve():
+        width, height = args.size or (1280, 720)
+        emulator = await WirelessPhoneEmulator(args.host, args.port or WIRELESS_PORT,
+                                               width, height, args.fps or 30).start()
+        print(f"Emulating wireless phone on ws://{args.host}:{emulator.port}/ws: {width}x{height}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await emulator.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Latest-frame-only preview path.
+
+Receivers post every frame to a PreviewMailbox. Frames beyond the preview
+rate are dropped on the spot; the rest are downscaled to the preview size on
+the mailbox's own thread. The GUI is notified only when it has picked up the
+previous frame, so at most one preview is ever in flight and the GUI thread
+does nothing but wrap an already-sized BGR buffer in a QImage.
+
+An optional stats overlay (see frame_stats.FrameStats.overlay_lines) is
+drawn onto the downscaled copy, never onto the frame the sink gets.
+"""
+
+import threading
+import time
+
+from frame_pipeline import LatestQueue
+
+PREVIEW_FPS = 15
+
+
+def fit_frame(img, width, height):
+    """Downscales ``img`` to fit inside width x height, keeping the aspect
+    ratio. Never upscales; always returns a C-contiguous array."""
+    # Imported on first use so the GUI can start before OpenCV is loaded.
+    import cv2
+    import numpy as np
+
+    h, w = img.shape[:2]
+    scale = min(width / w, height / h)
+    if scale < 1:
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(img)
+
+
+def draw_overlay(img, lines):
+    """Draws ``lines`` of text in the top-left corner of ``img``, in place."""
+    import cv2
+
+    for i, text in enumerate(lines):
+        origin = (8, 18 + 16 * i)
+        cv2.putText(img, text, origin, cv2.FONT_HERSHEY_PLAIN, 1.0, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(img, text, origin, cv2.FONT_HERSHEY_PLAIN, 1.0, (0, 255, 0), 1, cv2.LINE_AA)
+
+
+class PreviewMailbox:
+    """Rate-limited hand-off of preview frames to the GUI.
+
+    ``on_ready`` is called from the mailbox thread when a new frame can be
+    fetched with take(). It is not called again until take() has been called,
+    so a slow GUI never accumulates queued preview events.
+
+    ``metrics`` (a frame_stats.FrameStats) gets the 'preview' stage time;
+    ``overlay``, if set, is a callable returning text lines to draw on top.
+    """
+
+    def __init__(self, on_ready, fps=PREVIEW_FPS, size=(640, 480), metrics=None, overlay=None):
+        self.on_ready = on_ready
+        self.fps = fps
+        self.size = size
+        self.metrics = metrics
+        self.overlay = overlay
+        self.enabled = True
+        self.dropped = 0
+
+        self._inbox = LatestQueue(1)
+        self._lock = threading.Lock()
+        self._ready = None
+        self._pending = False
+        self._next_due = 0.0
+        self._thread = threading.Thread(target=self._run, name="preview", daemon=True)
+        self._thread.start()
+
+    def post(self, img, code=None):
+        """Offers a frame for preview. Cheap when the frame is not used.
+
+        Frames that are not BGR pass the cv2.cvtColor ``code`` that converts
+        them (e.g. COLOR_YUV2BGR_I420); that conversion then also happens on
+        the mailbox thread, and only for frames that are actually shown.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now < self._next_due:
+            self.dropped += 1
+            return
+        self._next_due = now + 1.0 / self.fps
+        self._inbox.put((img, code))
+
+    def take(self):
+        with self._lock:
+            img, self._ready = self._ready, None
+            self._pending = False
+        return img
+
+    def clear(self):
+        with self._lock:
+            self._ready = None
+
+    def close(self):
+        self._inbox.close()
+
+    def _run(self):
+        while True:
+            item = self._inbox.get()
+            if item is None:
+                if self._inbox.closed:
+                    return
+                continue
+            img, code = item
+            start = time.perf_counter()
+            if code is not None:
+                import cv2
+                img = cv2.cvtColor(img, code)
+            width, height = self.size
+            small = fit_frame(img, width, height)
+            if self.overlay is not None:
+                if small is img and code is None:
+                    small = small.copy()  # still the receiver's frame
+                draw_overlay(small, self.overlay())
+            if self.metrics is not None:
+                self.metrics.observe('preview', time.perf_counter() - start)
+
+            with self._lock:
+                self._ready = small
+                notify = not self._pending
+                self._pending = True
+            if notify:
+                self.on_ready()
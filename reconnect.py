@@ -0,0 +1,164 @@
+"""
+Reconnecting without losing the virtual camera.
+
+When the phone goes away (cable pulled, app closed, Wi-Fi gone) the
+receivers keep trying to get it back on their own, and the camera that
+video-call apps are using stays open the whole time:
+
+    KeepAliveSink   (vcam_sinks) stays open between sessions and shows the
+                    last frame, darkened, with "Reconnecting..." meanwhile
+    Backoff         delays between attempts, from 50 ms doubling up to
+                    500 ms, so a phone that comes back is streaming again
+                    within about half a second
+    UsbReconnector  adb forward + connect + UsbPipeline in a loop, keeping
+                    the sink and any ConvertPool across sessions; a
+                    connection that delivers nothing for STALL_TIMEOUT
+                    seconds counts as dropped. While adb reports no phone
+                    it sleeps until one is plugged in (adb_client's
+                    DeviceWatcher) instead of retrying
+
+WirelessReceiver.run() does the same for WebRTC.
+"""
+
+import logging
+import socket
+import threading
+
+STALL_TIMEOUT = 3.0
+
+log = logging.getLogger("webcamo.usb")
+
+
+class Backoff:
+    """Delays between attempts: ``initial`` seconds, times ``factor`` after
+    every failure, at most ``maximum``; reset() once a session worked."""
+
+    def __init__(self, initial=0.05, maximum=0.5, factor=2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self._delay = initial
+
+    def next(self):
+        delay = self._delay
+        self._delay = min(self.maximum, delay * self.factor)
+        return delay
+
+    def reset(self):
+        self._delay = self.initial
+        return self._delay
+
+
+class UsbReconnector:
+    """Streams one USB phone until stop(), reconnecting whenever it drops.
+
+    ``sink`` stays open across sessions (wrapped in a KeepAliveSink unless
+    it is one); a sink passed in is left open at the end for its owner to
+    shutdown(), one created here (from the default spec) is closed. With
+    ``convert_workers`` one ConvertPool serves every session. Other keyword
+    arguments go to each UsbPipeline. ``sessions`` counts connections that
+    delivered frames.
+    """
+
+    def __init__(self, host, port, serial=None, adb=True, sink=None, convert_workers=0,
+                 backoff=None, stall_timeout=STALL_TIMEOUT, **options):
+        self.host = host
+        self.port = port
+        self.serial = serial
+        self.adb = adb
+        self.sink = sink
+        self._owns_sink = sink is None
+        self.convert_workers = convert_workers
+        self.backoff = backoff or Backoff()
+        self.stall_timeout = stall_timeout
+        self.options = options
+        self.sessions = 0
+        self.sock = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def stop(self):
+        self._stop.set()
+        watcher = self._watcher
+        if watcher is not None:
+            watcher.stop()
+        with self._lock:
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def run(self):
+        from usb_pipeline import adb_forward, connect_device
+        from vcam_sinks import KeepAliveSink, create_sink
+
+        if self.sink is None:
+            self.sink = create_sink()
+        if not isinstance(self.sink, KeepAliveSink):
+            self.sink = KeepAliveSink(self.sink)
+        pool = None
+        if self.convert_workers:
+            from convert_pool import ConvertPool
+            pool = ConvertPool(self.convert_workers)
+        if self.adb:
+            from adb_client import DeviceWatcher
+            self._watcher = DeviceWatcher(self.serial).start()
+        try:
+            retrying = False  # failed attempts are logged once, then at DEBUG
+            while not self._stop.is_set():
+                streamed = False
+                if not self.adb or adb_forward(self.port, serial=self.serial, quiet=retrying):
+                    sock = connect_device(self.host, self.port, quiet=retrying)
+                    if sock is not None:
+                        streamed = self._stream(sock, pool)
+                if self._stop.is_set():
+                    break
+                if streamed:
+                    log.warning("USB: phone disconnected, reconnecting...")
+                    delay = self.backoff.reset()
+                    retrying = False
+                else:
+                    if not retrying:
+                        log.info("USB: waiting for the phone...")
+                    delay = self.backoff.next()
+                    retrying = True
+                watcher = self._watcher
+                if watcher is not None and watcher.tracking and not watcher.is_online():
+                    watcher.wait_for_device()  # returns on stop() too
+                else:
+                    self._stop.wait(delay)
+        finally:
+            if self._watcher is not None:
+                self._watcher.stop()
+            if pool is not None:
+                pool.close()
+            if self._owns_sink:
+                self.sink.shutdown()
+
+    def _stream(self, sock, pool):
+        """Runs one UsbPipeline on ``sock``; True if it received frames."""
+        from usb_pipeline import UsbPipeline
+
+        with self._lock:
+            if self._stop.is_set():
+                sock.close()
+                return False
+            self.sock = sock
+        sock.settimeout(self.stall_timeout)
+        pipeline = None
+        try:
+            pipeline = UsbPipeline(sock, sink=self.sink, pool=pool, **self.options)
+            pipeline.run()
+        except OSError as e:
+            if not self._stop.is_set():
+                log.warning(f"USB: connection lost ({e or type(e).__name__})")
+        finally:
+            with self._lock:
+                self.sock = None
+            sock.close()
+        if pipeline is not None and pipeline.received:
+            self.sessions += 1
+            return True
+        return False
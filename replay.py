@@ -0,0 +1,223 @@
+"""
+Replaying a recording as if it came from the phone.
+
+    python headless_receiver.py --mode usb --record phone.wcap      # record, then:
+    python headless_receiver.py --mode file --input phone.wcap --sink null
+    python headless_receiver.py --mode file --input capture.y4m --no-realtime
+    python bench_receiver.py --replay phone.wcap
+
+The sources here emit into the same FrameGraph the receivers use:
+
+    CaptureSource  a capture (see capture.py): raw USB packets become the
+                   same FMT_PACKET frames UsbSource emits (odd strides,
+                   padding and front/back switches included), H.264 chunks
+                   go through the decoder again, WebRTC frames come back as
+                   I420
+    Y4mSource      a Y4M file, e.g. from the file: sink
+
+With ``realtime`` frames come out with the spacing they were received with
+(``start`` seconds in, for a capture). Without, each frame waits until the
+graph is done with the previous one (see FrameSource.frame_done), like TCP
+backpressure: as fast as the slowest stage goes, sink included, but no
+frame is dropped on the way, so runs repeat.
+open_source() picks the source from the file's first bytes.
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+from capture import CAPTURE_MAGIC, I420_MIRROR, KIND_H264, KIND_RAW, CaptureReader
+from frame_graph import FMT_AV, FMT_I420, FMT_PACKET, Frame, FrameSource
+from usb_pipeline import usb_orientation
+from usb_protocol import H264_END_OF_FRAME, H264_FRONT
+
+Y4M_MAGIC = b'YUV4MPEG2'
+Y4M_FRAME = b'FRAME'
+
+
+def parse_y4m_header(line):
+    """(width, height, fps) from a Y4M stream header line."""
+    tags = line.split()
+    if not tags or tags[0] != Y4M_MAGIC:
+        raise ValueError("not a Y4M file")
+    width = height = None
+    fps = 30.0
+    for tag in tags[1:]:
+        key, value = tag[:1], tag[1:].decode('ascii')
+        if key == b'W':
+            width = int(value)
+        elif key == b'H':
+            height = int(value)
+        elif key == b'F':
+            num, _, den = value.partition(':')
+            fps = int(num) / int(den or 1)
+        elif key == b'C' and not value.startswith('420'):
+            raise ValueError(f"unsupported Y4M colour space {value} (only 4:2:0)")
+    if not width or not height:
+        raise ValueError("Y4M header without W or H")
+    return width, height, fps
+
+
+def open_source(path, realtime=True, start=0.0):
+    """CaptureSource or Y4mSource for ``path``; ValueError if it is neither."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(CAPTURE_MAGIC))
+    if magic == CAPTURE_MAGIC:
+        return CaptureSource(path, realtime, start)
+    return Y4mSource(path, realtime)
+
+
+class ReplaySource(FrameSource):
+    """Timing shared by the file sources: subclasses call _wait(offset)
+    for every record and _emit() for every frame (see the module
+    docstring); both return False once closed. _finish() at the end of the
+    file holds run() until the last frame is through."""
+
+    def __init__(self, realtime=True):
+        self.realtime = realtime
+        self.frames = 0
+        self._closing = threading.Event()
+        self._done = threading.Event()
+        self._done.set()
+        self._clock = None
+
+    def close(self):
+        self._closing.set()
+        self._done.set()
+
+    def frame_done(self):
+        self._done.set()
+
+    def stats(self):
+        return {'frames_read': self.frames}
+
+    def describe(self):
+        return self.path
+
+    def _wait(self, offset):
+        """Realtime: sleeps until ``offset`` seconds into the replay."""
+        if self._clock is None:
+            self._clock = time.perf_counter() - offset
+        if self.realtime:
+            delay = self._clock + offset - time.perf_counter()
+            if delay > 0:
+                self._closing.wait(delay)
+        return not self._closing.is_set()
+
+    def _emit(self, emit, data, fmt, width, height, captured=None, rotate=0, mirror=False):
+        """Otherwise the graph has to be done with the previous frame first."""
+        if not self.realtime:
+            self._done.wait()
+        if self._closing.is_set():
+            return False
+        self.frames += 1
+        self._done.clear()
+        emit(Frame(data, fmt, width, height, self.frames, time.perf_counter(), captured, rotate, mirror))
+        return True
+
+    def _finish(self):
+        """Otherwise waits for the last frame too: the graph drops what is
+        still queued when run() returns."""
+        if not self.realtime:
+            self._done.wait()
+
+
+class Y4mSource(ReplaySource):
+    """Emits the frames of the Y4M file at ``path`` as FMT_I420."""
+
+    name = 'file'
+
+    def __init__(self, path, realtime=True):
+        super().__init__(realtime)
+        self.path = path
+        with open(path, 'rb') as f:
+            self.width, self.height, self.fps = parse_y4m_header(f.readline())
+
+    def describe(self):
+        return f"{self.path}: {self.width}x{self.height} at {self.fps:g} fps"
+
+    def run(self, emit):
+        shape = (self.height * 3 // 2, self.width)
+        size = shape[0] * shape[1]
+        with open(self.path, 'rb') as f:
+            f.readline()
+            while True:
+                line = f.readline()
+                if not line.startswith(Y4M_FRAME):
+                    break  # end of file (or trailing garbage)
+                img = np.empty(shape, dtype=np.uint8)
+                if f.readinto(img.data) != size:
+                    break  # truncated last frame
+                offset = self.frames / self.fps
+                if not self._wait(offset) or not self._emit(
+                        emit, img, FMT_I420, self.width, self.height,
+                        captured=self._clock + offset if self.realtime else None):
+                    break
+        self._finish()
+
+
+class CaptureSource(ReplaySource):
+    """Emits a capture's records the way the receiver that recorded them
+    did, straight out of the memory map."""
+
+    name = 'capture'
+
+    def __init__(self, path, realtime=True, start=0.0):
+        super().__init__(realtime)
+        self.path = path
+        self.start = start
+        self.reader = CaptureReader(path)
+        self.decoder = None
+        index = self.reader.index
+        frames = int((index['kind'] != KIND_H264).sum())  # H.264 records are chunks, not frames
+        self.fps = round((frames - 1) / self.reader.duration) if frames > 1 and self.reader.duration else 30
+
+    def describe(self):
+        return f"{self.path}: {len(self.reader)} records, {self.reader.duration:.1f} s"
+
+    def run(self, emit):
+        reader, index = self.reader, self.reader.index
+        try:
+            for i in range(reader.find(self.start), len(index)):
+                entry = index[i]
+                received = float(entry['received'])
+                if not self._wait(received):
+                    break
+                # Keeps the capture -> receive delay of the recording
+                captured = float(entry['captured'])
+                captured = None if math.isnan(captured) else time.perf_counter() - (received - captured)
+                kind, flags = int(entry['kind']), int(entry['flags'])
+                if kind == KIND_RAW:
+                    packet = reader.packet(i, time.perf_counter(), captured)
+                    meta = packet.meta
+                    emitted = self._emit(emit, packet, FMT_PACKET, meta.width, meta.height, captured,
+                                         *usb_orientation(meta.is_front))
+                elif kind == KIND_H264:
+                    emitted = self._decode(emit, reader.payload(i), bool(flags & H264_END_OF_FRAME),
+                                           usb_orientation(flags & H264_FRONT), captured)
+                else:
+                    width, height = int(entry['width']), int(entry['height'])
+                    img = np.frombuffer(reader.payload(i), dtype=np.uint8).reshape((height * 3 // 2, width))
+                    emitted = self._emit(emit, img, FMT_I420, width, height, captured,
+                                         mirror=bool(flags & I420_MIRROR))
+                if not emitted:
+                    break
+            self._finish()
+        finally:
+            reader.close()
+
+    def _decode(self, emit, data, end_of_frame, orientation, captured):
+        if self.decoder is None:
+            from h264_decode import H264Decoder
+            self.decoder = H264Decoder()
+        for frame in self.decoder.decode(data, end_of_frame):
+            if not self._emit(emit, frame, FMT_AV, frame.width, frame.height, captured, *orientation):
+                return False
+        return True
+
+    def stats(self):
+        errors = self.decoder.errors if self.decoder is not None else 0
+        return {**super().stats(), 'decode_errors': errors}
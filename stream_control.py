@@ -0,0 +1,104 @@
+"""
+Adaptive stream quality over the USB back-channel.
+
+A v2 sender that answers with CAP_CONTROL takes StreamConfig messages (see
+usb_protocol): a crop of the camera frame, the size to scale it to and a
+frame rate. UsbPipeline asks for the same square it would otherwise cut out
+of the full frame, so the rest of the frame never crosses the cable, and
+keeps its own output size fixed whatever the phone sends.
+
+QualityController then picks the requested size and rate from
+QUALITY_STEPS by watching the receiver itself, once per WINDOW seconds:
+
+    down  more than DROP_LIMIT of the frames dropped in front of convert or
+          the sink, or convert p90 above BUSY of the frame interval
+    up    no drops, and the convert time scaled to the next step's frame
+          size fits in IDLE of its frame interval, for UP_AFTER seconds
+"""
+
+import threading
+import time
+
+# (side, fps), best first
+QUALITY_STEPS = ((1080, 30), (720, 30), (720, 24), (540, 24), (480, 20), (360, 15))
+WINDOW = 2.0
+UP_AFTER = 10.0
+DROP_LIMIT = 0.1
+BUSY = 0.8
+IDLE = 0.5
+
+
+def _pixel_rate(step):
+    side, fps = step
+    return side * side * fps
+
+
+class QualityController:
+    """Steps between ``max_side`` x ``max_fps`` and the smaller QUALITY_STEPS.
+
+    observe() and dropped() may be called from any thread; update() returns
+    the new (side, fps) when the step changes, else None.
+    """
+
+    def __init__(self, max_side, max_fps=30, steps=QUALITY_STEPS, clock=time.monotonic):
+        top = (max_side, max_fps)
+        lower = {s for s in steps if s[0] <= max_side and s[1] <= max_fps and _pixel_rate(s) < _pixel_rate(top)}
+        self.steps = [top] + sorted(lower, key=_pixel_rate, reverse=True)
+        self.level = 0
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._window_start = clock()
+        self._frames = 0
+        self._drops = 0
+        self._convert = []
+        self._idle_since = None
+
+    @property
+    def step(self):
+        return self.steps[self.level]
+
+    def observe(self, convert_time):
+        with self._lock:
+            self._frames += 1
+            self._convert.append(convert_time)
+
+    def dropped(self, n=1):
+        with self._lock:
+            self._drops += n
+
+    def update(self):
+        now = self.clock()
+        with self._lock:
+            if now - self._window_start < WINDOW:
+                return None
+            frames, drops, convert = self._frames, self._drops, sorted(self._convert)
+            self._window_start = now
+            self._frames = self._drops = 0
+            self._convert = []
+        if not frames and not drops:
+            return None
+
+        p90 = convert[min(len(convert) - 1, int(0.9 * len(convert)))] if convert else 0.0
+        interval = 1.0 / self.step[1]
+        if drops > DROP_LIMIT * (frames + drops) or p90 > BUSY * interval:
+            self._idle_since = None
+            if self.level + 1 < len(self.steps):
+                self.level += 1
+                return self.step
+            return None
+
+        if drops or self.level == 0:
+            self._idle_since = None
+            return None
+        up = self.steps[self.level - 1]
+        # Per-frame cost scales with the pixels per frame
+        if p90 * (up[0] / self.step[0]) ** 2 > IDLE / up[1]:
+            self._idle_since = None
+            return None
+        if self._idle_since is None:
+            self._idle_since = now
+        if now - self._idle_since < UP_AFTER:
+            return None
+        self._idle_since = None
+        self.level -= 1
+        return self.step
@@ -0,0 +1,198 @@
+"""
+adb_client against phone_emulator.FakeAdbServer:
+
+    python -m pytest test_adb_client.py
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from adb_client import AdbClient, AdbError, DeviceWatcher
+from phone_emulator import FakeAdbServer
+
+
+def _client(server):
+    return AdbClient(port=server.port, start_server=False)
+
+
+async def _serving(devices=None):
+    return await FakeAdbServer(devices=devices).start()
+
+
+def test_devices():
+    async def run():
+        server = await _serving({'R58M1234XYZ': 'device', 'emulator-5554': 'unauthorized'})
+        try:
+            assert await _client(server).devices() == [('R58M1234XYZ', 'device'),
+                                                       ('emulator-5554', 'unauthorized')]
+            server.devices.clear()
+            assert await _client(server).devices() == []
+        finally:
+            await server.stop()
+        assert server.requests == ['host:devices', 'host:devices']
+
+    asyncio.run(run())
+
+
+def test_no_server():
+    async def run():
+        server = await _serving()
+        await server.stop()
+        with pytest.raises(AdbError, match="no adb server"):
+            await _client(server).devices()
+
+    asyncio.run(run())
+
+
+def test_track_devices():
+    async def run():
+        server = await _serving()
+        tracker = _client(server).track_devices()
+        try:
+            assert await tracker.__anext__() == []
+            server.set_device('R58M1234XYZ', 'unauthorized')
+            assert await tracker.__anext__() == [('R58M1234XYZ', 'unauthorized')]
+            server.set_device('R58M1234XYZ')
+            assert await tracker.__anext__() == [('R58M1234XYZ', 'device')]
+            server.remove_device('R58M1234XYZ')
+            assert await tracker.__anext__() == []
+            await server.stop()
+            with pytest.raises(AdbError, match="closed the connection"):
+                await tracker.__anext__()
+        finally:
+            await tracker.aclose()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_forward():
+    async def run():
+        server = await _serving({'R58M1234XYZ': 'device'})
+        try:
+            await _client(server).forward(23233, 23233)
+            await _client(server).forward(23234, 23233, serial='R58M1234XYZ')
+            assert server.forwards == [('R58M1234XYZ', 'tcp:23233', 'tcp:23233'),
+                                       ('R58M1234XYZ', 'tcp:23234', 'tcp:23233')]
+            assert server.requests[1] == 'host-serial:R58M1234XYZ:forward:tcp:23234;tcp:23233'
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_forward_fails():
+    async def run():
+        server = await _serving({'R58M1234XYZ': 'device', 'R58M0000ABC': 'offline'})
+        try:
+            with pytest.raises(AdbError, match="device 'SOMEONE-ELSE' not found"):
+                await _client(server).forward(23233, 23233, serial='SOMEONE-ELSE')
+            with pytest.raises(AdbError, match="device 'R58M0000ABC' not found"):
+                await _client(server).forward(23233, 23233, serial='R58M0000ABC')
+            # The device is found (first OKAY), the forward itself fails
+            server.forward_error = "cannot bind listener: Address already in use"
+            with pytest.raises(AdbError, match="cannot bind listener"):
+                await _client(server).forward(23233, 23233)
+            assert server.forwards == []
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_forward_needs_second_okay():
+    async def run():
+        async def found_then_gone(reader, writer):
+            await reader.readexactly(int(await reader.readexactly(4), 16))
+            writer.write(b'OKAY')
+            writer.close()
+
+        server = await asyncio.start_server(found_then_gone, '127.0.0.1', 0)
+        client = AdbClient(port=server.sockets[0].getsockname()[1], start_server=False)
+        try:
+            with pytest.raises(AdbError, match="closed the connection"):
+                await client.forward(23233, 23233)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def _eventually(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class _ServerThread:
+    """A FakeAdbServer on its own loop, for the threaded DeviceWatcher."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = self.call(_serving())
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(5)
+
+    def plug(self, serial, state='device'):
+        self.loop.call_soon_threadsafe(self.server.set_device, serial, state)
+
+    def unplug(self, serial):
+        self.loop.call_soon_threadsafe(self.server.remove_device, serial)
+
+    def close(self):
+        self.call(self.server.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+
+def test_device_watcher_plug_and_unplug():
+    adb = _ServerThread()
+    changes = []
+    watcher = DeviceWatcher('R58M1234XYZ', client=_client(adb.server), on_change=changes.append,
+                            retry=0.05).start()
+    try:
+        assert _eventually(lambda: watcher.tracking)
+        assert not watcher.wait_for_device(timeout=0.2)
+
+        adb.plug('OTHER-PHONE')
+        adb.plug('R58M1234XYZ', 'unauthorized')
+        assert not watcher.wait_for_device(timeout=0.2)
+        adb.plug('R58M1234XYZ')
+        assert watcher.wait_for_device(timeout=5)
+        assert watcher.devices == {'OTHER-PHONE': 'device', 'R58M1234XYZ': 'device'}
+
+        adb.unplug('R58M1234XYZ')
+        assert _eventually(lambda: not watcher.is_online())
+        assert changes[-1] == {'OTHER-PHONE': 'device'}
+        assert {'OTHER-PHONE': 'device', 'R58M1234XYZ': 'unauthorized'} in changes
+    finally:
+        watcher.stop()
+        adb.close()
+
+
+def test_device_watcher_loses_server():
+    adb = _ServerThread()
+    watcher = DeviceWatcher(client=_client(adb.server), retry=0.05).start()
+    try:
+        assert _eventually(lambda: watcher.tracking)
+        adb.plug('R58M1234XYZ')
+        assert watcher.wait_for_device(timeout=5)
+        adb.call(adb.server.stop())
+        # Tracking is lost: the device list is emptied and waiting returns
+        assert _eventually(lambda: not watcher.tracking)
+        assert watcher.devices == {}
+        assert not watcher.wait_for_device(timeout=5)
+    finally:
+        watcher.stop()
+        adb.close()
@@ -0,0 +1,42 @@
+"""
+Device specs and the per-device sinks of devices.py:
+
+    python -m pytest test_devices.py
+"""
+
+import pytest
+
+from devices import USB_PORT, WIRELESS_PORT, device_sink, parse_devices, parse_devices_or_first
+
+
+def test_parse_devices():
+    usb, wireless, pinned = parse_devices(['R58M1234XYZ', 'wifi:192.168.1.21:8081', 'usb:emulator-5554@23233'],
+                                          sink='shm')
+    assert (usb.kind, usb.address, usb.port, usb.sink) == ('usb', 'R58M1234XYZ', USB_PORT + 1, 'shm')
+    assert (wireless.kind, wireless.address, wireless.port) == ('wireless', '192.168.1.21', 8081)
+    assert wireless.sink == 'shm:webcamo-1'
+    assert (pinned.port, pinned.sink) == (USB_PORT, 'shm:webcamo-2')
+
+
+def test_device_sink():
+    assert device_sink('v4l2loopback:/dev/video3', 0) == 'v4l2loopback:/dev/video3'
+    assert device_sink('file:out.y4m', 2) == 'file:out-2.y4m'
+    assert device_sink('unitycapture', 1) == 'unitycapture:Unity Video Capture #2'
+    with pytest.raises(ValueError):
+        device_sink('v4l2loopback:/dev/video3', 1)
+
+
+def test_parse_devices_or_first():
+    devices, error = parse_devices_or_first(['192.168.1.20', '192.168.1.21=shm'], sink='obs')
+    assert error is None and [d.sink for d in devices] == ['obs', 'shm']
+
+    # The second phone has no camera of its own: the first still streams
+    devices, error = parse_devices_or_first(['R58M1234XYZ=file:a.y4m', '192.168.1.21'], sink='obs')
+    assert isinstance(error, ValueError)
+    assert [(d.address, d.port, d.sink) for d in devices] == [('R58M1234XYZ', USB_PORT, 'file:a.y4m')]
+
+    devices, error = parse_devices_or_first(['192.168.1.20', 'usb:R58M@x'])
+    assert error is not None and [(d.address, d.port) for d in devices] == [('192.168.1.20', WIRELESS_PORT)]
+
+    assert parse_devices_or_first(['usb:'])[0] == []
+    assert parse_devices_or_first([]) == ([], None)
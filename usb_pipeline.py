@@ -0,0 +1,287 @@
+"""
+USB receive pipeline: receive -> convert -> sink, each on its own thread.
+
+    receive   UsbSource: PacketReader on the caller's thread (the USB
+              QThread); H.264 packets are decoded here too, as no packet
+              may be skipped
+    convert   square crop and rotation for the camera facing, then YUV -> BGR
+              (with convert_workers, handed to a convert_pool.ConvertPool and
+              collected in order by a fourth thread)
+    sink      send to the configured Sink (see vcam_sinks) and the preview
+              callback; with ``pace``, through a Pacer thread that keeps the
+              virtual camera at a constant frame rate
+
+Convert and sink are the frame_graph.FrameGraph every receiver uses. The
+stages are joined by LatestQueues, so if conversion or the virtual
+camera falls behind, frames are dropped (and counted) instead of queueing
+up behind the socket. A phone that takes stream control (see stream_control)
+is asked for just the output square, and with ``adaptive`` the requested
+size and rate follow those drops and the conversion time.
+
+adb_forward / connect_device hold the connection setup shared by the GUI
+worker and the headless receiver.
+"""
+
+import importlib.util
+import logging
+import socket
+import time
+
+from frame_geometry import GeometryPlan
+from frame_graph import FMT_AV, FMT_PACKET, Frame, FrameGraph, FrameSource
+from frame_stats import FrameStats
+from stream_control import QualityController
+from usb_protocol import CAP_CONTROL, CAP_H264, EncodedPacket, ProtocolError, PacketReader, StreamConfig
+from vcam_sinks import create_sink
+
+
+USB_HOST = '127.0.0.1'
+USB_PORT = 23233
+
+log = logging.getLogger("webcamo.usb")
+
+
+def adb_forward(port=USB_PORT, serial=None, quiet=False):
+    """'adb [-s <serial>] forward tcp:<port> tcp:23233', through the adb
+    server (see adb_client). Returns True on success. ``quiet`` logs at
+    DEBUG, for retries."""
+    import asyncio
+
+    from adb_client import AdbClient, AdbError
+
+    info, error = (logging.DEBUG, logging.DEBUG) if quiet else (logging.INFO, logging.ERROR)
+    try:
+        asyncio.run(AdbClient().forward(port, USB_PORT, serial=serial))
+        log.log(info, f"ADB forward successful{f' ({serial} on {port})' if serial else ''}.")
+        return True
+    except AdbError as e:
+        log.log(error, f"Error running ADB forward: {e}")
+        log.log(error, "Make sure your phone is connected and USB debugging is enabled.")
+    return False
+
+
+def connect_device(host=USB_HOST, port=USB_PORT, quiet=False):
+    """Connects to the phone's stream server. Returns the socket or None.
+    ``quiet`` logs at DEBUG, for retries."""
+    info, error = (logging.DEBUG, logging.DEBUG) if quiet else (logging.INFO, logging.ERROR)
+    log.log(info, f"Connecting to adb device at {port}")
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.connect((host, port))
+    except OSError:
+        s.close()
+        log.log(error, "Connection failed. Check if the app is streaming.")
+        return None
+    log.log(info, "Connected to phone!")
+    return s
+
+
+def usb_orientation(is_front):
+    """(rotate, mirror) that turn a sensor frame upright; the front camera is
+    also mirrored."""
+    return (270, True) if is_front else (90, False)
+
+
+def usb_geometry(width, height, is_front, size=None):
+    """Square crop, rotated upright (see usb_orientation)."""
+    return GeometryPlan(width, height, *usb_orientation(is_front), size=size)
+
+
+class UsbSource(FrameSource):
+    """Frames from a phone connected on ``sock``: raw (FMT_PACKET, in the
+    PacketReader's pooled buffers) or decoded H.264 (FMT_AV), oriented for
+    the camera facing.
+
+    ``h264`` offers the phone the H.264 transport if PyAV is installed. A
+    phone that takes stream control is asked for the square the graph
+    keeps, at ``size`` (None: its short side) and ``fps`` (None: 30); with
+    ``adaptive`` QualityController steps size and rate with the drops and
+    conversion times the graph reports. With ``record`` (a
+    capture.CaptureWriter) every packet is also queued for it as received.
+    """
+
+    name = 'usb'
+
+    def __init__(self, sock, size=None, fps=None, adaptive=True, h264=True, pool_size=4, metrics=None,
+                 record=None):
+        self.sock = sock
+        self.record = record
+        self.size = size
+        self.fps = fps
+        self.adaptive = adaptive
+        self.metrics = metrics if metrics is not None else FrameStats()
+        self.quality = None
+        self._crop = None
+        # find_spec, not import: PyAV stays unloaded unless H.264 arrives.
+        h264 = h264 and importlib.util.find_spec('av') is not None
+        self.reader = PacketReader(sock, pool_size=pool_size,
+                                   capabilities=CAP_CONTROL | (CAP_H264 if h264 else 0))
+        self.decoder = None
+        self.cpu_time = 0.0
+        self._lost = self._resyncs = 0
+
+    def run(self, emit):
+        cpu_start = time.thread_time()
+        metrics = self.metrics
+        try:
+            while True:
+                waiting = time.perf_counter()
+                received_bytes = self.reader.bytes_received
+                try:
+                    packet = self.reader.read()
+                except ProtocolError as e:
+                    log.error(str(e))
+                    break
+                if packet is None:
+                    break
+                if self.reader.packets == 1:
+                    log.info(f"USB: protocol v{self.reader.version}")
+                self._count_transport_errors()
+                metrics.observe('recv', packet.header_at - waiting)
+                metrics.observe('reassembly', packet.received_at - packet.header_at)
+                metrics.count('bytes_received', self.reader.bytes_received - received_bytes)
+                if self.record is not None:
+                    self.record.write_packet(packet)
+                if isinstance(packet, EncodedPacket):
+                    self._decode(packet, emit)
+                else:
+                    if self._crop is None and self.reader.accepts_control:
+                        self._start_control(packet.meta)
+                    elif self.quality:
+                        self._adapt()
+                    meta = packet.meta
+                    emit(Frame(packet, FMT_PACKET, meta.width, meta.height, packet.seq, packet.received_at,
+                               packet.captured_at, *usb_orientation(meta.is_front), release=packet.release))
+        finally:
+            self.cpu_time = time.thread_time() - cpu_start
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def frame_converted(self, elapsed):
+        if self.quality:
+            self.quality.observe(elapsed)
+
+    def frame_dropped(self):
+        if self.quality:
+            self.quality.dropped()
+
+    def stats(self):
+        return {
+            'lost': self.reader.lost,
+            'resyncs': self.reader.resyncs,
+            'buffer_allocations': self.reader.allocations,
+            'cpu_receive': self.cpu_time,
+        }
+
+    def _start_control(self, meta):
+        """Asks the phone for the square the geometry would crop, at the
+        output size."""
+        x, y, side = usb_geometry(meta.width, meta.height, meta.is_front).crop
+        self._crop = (x / meta.width, y / meta.height, side / meta.width, side / meta.height)
+        side = min(self.size or side, side)
+        fps = self.fps or 30
+        if self.adaptive:
+            self.quality = QualityController(side, fps)
+        self._request(side, fps)
+
+    def _adapt(self):
+        step = self.quality.update()
+        if step is not None:
+            self._request(*step)
+
+    def _request(self, side, fps):
+        if self.reader.send_config(StreamConfig(self._crop, side, side, fps)):
+            log.info(f"USB: asking the phone for {side}x{side} at {fps} fps")
+            self.metrics.gauge('requested_side', lambda: side)
+            self.metrics.gauge('requested_fps', lambda: fps)
+
+    def _decode(self, packet, emit):
+        if self.decoder is None:
+            from h264_decode import H264Decoder
+            self.decoder = H264Decoder()
+            log.info("USB: receiving H.264")
+        start = time.perf_counter()
+        frames = self.decoder.decode(packet.data, packet.end_of_frame)
+        decoded_at = time.perf_counter()
+        self.metrics.observe('decode', decoded_at - start)
+        for frame in frames:
+            emit(Frame(frame, FMT_AV, frame.width, frame.height, packet.seq, decoded_at, packet.captured_at,
+                       *usb_orientation(packet.is_front)))
+
+    def _count_transport_errors(self):
+        lost, resyncs = self.reader.lost, self.reader.resyncs
+        if lost != self._lost:
+            self.metrics.count('frames_lost', lost - self._lost)
+            self._lost = lost
+        if resyncs != self._resyncs:
+            self.metrics.count('resyncs', resyncs - self._resyncs)
+            self._resyncs = resyncs
+            log.warning(f"USB: stream corrupted, resynced ({resyncs} so far)")
+
+
+class UsbPipeline:
+    """Runs one connected USB stream until the socket closes: a UsbSource
+    into a FrameGraph.
+
+    ``on_frame(img, code)`` receives every frame that reached the sink
+    stage, from the sink thread (see FrameGraph); status messages go to the
+    "webcamo.usb" logger. ``size`` scales the square output; None keeps the
+    sensor's short side. ``sink`` defaults to create_sink() and is closed
+    when the stream ends. ``on_timing`` receives a FrameTiming for every
+    frame that reached the sink. Stage timings and counters go to
+    ``metrics`` (a frame_stats.FrameStats). ``h264`` offers the phone the
+    H.264 transport if PyAV is installed. ``convert_workers`` > 0 converts
+    raw frames in that many processes; ``pool`` uses an existing
+    ConvertPool instead and leaves it running. ``fps`` caps the rate asked
+    of a phone that takes stream control (None: 30); ``adaptive`` lets
+    QualityController lower and raise size and rate. ``pace`` sends to the
+    sink at exactly that rate through a Pacer, repeating or dropping
+    frames; otherwise frames go out as they arrive. ``record`` tees the
+    packets into a capture.CaptureWriter, left open for its owner.
+    """
+
+    def __init__(self, sock, on_frame=None, queue_size=1, size=None, sink=None,
+                 on_timing=None, metrics=None, h264=True, convert_workers=0, fps=None, adaptive=True,
+                 pace=True, pool=None, record=None):
+        self.metrics = metrics if metrics is not None else FrameStats()
+        self.source = UsbSource(sock, size=size, fps=fps, adaptive=adaptive, h264=h264,
+                                pool_size=queue_size + 3, metrics=self.metrics, record=record)
+        self.reader = self.source.reader
+        self.sink = sink if sink is not None else create_sink()
+        self.pool = pool
+        self._owns_pool = pool is None and bool(convert_workers)
+        if self._owns_pool:
+            from convert_pool import ConvertPool
+            self.pool = ConvertPool(convert_workers)
+        self.graph = FrameGraph(self.source, self.sink, size=size, on_frame=on_frame, on_timing=on_timing,
+                                metrics=self.metrics, queue_size=queue_size, pool=self.pool, pace=pace,
+                                fps=fps or 30, name='usb', logger=log)
+
+    @property
+    def received(self):
+        return self.graph.received
+
+    def run(self):
+        try:
+            self.graph.run()
+        finally:
+            if self._owns_pool:
+                self.pool.close()
+            log.info(self.summary())
+
+    def stats(self):
+        return self.graph.stats()
+
+    def summary(self):
+        st = self.stats()
+        text = (f"USB: {st['received']} frames received, {st['sent']} sent, "
+                f"dropped {st['dropped_convert']} before convert / {st['dropped_sink']} before sink")
+        if self.graph.pacer:
+            text += f" / {st['dropped_pacer']} by the pacer, {st['repeated']} repeated"
+        if self.reader.version and self.reader.version >= 2:
+            text += f", {st['lost']} lost in transit, {st['resyncs']} resyncs"
+        return text
@@ -0,0 +1,468 @@
+"""
+Wire format of the USB stream sent by lib/views/usb/usb_streaming_page.dart.
+
+Every packet starts with a type byte and a big-endian u32 payload size. A
+video packet (type 0x00) then carries 41 bytes of metadata followed by the
+raw Y, U and V planes of the Android YUV_420_888 image:
+
+    Width(4), Height(4), YLen(4), ULen(4), VLen(4),
+    YStride(4), UStride(4), VStride(4), UPixelStride(4), VPixelStride(4),
+    IsFront(1)
+
+Protocol v2 is negotiated. Right after connecting, the receiver sends a
+hello (magic 'WCAM', version, capability bits, its clock in microseconds).
+A v2 sender answers with its own hello and from then on puts a 24-byte
+header in front of every payload instead of the 5-byte one:
+
+    Sync 'WCF2'(4), Type(1), Flags(1), Reserved(2), Seq(4),
+    CaptureTimeUs(8), PayloadSize(4)
+
+The payload of a video packet is the same as in v1. v2 also defines type
+0x01 for H.264, sent only to receivers that set CAP_H264 in their hello: a
+flags byte (H264_FRONT, H264_END_OF_FRAME) followed by Annex-B byte stream,
+cut wherever the encoder delivered it.
+
+The socket also carries a back-channel. A receiver that sets CAP_CONTROL in
+its hello may send STREAM_CONFIG messages (type 0x10, same 24-byte header,
+seq and capture time 0) to a sender that answered with CAP_CONTROL:
+
+    CropX(2), CropY(2), CropW(2), CropH(2)   fractions of the camera frame, /65535
+    Width(2), Height(2)                      size to scale the crop to, 0 = as captured
+    Fps(1)                                   0 = the camera's rate
+
+The sender applies the latest one to every frame after it, so only pixels
+that reach the virtual camera are sent (see stream_control).
+
+The sender's clock in the hello maps capture times onto time.perf_counter()
+(half the hello round trip is the error bound). The original sender never
+answers; it just streams v1 packets, and the reader recognises that from
+the first bytes and falls back. In v2, sequence gaps are counted as lost
+frames, unknown packet types are skipped, and a corrupt header is recovered
+from by scanning for the next sync marker instead of dropping the
+connection.
+
+PacketReader reads straight into a small pool of reusable buffers with
+recv_into, so no per-frame ``bytes`` objects are built and the planes are
+handed out as NumPy views over the pooled buffer.
+"""
+
+import socket
+import struct
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+PACKET_TYPE_VIDEO = 0
+PACKET_TYPE_H264 = 1
+PACKET_TYPE_STREAM_CONFIG = 0x10         # receiver -> sender
+
+HEADER = struct.Struct('>BI')            # type, payload size
+METADATA = struct.Struct('>IIIIIIIIIIB')  # 10 x u32 geometry + is_front
+METADATA_SIZE = METADATA.size            # 41
+
+PROTOCOL_VERSION = 2
+HELLO_MAGIC = b'WCAM'
+HELLO = struct.Struct('>4sBIQ')          # magic, version, capability bits, clock (us)
+FRAME_SYNC = b'WCF2'
+HEADER_V2 = struct.Struct('>4sBBHIQI')   # sync, type, flags, reserved, seq, capture time (us), payload size
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+CAP_H264 = 1 << 0                        # receiver can decode PACKET_TYPE_H264
+CAP_CONTROL = 1 << 1                     # receiver sends / sender honours STREAM_CONFIG
+CAPABILITIES = 0
+
+STREAM_CONFIG = struct.Struct('>HHHHHHB')  # crop x, y, w, h (/CROP_SCALE), width, height, fps
+CROP_SCALE = 65535
+
+H264_FRONT = 1 << 0                      # H.264 payload flags
+H264_END_OF_FRAME = 1 << 1               # the packet completes an access unit
+
+RECV_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class VideoMeta:
+    width: int
+    height: int
+    y_len: int
+    u_len: int
+    v_len: int
+    y_stride: int
+    u_stride: int
+    v_stride: int
+    u_pixel_stride: int
+    v_pixel_stride: int
+    is_front: bool
+
+    @classmethod
+    def unpack(cls, data):
+        fields = METADATA.unpack(data)
+        return cls(*fields[:10], bool(fields[10]))
+
+    @property
+    def uv_height(self):
+        return self.height // 2
+
+    def plane_layout(self):
+        """Offsets and padded sizes of the Y, U and V planes inside a slot.
+
+        Android usually leaves the padding off the last row of each plane,
+        so every plane gets room for ``rows * stride`` bytes. That lets the
+        planes be reshaped to (rows, stride) without the old pad-and-copy.
+        """
+        y_size = max(self.y_len, self.height * self.y_stride)
+        u_size = max(self.u_len, self.uv_height * self.u_stride)
+        v_size = max(self.v_len, self.uv_height * self.v_stride)
+        return (0, y_size), (y_size, u_size), (y_size + u_size, v_size)
+
+
+@dataclass(frozen=True)
+class StreamConfig:
+    """What a receiver asks the sender for: ``crop`` as (x, y, w, h)
+    fractions of the camera frame, the ``width`` x ``height`` to scale it to
+    (0 = as captured) and ``fps`` (0 = the camera's rate)."""
+    crop: tuple = (0.0, 0.0, 1.0, 1.0)
+    width: int = 0
+    height: int = 0
+    fps: int = 0
+
+    def pack(self):
+        """The complete v2 message, header included."""
+        crop = (min(CROP_SCALE, max(0, round(c * CROP_SCALE))) for c in self.crop)
+        payload = STREAM_CONFIG.pack(*crop, self.width, self.height, self.fps)
+        return HEADER_V2.pack(FRAME_SYNC, PACKET_TYPE_STREAM_CONFIG, 0, 0, 0, 0, len(payload)) + payload
+
+    @classmethod
+    def unpack(cls, payload):
+        x, y, w, h, width, height, fps = STREAM_CONFIG.unpack(payload[:STREAM_CONFIG.size])
+        return cls(tuple(c / CROP_SCALE for c in (x, y, w, h)), width, height, fps)
+
+
+class VideoPacket:
+    """A received video frame. The planes are views into a pooled buffer;
+    call release() once they are no longer needed so the reader can reuse it.
+
+    ``seq`` is the sender's sequence number (v2) or counts packets on the
+    connection from 0 (v1). ``header_at`` and ``received_at`` are the
+    time.perf_counter() at which the header and the last byte arrived, and
+    ``captured_at`` is the phone's capture time on the same clock (v2 only,
+    else None).
+    """
+
+    __slots__ = ('meta', 'buffer', 'y', 'u', 'v', 'seq', 'header_at', 'received_at', 'captured_at',
+                 '_reader')
+
+    def __init__(self, meta, buffer, reader=None, seq=0, header_at=0.0, received_at=0.0,
+                 captured_at=None):
+        self.meta = meta
+        self.buffer = buffer
+        self.seq = seq
+        self.header_at = header_at
+        self.received_at = received_at
+        self.captured_at = captured_at
+        self._reader = reader
+        (y_off, _), (u_off, _), (v_off, _) = meta.plane_layout()
+        self.y = _plane_view(buffer, y_off, meta.height, meta.y_stride)
+        self.u = _plane_view(buffer, u_off, meta.uv_height, meta.u_stride)
+        self.v = _plane_view(buffer, v_off, meta.uv_height, meta.v_stride)
+
+    @property
+    def is_front(self):
+        return self.meta.is_front
+
+    def release(self):
+        reader, self._reader = self._reader, None
+        if reader is not None:
+            reader.release(self.buffer)
+
+
+class EncodedPacket:
+    """A chunk of H.264 Annex-B stream. ``data`` is a view into the reader's
+    scratch buffer and is only valid until the next read()."""
+
+    __slots__ = ('data', 'is_front', 'end_of_frame', 'seq', 'header_at', 'received_at', 'captured_at')
+
+    def __init__(self, data, flags, seq, header_at, received_at, captured_at):
+        self.data = data
+        self.is_front = bool(flags & H264_FRONT)
+        self.end_of_frame = bool(flags & H264_END_OF_FRAME)
+        self.seq = seq
+        self.header_at = header_at
+        self.received_at = received_at
+        self.captured_at = captured_at
+
+    def release(self):
+        pass
+
+
+def _plane_view(buffer, offset, rows, stride):
+    return np.frombuffer(buffer, dtype=np.uint8, count=rows * stride, offset=offset).reshape((rows, stride))
+
+
+class PacketReader:
+    """Parses packets from a connected socket into pooled buffers.
+
+    A packet's buffer goes back to the pool when it is released, possibly
+    from another thread. At most ``pool_size`` idle buffers are kept; if
+    every buffer is still in use a new one is allocated.
+
+    In v2, read() also returns EncodedPacket for H.264 packets, if
+    ``capabilities`` advertised CAP_H264.
+
+    The handshake happens on the first read(); ``version`` is None until
+    then. With ``handshake=False`` the reader expects v1 and sends nothing.
+    ``lost``, ``skipped`` and ``resyncs`` count v2 sequence gaps, skipped
+    unknown packets and recoveries from corrupt headers.
+
+    send_config() may be called from another thread than read().
+    """
+
+    def __init__(self, sock, pool_size=4, handshake=True, capabilities=CAPABILITIES):
+        self.sock = sock
+        self.pool_size = pool_size
+        self.capabilities = capabilities
+        self.version = None if handshake else 1
+        self.peer_capabilities = 0
+        self.clock_offset = None
+        self._header = bytearray(HEADER.size)
+        self._header_v2 = bytearray(HEADER_V2.size)
+        self._meta = bytearray(METADATA_SIZE)
+        self._encoded = bytearray()
+        self._pending = bytearray()
+        self._free = deque()
+        self._expected_seq = None
+        self.bytes_received = 0
+        self.packets = 0
+        self.allocations = 0
+        self.lost = 0
+        self.skipped = 0
+        self.resyncs = 0
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+        except OSError:
+            pass
+
+    def read(self):
+        """Returns the next VideoPacket (or EncodedPacket), or None when the
+        peer closed the connection. Raises ProtocolError on v1 packets it
+        cannot parse."""
+        if self.version is None and not self._negotiate():
+            return None
+        if self.version == 1:
+            return self._read_v1()
+        return self._read_v2()
+
+    @property
+    def accepts_control(self):
+        """True once the sender has agreed to take StreamConfig messages."""
+        return bool(self.version and self.version >= 2 and self.capabilities & CAP_CONTROL
+                    and self.peer_capabilities & CAP_CONTROL)
+
+    def send_config(self, config):
+        """Sends a StreamConfig. Returns False if the sender doesn't take
+        them or the connection is gone."""
+        if not self.accepts_control:
+            return False
+        try:
+            self.sock.sendall(config.pack())
+        except OSError:
+            return False
+        return True
+
+    def _negotiate(self):
+        """Sends our hello and works out which framing the sender uses.
+        Returns False if the connection closed first."""
+        sent = time.perf_counter()
+        try:
+            self.sock.sendall(HELLO.pack(HELLO_MAGIC, PROTOCOL_VERSION, self.capabilities, int(sent * 1e6)))
+        except OSError:
+            pass  # a dead socket shows up on the recv below
+
+        first = bytearray(len(HELLO_MAGIC))
+        if not self._recv_into(memoryview(first)):
+            return False
+        if first != HELLO_MAGIC:
+            # An old sender that ignored the hello: this is a v1 header.
+            self._pending[:0] = first
+            self.version = 1
+            return True
+
+        rest = bytearray(HELLO.size - len(HELLO_MAGIC))
+        if not self._recv_into(memoryview(rest)):
+            return False
+        answered = time.perf_counter()
+        _, version, capabilities, clock_us = HELLO.unpack(first + rest)
+        self.version = max(1, min(version, PROTOCOL_VERSION))
+        self.peer_capabilities = capabilities
+        # The sender read its clock somewhere in the round trip; assume the middle.
+        self.clock_offset = clock_us / 1e6 - (sent + answered) / 2
+        return True
+
+    def _read_v1(self):
+        if not self._recv_into(memoryview(self._header)):
+            return None
+        header_at = time.perf_counter()
+        packet_type, total_size = HEADER.unpack(self._header)
+
+        if packet_type != PACKET_TYPE_VIDEO:
+            raise ProtocolError(f"Unknown packet type: {packet_type}")
+        return self._read_video(total_size, self.packets, header_at)
+
+    def _read_v2(self):
+        while True:
+            if not self._recv_into(memoryview(self._header_v2)):
+                return None
+            header_at = time.perf_counter()
+            sync, packet_type, _flags, _, seq, capture_us, payload_size = HEADER_V2.unpack(self._header_v2)
+
+            if sync != FRAME_SYNC or payload_size > MAX_PAYLOAD_SIZE:
+                if not self._resync(self._header_v2[1:]):
+                    return None
+                continue
+            if packet_type not in (PACKET_TYPE_VIDEO, PACKET_TYPE_H264) or payload_size == 0:
+                self.skipped += 1
+                if not self._discard(payload_size):
+                    return None
+                continue
+
+            if self._expected_seq is not None:
+                gap = (seq - self._expected_seq) & 0xFFFFFFFF
+                if gap < 0x80000000:
+                    self.lost += gap
+            self._expected_seq = (seq + 1) & 0xFFFFFFFF
+            captured_at = capture_us / 1e6 - self.clock_offset
+
+            if packet_type == PACKET_TYPE_H264:
+                return self._read_encoded(payload_size, seq, header_at, captured_at)
+            try:
+                return self._read_video(payload_size, seq, header_at, captured_at)
+            except ProtocolError:
+                # Bad metadata behind a good header: find the next packet.
+                if not self._resync(b''):
+                    return None
+
+    def _read_encoded(self, payload_size, seq, header_at, captured_at):
+        if len(self._encoded) < payload_size:
+            self._encoded = bytearray(max(payload_size, 2 * len(self._encoded)))
+        view = memoryview(self._encoded)[:payload_size]
+        if not self._recv_into(view):
+            return None
+        packet = EncodedPacket(view[1:], view[0], seq, header_at, time.perf_counter(), captured_at)
+        self.packets += 1
+        return packet
+
+    def _read_video(self, total_size, seq, header_at, captured_at=None):
+        if total_size < METADATA_SIZE:
+            raise ProtocolError(f"Video packet too short: {total_size} bytes")
+
+        if not self._recv_into(memoryview(self._meta)):
+            return None
+        meta = VideoMeta.unpack(self._meta)
+
+        planes_len = meta.y_len + meta.u_len + meta.v_len
+        if METADATA_SIZE + planes_len > total_size:
+            raise ProtocolError(f"Plane sizes exceed packet size ({planes_len} > {total_size - METADATA_SIZE})")
+
+        # Each plane gets rows * stride bytes, at most a row more than was
+        # sent (the padding Android leaves off the last row). More than that
+        # means the strides or height are garbage, not a frame.
+        needed = sum(size for _, size in meta.plane_layout())
+        limit = min(total_size - METADATA_SIZE + meta.y_stride + meta.u_stride + meta.v_stride,
+                    MAX_PAYLOAD_SIZE)
+        if needed > limit:
+            raise ProtocolError(f"Plane layout ({needed} bytes) doesn't fit the packet ({total_size} bytes)")
+
+        slot = self._take_buffer(needed)
+        view = memoryview(slot)
+        for (offset, _), length in zip(meta.plane_layout(), (meta.y_len, meta.u_len, meta.v_len)):
+            if not self._recv_into(view[offset:offset + length]):
+                return None
+
+        # Newer senders may append fields after the planes; skip them.
+        extra = total_size - METADATA_SIZE - planes_len
+        if extra and not self._discard(extra):
+            return None
+
+        packet = VideoPacket(meta, slot, self, seq, header_at, time.perf_counter(), captured_at)
+        self.packets += 1
+        return packet
+
+    def _resync(self, data):
+        """Drops bytes up to the next FRAME_SYNC, starting with ``data``
+        (bytes already read). Returns False if the connection closed."""
+        self.resyncs += 1
+        window = bytes(data)
+        while True:
+            found = window.find(FRAME_SYNC)
+            if found >= 0:
+                self._pending[:0] = window[found:]
+                return True
+            window = window[max(0, len(window) - len(FRAME_SYNC) + 1):]
+            chunk = self._recv_some(64 * 1024)
+            if not chunk:
+                return False
+            window += chunk
+
+    def _recv_some(self, size):
+        if self._pending:
+            chunk = bytes(self._pending[:size])
+            del self._pending[:size]
+            return chunk
+        try:
+            chunk = self.sock.recv(size)
+        except ConnectionResetError:
+            return b''
+        self.bytes_received += len(chunk)
+        return chunk
+
+    def release(self, buffer):
+        if len(self._free) < self.pool_size:
+            self._free.append(buffer)
+
+    def _take_buffer(self, needed):
+        while True:
+            try:
+                buffer = self._free.popleft()
+            except IndexError:
+                break
+            # Buffers from before a geometry change may be too small. Row
+            # padding is never part of the visible image, so stale bytes
+            # left in a reused buffer are harmless.
+            if len(buffer) >= needed:
+                return buffer
+        self.allocations += 1
+        return bytearray(needed)
+
+    def _recv_into(self, view):
+        if self._pending:
+            n = min(len(view), len(self._pending))
+            view[:n] = self._pending[:n]
+            del self._pending[:n]
+            view = view[n:]
+        while len(view):
+            try:
+                n = self.sock.recv_into(view)
+            except ConnectionResetError:
+                # Old senders never read our hello, so closing with it
+                # unread resets the connection instead of a clean EOF.
+                return False
+            if n == 0:
+                return False
+            self.bytes_received += n
+            view = view[n:]
+        return True
+
+    def _discard(self, size):
+        scratch = memoryview(bytearray(min(size, 64 * 1024)))
+        while size:
+            if not self._recv_into(scratch[:min(size, len(scratch))]):
+                return False
+            size -= min(size, len(scratch))
+        return True
@@ -1,28 +1,40 @@
 # pyinstaller --onefile --add-data "adb/adb.exe;adb" --add-data "adb/AdbWinApi.dll;adb" --add-data "adb/AdbWinUsbApi.dll;adb" webcamo_client.py
 
-import shutil
 import sys
+import os
 import asyncio
-import json
-import numpy as np
-import cv2
-import websockets
-import pyvirtualcam
-from pyvirtualcam import PixelFormat
-from aiortc import RTCPeerConnection, RTCSessionDescription
-from aiortc.sdp import candidate_from_sdp
-from PyQt6.QtCore import Qt, pyqtSignal, QObject, QThread, pyqtSlot, QTimer
-
-from PyQt6.QtGui import QImage, QPixmap, QTextCursor, QIcon
+import html
+import logging
+import multiprocessing
+from PyQt6.QtCore import Qt, pyqtSignal, QObject, QThread, pyqtSlot, QTimer, QEvent
+
+from PyQt6.QtGui import QImage, QPixmap, QIcon
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout,
-    QHBoxLayout, QCheckBox, QMessageBox, QTextEdit, QRadioButton, QStackedLayout
+    QHBoxLayout, QCheckBox, QMessageBox, QPlainTextEdit, QRadioButton, QStackedLayout
 )
 from qasync import QEventLoop, asyncSlot
-import socket
-import struct
-import subprocess
-import os
+
+import app_log
+from devices import parse_devices_or_first, start_devices, stop_devices
+from frame_stats import STATS_INTERVAL, STATS_OVERLAY, STATS_PORT, FrameStats, StatsReporter, StatsServer
+from preview import PreviewMailbox
+
+# Comma-separated device specs (see devices.py). The window drives the first
+# one; the others stream in background processes with their own cameras.
+DEVICES = [d for d in os.environ.get('WEBCAMO_DEVICES', '').split(',') if d.strip()]
+# Processes converting raw USB frames (convert_pool); 0 converts on a thread.
+CONVERT_WORKERS = int(os.environ.get('WEBCAMO_CONVERT_WORKERS') or 0)
+# Lines kept in the log box; older ones fall off the top
+LOG_LINES = 200
+LOG_COLORS = {logging.WARNING: '#e0a526', logging.ERROR: '#e5533d', logging.CRITICAL: '#e5533d'}
+
+log = logging.getLogger("webcamo.gui")
+usb_log = logging.getLogger("webcamo.usb")
+
+# The USB (OpenCV/NumPy) and wireless (aiortc/av) stacks are imported only
+# once that mode is used, so the window comes up without either; see
+# import_budget.py.
 
 # def start_adb_reverse():
 #         """
@@ -57,231 +69,82 @@ import os
 
 
 class USBReceiverWorker(QObject):
-    frame_ready = pyqtSignal(np.ndarray)
-    log = pyqtSignal(str)
     finished = pyqtSignal()
 
-    def __init__(self, flip=True):
+    def __init__(self, flip=True, on_frame=None, metrics=None, device=None, sink=None):
         super().__init__()
         self.running = True
         self.flip = flip
+        self.on_frame = on_frame
+        self.metrics = metrics
+        self.device = device
+        self.sink = sink  # stays open after run(); the window shuts it down
+        self.reconnector = None
 
     def stop(self):
         self.running = False
-        try:
-            if self.sock:
-                self.sock.close()
-        except:
-            pass
+        if self.reconnector:
+            self.reconnector.stop()
 
-        
 
     @pyqtSlot(bool)
     def set_flip(self, value):
         self.flip = value
-        self.log.emit(f"USB: Flip set to {value}")
+        usb_log.info(f"USB: Flip set to {value}")
 
 
     def run(self):
-        HOST = '127.0.0.1'
-        PORT = 23233
+        usb_log.info("Starting USB mode...")
+        # Imported here, on the worker thread, so the GUI never waits on it
+        from reconnect import UsbReconnector
+        from usb_pipeline import USB_HOST, USB_PORT
+        from vcam_sinks import KeepAliveSink, create_sink
 
-        self.log.emit("Starting USB mode...")
-        """
-        Automatically runs 'adb reverse tcp:23233 tcp:23233'.
-        Checks for 'adb.exe' in the same directory (for bundled apps) or uses system PATH.
-        """
-        adb_cmd = 'adb'
-        
-        if getattr(sys, 'frozen', False):
-            base = sys._MEIPASS  # temp folder PyInstaller extracts to
-            local_adb = os.path.join(base, "adb", "adb.exe")
-            if os.path.exists(local_adb):
-                adb_cmd = local_adb
-
-    # 2) Local project folder
-        local_adb = os.path.join(os.path.dirname(os.path.abspath(__file__)), "adb", "adb.exe")
-        if os.path.exists(local_adb):
-            adb_cmd =  local_adb
-
-    # 3) System PATH
-        system_adb = shutil.which("adb")
-        if system_adb:
-            adb_cmd = system_adb
-        
+        serial, port = (self.device.address, self.device.port) if self.device else (None, USB_PORT)
         try:
-            subprocess.run([adb_cmd, 'forward', 'tcp:23233', 'tcp:23233'], check=True, capture_output=True)
-            self.log.emit("ADB forward successful.")
-        except subprocess.CalledProcessError as e:
-            self.log.emit(f"Error running ADB forward: {e}")
-            self.log.emit("Make sure your phone is connected and USB debugging is enabled.")
-        except FileNotFoundError:
-            self.log.emit("ADB not found. Please install Android Platform Tools or place adb.exe in this folder.")
-
-        
-        self.log.emit(f"Connecting to adb device at {PORT}")
-
-        # Connect Socket
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((HOST, PORT))
-            self.log.emit("Connected to phone!")
-        except ConnectionRefusedError:
-            self.log.emit("Connection failed. Check if the app is streaming.")
-
-        cam = None
-        try:
-            while True:
-                # Read Packet Type (1 byte)
-                type_byte = s.recv(1)
-                if not type_byte:
-                    break
-                
-                packet_type = int.from_bytes(type_byte, byteorder='big')
-                
-                if packet_type == 0:  # Video
-                    # Read Total Size (4 bytes)
-                    total_size_data = recv_exact(s, 4)
-                    if not total_size_data: break
-                    total_size = struct.unpack('>I', total_size_data)[0]
-
-                    # Read Metadata (40 bytes)
-                    # Width(4), Height(4), YLen(4), ULen(4), VLen(4), 
-                    # YStride(4), UStride(4), VStride(4), UPixelStride(4), VPixelStride(4)
-                    metadata_data = recv_exact(s, 40)
-                    is_front = s.recv(1)[0]
-                    # print("Front Camera:", bool(is_front))
-                    if not metadata_data: break
-                    
-                    (width, height, 
-                    y_len, u_len, v_len, 
-                    y_stride, u_stride, v_stride, 
-                    u_pixel_stride, v_pixel_stride) = struct.unpack('>IIIIIIIIII', metadata_data)
-
-                    # Read Plane Data
-                    y_data = recv_exact(s, y_len)
-                    u_data = recv_exact(s, u_len)
-                    v_data = recv_exact(s, v_len)
-
-
-                    if not y_data or not u_data or not v_data:
-                        break
-
-                    try:
-    # --- RECONSTRUCT IMAGE FROM PLANES ---
-
-                        def pad_to_stride(data, h, stride):
-                            expected = h * stride
-                            if len(data) < expected:
-                                return data + b'\0' * (expected - len(data))
-                            return data
-
-                        # 1. Y plane
-                        y_data = pad_to_stride(y_data, height, y_stride)
-                        y_plane = np.frombuffer(y_data, dtype=np.uint8).reshape((height, y_stride))
-                        y_plane = y_plane[:, :width]
-
-                        # 2. U plane
-                        uv_width = width // 2
-                        uv_height = height // 2
-
-                        u_data = pad_to_stride(u_data, uv_height, u_stride)
-                        u_plane = np.frombuffer(u_data, dtype=np.uint8).reshape((uv_height, u_stride))
-                        u_plane = u_plane[:, ::u_pixel_stride][:, :uv_width]
-
-                        # 3. V plane
-                        v_data = pad_to_stride(v_data, uv_height, v_stride)
-                        v_plane = np.frombuffer(v_data, dtype=np.uint8).reshape((uv_height, v_stride))
-                        v_plane = v_plane[:, ::v_pixel_stride][:, :uv_width]
-
-                        # 4. Merge YUV → I420
-                        y_flat = y_plane.flatten()
-                        u_flat = u_plane.flatten()
-                        v_flat = v_plane.flatten()
-
-                        i420 = np.concatenate([y_flat, u_flat, v_flat])
-
-                        i420_reshaped = i420.reshape((height + height // 2, width))
-
-                        # 5. Convert to BGR (no rotation)
-                        bgr = cv2.cvtColor(i420_reshaped, cv2.COLOR_YUV2BGR_I420)
-
-                        h, w = bgr.shape[:2]
-                        min_dim = min(h, w)
-                        start_x = (w - min_dim) // 2
-                        start_y = (h - min_dim) // 2
-                        bgr = bgr[start_y:start_y + min_dim, start_x:start_x + min_dim]
-
-                        # 6. Optional flip only if enabled
-                        
-                        if is_front:
-                            bgr = np.rot90(bgr, k=1)
-                            bgr = cv2.flip(bgr, 1)
-                        else:
-                            bgr = np.rot90(bgr, k=3)
-
-                        # self.frame_ready.emit(bgr)
-
-                            
-
-                    except Exception as e:
-                        self.log.emit(f"Error processing frame: {e}")
-                        continue
-
-                    if cam is None:
-                        
-                        try:
-                            h, w = bgr.shape[:2]
-                            cam = pyvirtualcam.Camera(width=w, height=h, fps=30, fmt=pyvirtualcam.PixelFormat.BGR, backend="unitycapture")
-                            self.log.emit("USB worker: virtualcam started")
-                        except Exception as e:
-                            self.log.emit(f"USB worker: virtualcam error: {e}")
-                            self.cam = None
-                            continue
-                    if cam:
-                        cam.send(bgr)
-                        # cam.sleep_until_next_frame()
-
-                    # Output the image exactly as received
-                    self.frame_ready.emit(bgr)
-
-                
-                else:
-                    self.log.emit(f"Unknown packet type: {packet_type}")
-                    break
-
+            if self.sink is None:
+                self.sink = KeepAliveSink(create_sink(self.device.sink if self.device else None))
+            self.reconnector = UsbReconnector(USB_HOST, port, serial=serial, sink=self.sink,
+                                              convert_workers=CONVERT_WORKERS,
+                                              on_frame=self.on_frame, metrics=self.metrics)
+            if self.running:
+                self.reconnector.run()
         except Exception as e:
-            self.log.emit(f"Error: {e}")
+            usb_log.error(f"Error: {e}")
         finally:
-            try:
-                s.close()
-            except:
-                pass
+            if self.sink:
+                self.sink.standby("Disconnected")
             self.finished.emit()
 
 
 
 
 def bgr_to_qimage(img_bgr):
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-    h, w, ch = img_rgb.shape
-    bytes_per_line = ch * w
-    return QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-
-def recv_exact(sock, size):
-    buf = b''
-    while len(buf) < size:
-        chunk = sock.recv(size - len(buf))
-        if not chunk:
-            return None
-        buf += chunk
-    return buf
+    # Expects a C-contiguous frame (see preview.fit_frame); no RGB swap needed.
+    h, w, ch = img_bgr.shape
+    bytes_per_line = img_bgr.strides[0]
+    return QImage(img_bgr.data, w, h, bytes_per_line, QImage.Format.Format_BGR888)
 
 class Signals(QObject):
-    frame_ready = pyqtSignal(np.ndarray)
-    status = pyqtSignal(str)
+    preview_ready = pyqtSignal()
+    log_record = pyqtSignal(int, str)
     connected = pyqtSignal(bool)
 
+
+class QtLogHandler(logging.Handler):
+    """Hands log lines to the GUI thread as (level, text) through ``emit_line``."""
+
+    def __init__(self, emit_line):
+        super().__init__()
+        self.emit_line = emit_line
+        self.setFormatter(logging.Formatter('%(message)s'))
+
+    def emit(self, record):
+        try:
+            self.emit_line(record.levelno, self.format(record))
+        except Exception:
+            self.handleError(record)
+
 class WebcamoClient(QWidget):
     def __init__(self):
         super().__init__()
@@ -427,15 +290,20 @@ class WebcamoClient(QWidget):
 
         # State
         self.signals = Signals()
-        self.signals.frame_ready.connect(self.update_preview)
-        self.signals.status.connect(self.log)
+        self.signals.preview_ready.connect(self.update_preview)
+        # Stage timings for both modes; see frame_stats for the switches
+        self.metrics = FrameStats()
+        self.stats_server = StatsServer(self.metrics, STATS_PORT) if STATS_PORT else None
+        self.stats_reporter = StatsReporter(self.metrics, log.info, STATS_INTERVAL) if STATS_INTERVAL else None
+        self.preview = PreviewMailbox(self.signals.preview_ready.emit, metrics=self.metrics,
+                                      overlay=self.metrics.overlay_lines if STATS_OVERLAY else None)
+        self.signals.log_record.connect(self.show_log)
         self.signals.connected.connect(self.on_connected)
 
-        self.pc: RTCPeerConnection | None = None
-        self.ws = None
-        self.cam = None  # pyvirtualcam.Camera
-        self.running_receiver = False
-        self._closing = False
+        self.wireless = None  # WirelessReceiver, created on first connect
+        # KeepAliveSink shared by both modes, so switching never opens the
+        # camera twice; open from whichever mode streams first to exit
+        self.vcam = None
 
 
         self.connect_btn.clicked.connect(self.on_connect_clicked)
@@ -443,8 +311,9 @@ class WebcamoClient(QWidget):
 
 
               
-        self.log_box = QTextEdit()
+        self.log_box = QPlainTextEdit()
         self.log_box.setReadOnly(True)
+        self.log_box.setMaximumBlockCount(LOG_LINES)
         self.log_box.setMaximumHeight(65)  
         self.log_box.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.log_box.setStyleSheet("""
@@ -459,20 +328,34 @@ class WebcamoClient(QWidget):
         """)
         self.main_layout.addWidget(self.log_box)
         self.log_box.setPlainText(">> App initialized.\n>> Waiting for connection...")
-
-
-
-    def log(self, msg: str):
-        # print(msg)
-        # self.status_label.setText(msg)
-        self.log_box.append(f">> {msg}")
-        max_lines = 20
-        text = self.log_box.toPlainText().splitlines()
-        if len(text) > max_lines:
-            text = text[-max_lines:]  # keep only last few
-            self.log_box.setPlainText("\n".join(text))
-
-        self.log_box.moveCursor(QTextCursor.MoveOperation.End)
+        # Every "webcamo" logger ends up here (and in WEBCAMO_LOG_FILE if set)
+        self.close_log = app_log.setup([QtLogHandler(self.signals.log_record.emit)])
+        self.log_flush_timer = QTimer(self)
+        self.log_flush_timer.timeout.connect(app_log.flush)
+        self.log_flush_timer.start(1000)
+
+        devices, error = parse_devices_or_first(DEVICES)
+        if error:
+            extra = "streaming the first device only" if devices else "ignored"
+            self.log(f"WEBCAMO_DEVICES: {error} ({extra})", logging.ERROR)
+        self.device = devices[0] if devices else None
+        self.device_processes = start_devices(
+            devices[1:], extra=['--convert-workers', str(CONVERT_WORKERS)] if CONVERT_WORKERS else ())
+        if self.device and self.device.kind == 'wireless':
+            self.url_edit.setText(self.device.address)
+        if self.device_processes:
+            self.log(f"Streaming {len(self.device_processes)} more device(s) in the background")
+
+
+
+    def log(self, msg: str, level=logging.INFO):
+        log.log(level, msg)
+
+    def show_log(self, level, text):
+        # appendHtml only adds a block; maximumBlockCount drops the oldest
+        line = f"&gt;&gt; {html.escape(text)}"
+        color = LOG_COLORS.get(level)
+        self.log_box.appendHtml(f'<span style="color:{color}">{line}</span>' if color else line)
 
     
 
@@ -519,16 +402,17 @@ class WebcamoClient(QWidget):
 
         self.usb_thread = QThread()
         flip = self.flip_chk_usb.isChecked()
-        self.usb_worker = USBReceiverWorker(flip=flip)
+        device = self.device if self.device and self.device.kind == 'usb' else None
+        self.usb_worker = USBReceiverWorker(flip=flip, on_frame=self.preview.post, metrics=self.metrics,
+                                            device=device, sink=self._shared_camera())
         self.usb_worker.moveToThread(self.usb_thread)
         self.flip_chk_usb.toggled.connect(self.usb_worker.set_flip)
 
         # Connect thread start → worker.run
         self.usb_thread.started.connect(self.usb_worker.run)
 
-        # Worker emits frames to UI
-        self.usb_worker.frame_ready.connect(self.update_preview)
-        self.usb_worker.log.connect(self.log)
+        # Worker posts frames to the preview mailbox, logs go to the UI
+        # through the "webcamo" loggers
 
         # When finished
         self.usb_worker.finished.connect(self.usb_thread.quit)
@@ -539,6 +423,7 @@ class WebcamoClient(QWidget):
 
     def thread_cleanup(self):
         self.log("Device Disconnected. USB thread cleaned up.")
+        self._shared_camera()  # kept open for the next start
         self.usb_thread = None
         self.usb_worker = None
 
@@ -581,178 +466,59 @@ class WebcamoClient(QWidget):
         await self.disconnect()
 
     async def connect(self, url: str):
-        try:
-            self.signals.status.emit("Creating PeerConnection")
-            self.pc = RTCPeerConnection()
-
-            # Log ICE state changes
-            @self.pc.on("iceconnectionstatechange")
-            def _on_ice_state():
-                self.signals.status.emit(f"ICE: {self.pc.iceConnectionState}")
-
-            # Prepare to receive video
-            self.pc.addTransceiver("video", direction="recvonly")
-
-            self.signals.status.emit(f"Connecting WebSocket: {url}")
-            self.ws = await websockets.connect(url)
-            self.signals.status.emit("WebSocket connected")
-
-            # Track handler
-            @self.pc.on("track")
-            def on_track(track):
-                self.signals.status.emit(f"Track: {track.kind}")
-                if track.kind != "video":
-                    return
-                if self.running_receiver:
-                    return
-                self.running_receiver = True
-                asyncio.ensure_future(self._receiver_task(track))
-
-            # Create & send OFFER
-            self.signals.status.emit("Creating Offer…")
-            offer = await self.pc.createOffer()
-            await self.pc.setLocalDescription(offer)
-
-            await self.ws.send(json.dumps({
-                "type": "offer",
-                "sdp": self.pc.localDescription.sdp
-            }))
-            self.signals.status.emit("Offer sent. Waiting for Answer…")
-
-            # Receive ANSWER
-            answer_json = await self.ws.recv()
-            data = json.loads(answer_json)
-            if data.get("type") != "answer" or not data.get("sdp"):
-                raise RuntimeError(f"Bad answer: {data}")
-            await self.pc.setRemoteDescription(RTCSessionDescription(data["sdp"], "answer"))
-            self.signals.status.emit("Answer applied")
-            self.signals.connected.emit(True)
-
-            # Handle incoming ICE
-            asyncio.ensure_future(self._ice_listener())
-
-        except Exception as e:
-            self.signals.status.emit(f"⚠️  Connect error: {e}")
-            await self.disconnect()
-
-    async def _ice_listener(self):
-        try:
-            while self.ws:
-                msg = await self.ws.recv()
-                data = json.loads(msg)
-                if data.get("type") == "candidate" and data.get("candidate"):
-                    cand = data["candidate"]
-                    self.signals.status.emit("ICE Candidate → parsing SDP")
-                    ice = candidate_from_sdp(cand["candidate"])
-                    ice.sdpMid = cand.get("sdpMid")
-                    ice.sdpMLineIndex = cand.get("sdpMLineIndex")
-                    await self.pc.addIceCandidate(ice)
-                    self.signals.status.emit("ICE added")
-        except Exception as e:
-            if not self._closing:
-                self.signals.status.emit(f"⚠️ ICE listener ended: {e}")
-
-    async def _receiver_task(self, track):
-        self.signals.status.emit("Starting frame receiver")
-        try:
-
-            W, H = 720, 720
-
-            while True:
-                frame = await track.recv()
-                img = frame.to_ndarray(format="bgr24")
-
-                # ✅ Fast rotation based on aspect (h > w means portrait)
-                # if img.shape[0] > img.shape[1]:
-                #     img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-
-                if self.flip_chk.isChecked():
-                    img = cv2.flip(img, 1)
-
-                # Crop square first (cheap), then resize (one resize only)
-                h, w, _ = img.shape
-                m = min(h, w)
-                y = (h - m) >> 1
-                x = (w - m) >> 1
-                img = img[y:y+m, x:x+m]
-
-                img = cv2.resize(img, (W, H), cv2.INTER_AREA)
-
-                # ✅ Preview (unchanged)
-                self.signals.frame_ready.emit(img)
-
-                # ✅ Initialize Virtual Cam ONCE
-                # if self.virtual_cam_chk.isChecked():
-            # If not already active, start it once
-                if self.cam is None:
-                    self.signals.status.emit(f"Starting UnityCapture Virtual Cam at {W}x{H}")
-                    try:
-                        self.cam = pyvirtualcam.Camera(
-                            width=W,
-                            height=H,
-                            fps=30,
-                            fmt=PixelFormat.I420,
-                            backend="unitycapture"
-                        )
-                        self.signals.status.emit("Virtual cam active via UnityCapture")
-                    except Exception as e:
-                        self.signals.status.emit(f"[Error] Unable to start virtual cam: {e}")
-                        self.cam = None
-                        continue
-
-                    # Send frame if virtual cam is running
-                if self.cam:
-                    img_i420 = cv2.cvtColor(img, cv2.COLOR_BGR2YUV_I420)
-                    self.cam.send(img_i420)
-                    self.cam.sleep_until_next_frame()
-
-
-        except Exception as e:
-            if not self._closing:
-                self.signals.status.emit(f"⚠️ Receiver ended: {e}")
-        finally:
-            self.running_receiver = False
+        if self.wireless is None:
+            from wireless_receiver import WirelessReceiver
+            self.wireless = WirelessReceiver(
+                on_connected=self.signals.connected.emit,
+                on_preview=self.preview.post,
+                mirror=self.flip_chk.isChecked,
+                metrics=self.metrics,
+                sink=self._shared_camera(),
+            )
+        elif self.wireless.cam is None:
+            self.wireless.cam = self._shared_camera()
+        await self.wireless.disconnect()
+        # Reconnects on its own until disconnect()
+        asyncio.ensure_future(self.wireless.run(url))
+
+    def _shared_camera(self):
+        """The virtual camera both modes send to, once either has opened it.
+
+        The USB worker opens it on its own thread and the wireless receiver
+        on its first frame, so take it from whichever got there first.
+        """
+        if self.vcam is None and self.usb_worker is not None:
+            self.vcam = self.usb_worker.sink
+        if self.vcam is None and self.wireless is not None:
+            self.vcam = self.wireless.cam
+        return self.vcam
+
+    def update_preview(self):
+        # Frame is already sized to the label by the preview mailbox
+        img = self.preview.take()
+        if img is None:
+            return
+        self.preview_label.setPixmap(QPixmap.fromImage(bgr_to_qimage(img)))
 
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.preview.size = (self.preview_label.width(), self.preview_label.height())
 
-    def update_preview(self, img):
-        qimg = bgr_to_qimage(img)
-        pix = QPixmap.fromImage(qimg).scaled(
-            self.preview_label.width(),
-            self.preview_label.height(),
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation
-        )
-        self.preview_label.setPixmap(pix)
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            # No point scaling preview frames nobody can see
+            self.preview.enabled = not self.isMinimized()
+            if self.isMinimized():
+                self.preview.clear()
 
     
 
     async def disconnect(self):
-        self._closing = True
-        self.signals.connected.emit(False)
-        try:
-            if self.ws:
-                await self.ws.close()
-        except Exception:
-            pass
-        self.ws = None
-
-        try:
-            if self.pc:
-                await self.pc.close()
-        except Exception:
-            pass
-        self.pc = None
-
-        if self.cam:
-            try:
-                self.cam.close()
-            except Exception:
-                pass
-        self.cam = None
-
-        self._closing = False
+        if self.wireless:
+            await self.wireless.disconnect()
         self.log_box.clear()
-        self.signals.status.emit("Disconnected")
+        self.log("Disconnected")
 
     def closeEvent(self, event):
         reply = QMessageBox.question(
@@ -771,7 +537,22 @@ class WebcamoClient(QWidget):
 
 
     async def _graceful_close(self, event):
-        await self.disconnect()          # Clean shutdown WebSocket, RTC, and virtual cam
+        if self.usb_worker:
+            self.usb_worker.stop()
+        if self.usb_thread:
+            self.usb_thread.quit()
+            self.usb_thread.wait(2000)
+        if self._shared_camera():
+            self.vcam.shutdown()
+        if self.wireless:
+            await self.wireless.close()  # Clean shutdown WebSocket, RTC, and virtual cam
+        self.preview.close()
+        stop_devices(self.device_processes)
+        if self.stats_reporter:
+            self.stats_reporter.close()
+        if self.stats_server:
+            self.stats_server.close()
+        self.close_log()
         event.accept()                   # Allow window to close
         QApplication.instance().quit()   # End application
 
@@ -779,6 +560,7 @@ class WebcamoClient(QWidget):
 
 
 def main():
+    multiprocessing.freeze_support()  # device processes in the PyInstaller build
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(r"C:\Users\adars\Desktop\webcamo\webcamo desktop\assets\logoo.ico"))
     loop = QEventLoop(app)
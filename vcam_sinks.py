@@ -0,0 +1,413 @@
+"""
+Where finished frames go.
+
+Both receivers send their output to a Sink chosen by a spec string, taken
+from the WEBCAMO_SINK environment variable (or --sink on the command line):
+
+    auto                  pyvirtualcam with the platform's default driver
+                          (UnityCapture on Windows, v4l2loopback on Linux)
+    unitycapture | v4l2loopback | obs
+                          pyvirtualcam with that backend
+    v4l2loopback:/dev/videoN
+                          v4l2loopback on a specific device
+    shm[:name]            POSIX shared-memory ring other local processes
+                          can map (see SharedFrameReader)
+    file:path.y4m         Y4M (I420) recording
+    file:path             raw frames, back to back
+    null                  just counts frames, for benchmarks
+
+Frames are NumPy arrays: (h, w, 3) for FMT_BGR, (h * 3 // 2, w) for FMT_I420.
+"""
+
+import os
+import struct
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+FMT_BGR = 'bgr'
+FMT_I420 = 'i420'
+
+DEFAULT_SINK = os.environ.get('WEBCAMO_SINK', 'auto')
+
+
+def frame_size(width, height, fmt):
+    return width * height * 3 if fmt == FMT_BGR else width * height * 3 // 2
+
+
+def converted_shape(frame, src_fmt, dst_fmt):
+    """Shape of ``frame`` after convert_frame(frame, src_fmt, dst_fmt)."""
+    if src_fmt == dst_fmt:
+        return frame.shape
+    if src_fmt == FMT_BGR:
+        return (frame.shape[0] * 3 // 2, frame.shape[1])
+    return (frame.shape[0] * 2 // 3, frame.shape[1], 3)
+
+
+def convert_frame(frame, src_fmt, dst_fmt, out=None):
+    """``frame`` in ``dst_fmt``, written into ``out`` if given (see converted_shape)."""
+    if src_fmt == dst_fmt:
+        return frame
+    if src_fmt == FMT_BGR:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=out)
+    return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420, dst=out)
+
+
+class Sink:
+    """Base class. Subclasses implement _open, _send and _close."""
+
+    name = 'sink'
+
+    def __init__(self):
+        self.width = None
+        self.height = None
+        self.fps = None
+        self.fmt = None
+        self.frames = 0
+        self.bytes = 0
+
+    @property
+    def is_open(self):
+        return self.width is not None
+
+    def open(self, width, height, fps=30, fmt=FMT_BGR):
+        self._open(width, height, fps, fmt)
+        self.width, self.height, self.fps, self.fmt = width, height, fps, fmt
+
+    def ensure_open(self, width, height, fps=30, fmt=FMT_BGR):
+        """Opens the sink, or reopens it if the frame size or format changed.
+        Returns True if it (re)opened."""
+        if self.is_open and (self.width, self.height, self.fmt) == (width, height, fmt):
+            return False
+        if self.is_open:
+            self.close()
+        self.open(width, height, fps, fmt)
+        return True
+
+    def send(self, frame):
+        self._send(frame)
+        self.frames += 1
+        self.bytes += frame.nbytes
+
+    def sleep_until_next_frame(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            try:
+                self._close()
+            finally:
+                self.width = self.height = self.fps = self.fmt = None
+
+    def describe(self):
+        return self.name
+
+    def _open(self, width, height, fps, fmt):
+        pass
+
+    def _send(self, frame):
+        pass
+
+    def _close(self):
+        pass
+
+
+class NullSink(Sink):
+    name = 'null'
+
+
+class PyVirtualCamSink(Sink):
+    """pyvirtualcam, with an explicit backend or its platform default."""
+
+    def __init__(self, backend=None, device=None):
+        super().__init__()
+        self.backend = backend
+        self.device = device
+        self.cam = None
+
+    def describe(self):
+        if self.cam is not None:
+            return f"{self.cam.backend} ({self.cam.device})"
+        return self.backend or 'virtual camera'
+
+    def _open(self, width, height, fps, fmt):
+        import pyvirtualcam
+        pixel_format = pyvirtualcam.PixelFormat.BGR if fmt == FMT_BGR else pyvirtualcam.PixelFormat.I420
+        self.cam = pyvirtualcam.Camera(width=width, height=height, fps=fps, fmt=pixel_format,
+                                       backend=self.backend, device=self.device)
+
+    def _send(self, frame):
+        self.cam.send(frame)
+
+    def sleep_until_next_frame(self):
+        if self.cam is not None:
+            self.cam.sleep_until_next_frame()
+
+    def _close(self):
+        cam, self.cam = self.cam, None
+        cam.close()
+
+
+# Shared-memory ring: a header followed by `slots` frames. The writer fills
+# slot (seq + 1) % slots and only then publishes seq + 1, so a reader that
+# copies or uses the newest slot has slots - 1 frames before it is reused.
+SHM_MAGIC = b'WCAMSHM1'
+SHM_HEADER = struct.Struct('<8sIIIII')   # magic, width, height, fmt, slots, frame size
+SHM_SEQ = struct.Struct('<Q')
+SHM_SEQ_OFFSET = 32
+SHM_DATA_OFFSET = 64
+SHM_FORMATS = {FMT_BGR: 0, FMT_I420: 1}
+
+
+def _frame_shape(width, height, fmt):
+    return (height, width, 3) if fmt == FMT_BGR else (height * 3 // 2, width)
+
+
+class SharedMemorySink(Sink):
+    name = 'shm'
+
+    def __init__(self, shm_name='webcamo', slots=3):
+        super().__init__()
+        self.shm_name = shm_name
+        self.slots = slots
+        self.shm = None
+        self._frames = None
+        self._seq = 0
+
+    def describe(self):
+        return f"shared memory '{self.shm_name}'"
+
+    def _open(self, width, height, fps, fmt):
+        from multiprocessing import shared_memory
+
+        size = frame_size(width, height, fmt)
+        try:
+            # A previous run that crashed may have left the segment behind.
+            stale = shared_memory.SharedMemory(name=self.shm_name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=self.shm_name, create=True,
+                                              size=SHM_DATA_OFFSET + size * self.slots)
+        SHM_HEADER.pack_into(self.shm.buf, 0, SHM_MAGIC, width, height, SHM_FORMATS[fmt], self.slots, size)
+        SHM_SEQ.pack_into(self.shm.buf, SHM_SEQ_OFFSET, 0)
+        self._frames = np.ndarray((self.slots,) + _frame_shape(width, height, fmt), dtype=np.uint8,
+                                  buffer=self.shm.buf, offset=SHM_DATA_OFFSET)
+        self._seq = 0
+
+    def _send(self, frame):
+        seq = self._seq + 1
+        np.copyto(self._frames[seq % self.slots], frame)
+        SHM_SEQ.pack_into(self.shm.buf, SHM_SEQ_OFFSET, seq)
+        self._seq = seq
+
+    def _close(self):
+        self._frames = None
+        shm, self.shm = self.shm, None
+        shm.close()
+        shm.unlink()
+
+
+class SharedFrameReader:
+    """Consumer side of SharedMemorySink: maps the ring without copying."""
+
+    def __init__(self, shm_name='webcamo'):
+        from multiprocessing import shared_memory
+
+        # Attaching must not register the segment with this process's
+        # resource tracker, which would unlink it when we exit; the writer
+        # owns it. Python 3.13 has track=False for this.
+        try:
+            self.shm = shared_memory.SharedMemory(name=shm_name, track=False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=shm_name)
+            if sys.platform != 'win32':
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        magic, width, height, fmt_code, slots, size = SHM_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != SHM_MAGIC:
+            self.shm.close()
+            raise ValueError(f"'{shm_name}' is not a webcamo frame ring")
+        self.width, self.height, self.slots = width, height, slots
+        self.fmt = next(name for name, code in SHM_FORMATS.items() if code == fmt_code)
+        self._frames = np.ndarray((slots,) + _frame_shape(width, height, self.fmt), dtype=np.uint8,
+                                  buffer=self.shm.buf, offset=SHM_DATA_OFFSET)
+
+    @property
+    def seq(self):
+        return SHM_SEQ.unpack_from(self.shm.buf, SHM_SEQ_OFFSET)[0]
+
+    def latest(self):
+        """(seq, frame view) of the newest frame; seq 0 means none yet."""
+        seq = self.seq
+        return seq, self._frames[seq % self.slots]
+
+    def close(self):
+        self._frames = None
+        self.shm.close()
+
+
+class FileSink(Sink):
+    """Writes Y4M (always I420) for .y4m paths, otherwise raw frames."""
+
+    name = 'file'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.y4m = path.lower().endswith('.y4m')
+        self._file = None
+        self._src_fmt = None
+        self._i420 = None
+
+    def describe(self):
+        return f"file {self.path}"
+
+    def _open(self, width, height, fps, fmt):
+        self._file = open(self.path, 'wb', buffering=1024 * 1024)
+        self._src_fmt = fmt
+        if self.y4m:
+            self._file.write(f"YUV4MPEG2 W{width} H{height} F{int(fps)}:1 Ip A1:1 C420jpeg\n".encode())
+
+    def _send(self, frame):
+        if self.y4m:
+            self._file.write(b'FRAME\n')
+            if self._src_fmt == FMT_BGR:
+                frame = self._i420 = convert_frame(frame, FMT_BGR, FMT_I420, out=self._i420)
+        self._file.write(np.ascontiguousarray(frame).data)
+
+    def _close(self):
+        f, self._file = self._file, None
+        self._i420 = None
+        f.close()
+
+
+def placeholder_frame(last, width, height, fmt, text):
+    """``last`` darkened (or a grey frame) with ``text`` across the middle."""
+    if fmt == FMT_BGR:
+        img = (cv2.convertScaleAbs(last, alpha=0.35) if last is not None
+               else np.full((height, width, 3), 40, np.uint8))
+        plane = img
+    else:
+        img = np.full((height * 3 // 2, width), 128, np.uint8)
+        plane = img[:height]
+        if last is not None:
+            cv2.convertScaleAbs(last[:height], plane, alpha=0.35)
+        else:
+            plane[:] = 40
+    scale = max(0.5, width / 640)
+    thickness = max(1, round(scale * 2))
+    (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    cv2.putText(plane, text, ((width - tw) // 2, (height + th) // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                scale, (235, 235, 235) if fmt == FMT_BGR else 235, thickness, cv2.LINE_AA)
+    return img
+
+
+class KeepAliveSink(Sink):
+    """Keeps ``inner`` open across reconnects.
+
+    close() - what a pipeline calls when its stream ends - doesn't close the
+    camera but stands by: a thread keeps sending the last frame, darkened,
+    with "Reconnecting..." at the camera's rate, so apps using it keep a
+    live device. The next send() takes over again; shutdown() really closes.
+    """
+
+    def __init__(self, inner):
+        super().__init__()
+        self.inner = inner
+        self.name = inner.name
+        self._last = None
+        self._lock = threading.Lock()
+        self._standby = None  # (stop event, thread) while the placeholder runs
+
+    def describe(self):
+        return self.inner.describe()
+
+    def ensure_open(self, width, height, fps=30, fmt=FMT_BGR):
+        if self.is_open and (self.width, self.height, self.fmt) == (width, height, fmt):
+            return False
+        self._wake()
+        if self.inner.is_open:
+            self.inner.close()  # a new size or format can't be kept open
+            self._last = None
+        self.open(width, height, fps, fmt)
+        return True
+
+    def send(self, frame):
+        self._wake()
+        with self._lock:
+            self.inner.send(frame)
+        # A copy: the frame may sit in a buffer or ConvertPool slot that is
+        # reused as soon as this returns
+        last = self._last
+        if last is None or last.shape != frame.shape or last.dtype != frame.dtype:
+            last = self._last = np.empty_like(frame)
+        np.copyto(last, frame)
+        self.frames += 1
+        self.bytes += frame.nbytes
+
+    def sleep_until_next_frame(self):
+        self.inner.sleep_until_next_frame()
+
+    def close(self):
+        self.standby()
+
+    def standby(self, text="Reconnecting..."):
+        """Sends a placeholder until the next send()."""
+        if not self.is_open or self._standby is not None:
+            return
+        frame = placeholder_frame(self._last, self.width, self.height, self.fmt, text)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._hold, args=(frame, stop), name="sink-standby", daemon=True)
+        self._standby = (stop, thread)
+        thread.start()
+
+    def shutdown(self):
+        self._wake()
+        self.inner.close()
+        self._last = None
+        self.width = self.height = self.fps = self.fmt = None
+
+    def _open(self, width, height, fps, fmt):
+        self.inner.open(width, height, fps, fmt)
+
+    def _hold(self, frame, stop):
+        interval = 1.0 / (self.fps or 30)
+        while not stop.wait(interval):
+            try:
+                with self._lock:
+                    self.inner.send(frame)
+            except Exception:
+                break
+
+    def _wake(self):
+        if self._standby is not None:
+            stop, thread = self._standby
+            stop.set()
+            thread.join()
+            self._standby = None
+
+
+def create_sink(spec=None):
+    """Builds a Sink from a spec string (see the module docstring)."""
+    spec = spec or DEFAULT_SINK
+    kind, _, arg = spec.partition(':')
+
+    if kind == 'auto':
+        # pyvirtualcam would prefer OBS on Windows; we ship for UnityCapture.
+        return PyVirtualCamSink(backend='unitycapture' if sys.platform == 'win32' else None)
+    if kind in ('unitycapture', 'v4l2loopback', 'obs'):
+        return PyVirtualCamSink(backend=kind, device=arg or None)
+    if kind == 'shm':
+        return SharedMemorySink(arg or 'webcamo')
+    if kind == 'file':
+        if not arg:
+            raise ValueError("file sink needs a path, e.g. file:out.y4m")
+        return FileSink(arg)
+    if kind == 'null':
+        return NullSink()
+    raise ValueError(f"Unknown sink: {spec}")
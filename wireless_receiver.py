@@ -0,0 +1,341 @@
+"""
+Wireless (WebRTC) receiver, independent of the GUI.
+
+The phone runs a WebSocket signalling server on port 8080. We send it an
+offer for a receive-only video transceiver, apply its answer and trickled
+ICE candidates, and run the track as a WebRtcSource through a
+frame_graph.FrameGraph into an I420 sink. The Qt client and the headless receiver both drive this
+class; status messages go to the "webcamo.wireless" logger and preview
+frames out through a callback.
+
+The event loop also runs signalling and (in the client) the whole Qt GUI,
+so nothing on it may block: frames are handed to the graph's convert
+thread through a one-frame LatestQueue, and cropping, sending and the
+virtual camera's frame pacing happen on its threads. Frames that queued up in the track while the loop was busy
+are skipped, so the camera always gets the newest one.
+
+run() keeps a session up: when ICE fails, the track ends or no video
+arrives for STALL_TIMEOUT seconds, it tears the connection down and
+reconnects with a reconnect.Backoff. The virtual camera is a KeepAliveSink
+that stays open across sessions (showing the last frame meanwhile) until
+close().
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+import websockets
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.sdp import candidate_from_sdp
+
+from frame_graph import FMT_AV, Frame, FrameGraph, FrameSource
+from frame_stats import FrameStats
+from reconnect import STALL_TIMEOUT, Backoff
+from vcam_sinks import FMT_I420, KeepAliveSink, create_sink
+
+WIRELESS_PORT = 8080
+FIRST_FRAME_TIMEOUT = 10.0
+
+log = logging.getLogger("webcamo.wireless")
+
+
+def signalling_url(ip, port=WIRELESS_PORT):
+    return f"ws://{ip}:{port}/ws"
+
+
+async def newest_frame(track):
+    """track.recv(), skipping frames already queued up behind the first.
+    Returns (frame, skipped).
+
+    aiortc's RemoteStreamTrack buffers decoded frames without bound, so after
+    the loop stalls every waiting frame is older than the one to show.
+    """
+    frame = await track.recv()
+    pending = getattr(track, '_queue', None)
+    skipped = 0
+    while pending is not None and pending.qsize():
+        frame = await track.recv()  # ready, doesn't suspend
+        skipped += 1
+    return frame, skipped
+
+
+class WebRtcSource(FrameSource):
+    """Frames from an aiortc video track (FMT_AV), for FrameGraph.run_async.
+
+    Frames that queued up in the track meanwhile are skipped (counted as
+    frames_dropped_stale). Raises asyncio.TimeoutError when no frame comes
+    for ``stall_timeout`` seconds (``first_timeout`` for the first one).
+    ``mirror`` is a callable, read per frame. With ``record`` (a
+    capture.CaptureWriter) every emitted frame is also queued for it.
+    """
+
+    name = 'wireless'
+
+    def __init__(self, track, mirror=lambda: True, stall_timeout=STALL_TIMEOUT,
+                 first_timeout=FIRST_FRAME_TIMEOUT, metrics=None, record=None):
+        self.track = track
+        self.record = record
+        self.mirror = mirror
+        self.stall_timeout = stall_timeout
+        self.first_timeout = first_timeout
+        self.metrics = metrics if metrics is not None else FrameStats()
+        self.skipped = 0
+
+    async def run(self, emit):
+        seq = 0
+        metrics = self.metrics
+        while True:
+            waiting = time.perf_counter()
+            # A phone that vanished without closing anything sends nothing
+            frame, skipped = await asyncio.wait_for(newest_frame(self.track),
+                                                    self.stall_timeout if seq else self.first_timeout)
+            received = time.perf_counter()
+            metrics.observe('recv', received - waiting)
+            if skipped:
+                self.skipped += skipped
+                metrics.count('frames_received', skipped)
+                metrics.count('frames_dropped_stale', skipped)
+            seq += skipped
+            mirror = self.mirror()
+            emit(Frame(frame, FMT_AV, frame.width, frame.height, seq, received, mirror=mirror))
+            if self.record is not None:
+                self.record.write_frame(frame, seq, received, mirror=mirror)
+            seq += 1
+
+    def stats(self):
+        return {'dropped_stale': self.skipped}
+
+
+class WirelessReceiver:
+    """One WebRTC session with the phone.
+
+    ``on_connected`` receives a bool when the session comes up or goes
+    down, and ``on_preview(img, code)`` every output frame as I420 together
+    with the cvtColor code to get BGR. ``mirror`` is a
+    callable so the GUI checkbox can change it mid-stream. ``on_timing``
+    receives a FrameTiming per frame, stamped from the decoder's hand-off;
+    stage timings and counters go to ``metrics`` (a frame_stats.FrameStats).
+    ``on_preview`` and ``on_timing`` are called from the sink thread.
+    ``pace`` sends to the camera at a constant 30 fps (see FrameGraph).
+    ``record`` (a capture.CaptureWriter) gets every decoded frame, over all
+    sessions; its owner closes it. ``sink`` is a KeepAliveSink to send to
+    instead of one opened from ``sink_spec``, so another receiver can share
+    the camera; close() shuts it down all the same.
+    """
+
+    def __init__(self, on_connected=None, on_preview=None,
+                 mirror=lambda: True, size=720, sink_spec=None, on_timing=None, metrics=None, pace=True,
+                 record=None, sink=None):
+        self.on_connected = on_connected
+        self.on_preview = on_preview
+        self.on_timing = on_timing
+        self.metrics = metrics if metrics is not None else FrameStats()
+        self.mirror = mirror
+        self.size = size
+        self.sink_spec = sink_spec
+        self.pace = pace
+        self.record = record
+
+        self.pc: RTCPeerConnection | None = None
+        self.ws = None
+        self.cam = sink  # KeepAliveSink, fed by the graph's sink thread
+        self.running_receiver = False
+        self.receiver_done = None
+        self.graph = None       # FrameGraph of the current session
+        self._frames = 0        # received in earlier sessions
+        self.last_stats = None  # FrameGraph.stats() of the last session
+        self._closing = False
+        self._ended = None      # asyncio.Event, set when the session drops
+        self._run_task = None
+
+    @property
+    def frames(self):
+        """Frames received over all sessions so far."""
+        return self._frames + (self.graph.received if self.graph else 0)
+
+    def _set_connected(self, ok):
+        if self.on_connected:
+            self.on_connected(ok)
+
+    async def run(self, url: str, backoff=None):
+        """Connects to ``url`` and reconnects whenever the session fails or
+        drops, until disconnect() or close()."""
+        backoff = backoff or Backoff()
+        self._run_task = asyncio.current_task()
+        retrying = False  # failed attempts are logged once, then at DEBUG
+        try:
+            while True:
+                self._ended = asyncio.Event()
+                frames = self.frames
+                if await self.connect(url, quiet=retrying):
+                    await self._ended.wait()
+                streamed = self.frames > frames
+                await self._teardown()
+                if streamed:
+                    log.warning("Phone disconnected, reconnecting...")
+                    delay = backoff.reset()
+                    retrying = False
+                else:
+                    if not retrying:
+                        log.info("Waiting for the phone...")
+                    delay = backoff.next()
+                    retrying = True
+                await asyncio.sleep(delay)
+        finally:
+            self._run_task = None
+
+    def _end_session(self):
+        if self._ended is not None:
+            self._ended.set()
+
+    async def connect(self, url: str, quiet=False):
+        """Runs signalling up to the answer. Returns False on failure; the
+        caller is expected to disconnect() then. ``quiet`` logs the attempt
+        and its failure at DEBUG, for retries."""
+        info, error = (logging.DEBUG, logging.DEBUG) if quiet else (logging.INFO, logging.ERROR)
+        try:
+            log.log(info, "Creating PeerConnection")
+            pc = self.pc = RTCPeerConnection()
+
+            # Log ICE state changes
+            @pc.on("iceconnectionstatechange")
+            def _on_ice_state():
+                log.info(f"ICE: {pc.iceConnectionState}")
+                if pc.iceConnectionState in ('failed', 'closed'):
+                    self._end_session()
+
+            # Prepare to receive video
+            self.pc.addTransceiver("video", direction="recvonly")
+
+            log.log(info, f"Connecting WebSocket: {url}")
+            self.ws = await websockets.connect(url)
+            log.info("WebSocket connected")
+
+            # Track handler
+            @self.pc.on("track")
+            def on_track(track):
+                log.info(f"Track: {track.kind}")
+                if track.kind != "video":
+                    return
+                if self.running_receiver:
+                    return
+                self.running_receiver = True
+                self.receiver_done = asyncio.ensure_future(self._receiver_task(track))
+
+            # Create & send OFFER
+            log.info("Creating Offer…")
+            offer = await self.pc.createOffer()
+            await self.pc.setLocalDescription(offer)
+
+            await self.ws.send(json.dumps({
+                "type": "offer",
+                "sdp": self.pc.localDescription.sdp
+            }))
+            log.info("Offer sent. Waiting for Answer…")
+
+            # Receive ANSWER
+            answer_json = await self.ws.recv()
+            data = json.loads(answer_json)
+            if data.get("type") != "answer" or not data.get("sdp"):
+                raise RuntimeError(f"Bad answer: {data}")
+            await self.pc.setRemoteDescription(RTCSessionDescription(data["sdp"], "answer"))
+            log.info("Answer applied")
+            self._set_connected(True)
+
+            # Handle incoming ICE
+            asyncio.ensure_future(self._ice_listener())
+            return True
+
+        except Exception as e:
+            log.log(error, f"⚠️  Connect error: {e}")
+            return False
+
+    async def _ice_listener(self):
+        try:
+            while self.ws:
+                msg = await self.ws.recv()
+                data = json.loads(msg)
+                if data.get("type") == "candidate" and data.get("candidate"):
+                    cand = data["candidate"]
+                    log.debug("ICE Candidate → parsing SDP")
+                    ice = candidate_from_sdp(cand["candidate"])
+                    ice.sdpMid = cand.get("sdpMid")
+                    ice.sdpMLineIndex = cand.get("sdpMLineIndex")
+                    await self.pc.addIceCandidate(ice)
+                    log.debug("ICE added")
+        except Exception as e:
+            if not self._closing:
+                log.warning(f"⚠️ ICE listener ended: {e}")
+
+    async def _receiver_task(self, track):
+        log.info("Starting frame receiver")
+        if self.cam is None:
+            # Opened by the graph's sink thread; stays open across reconnects until close()
+            self.cam = KeepAliveSink(create_sink(self.sink_spec))
+        source = WebRtcSource(track, mirror=self.mirror, metrics=self.metrics, record=self.record)
+        graph = self.graph = FrameGraph(source, self.cam, size=self.size, fmt=FMT_I420,
+                                        on_frame=self.on_preview, on_timing=self.on_timing,
+                                        metrics=self.metrics, pace=self.pace, name='wireless', logger=log)
+        try:
+            await graph.run_async()
+        except asyncio.TimeoutError:
+            log.warning("⚠️ No video from the phone, dropping the connection")
+        except Exception as e:
+            if not self._closing:
+                log.warning(f"⚠️ Receiver ended: {e}")
+        finally:
+            self._frames += graph.received
+            self.last_stats = graph.stats()
+            self.graph = None
+            self.running_receiver = False
+            self._end_session()
+
+    async def disconnect(self):
+        """Ends the session (and run()); the virtual camera stays open."""
+        task = self._run_task
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self._teardown()
+        if self.cam:
+            self.cam.standby("Disconnected")
+
+    async def close(self):
+        """disconnect(), then closes the virtual camera."""
+        await self.disconnect()
+        if self.cam:
+            try:
+                self.cam.shutdown()
+            except Exception:
+                pass
+        self.cam = None
+
+    async def _teardown(self):
+        self._closing = True
+        self._set_connected(False)
+        try:
+            if self.ws:
+                await self.ws.close()
+        except Exception:
+            pass
+        self.ws = None
+
+        try:
+            if self.pc:
+                await self.pc.close()
+        except Exception:
+            pass
+        self.pc = None
+
+        if self.receiver_done is not None:
+            await asyncio.gather(self.receiver_done, return_exceptions=True)
+            self.receiver_done = None
+        if self.cam:
+            self.cam.standby()
+
+        self._closing = False
@@ -0,0 +1,184 @@
+"""
+YUV_420_888 -> BGR conversion for packets read by usb_protocol.PacketReader.
+
+Android hands out three planes with arbitrary row and pixel strides. Most
+phones actually deliver semi-planar chroma: the U and V planes are two views
+of one interleaved buffer, offset by a byte (pixel stride 2). YuvConverter
+works out which layout a stream uses once per geometry and then feeds the
+planes to OpenCV without repacking them:
+
+    nv21     V plane is VUVU..., fed to cvtColorTwoPlane as-is
+    nv12     U plane is UVUV..., fed to cvtColorTwoPlane as-is
+    i420     tightly packed planar data, the slot is already an I420 image
+    generic  anything else, gathered into a reused I420 buffer
+
+Given a frame_geometry.GeometryPlan, the crop/rotate/scale is applied to the
+planes before conversion instead of to the BGR result.
+"""
+
+import dataclasses
+import time
+
+import cv2
+import numpy as np
+
+LAYOUT_NV21 = 'nv21'
+LAYOUT_NV12 = 'nv12'
+LAYOUT_I420 = 'i420'
+LAYOUT_GENERIC = 'generic'
+
+
+def geometry_key(meta):
+    """Everything in the metadata that can change the layout (not is_front)."""
+    return dataclasses.replace(meta, is_front=False)
+
+
+def _interleaved(first, second, width, rows):
+    """True if ``second`` is ``first`` shifted by one byte on the sampled rows.
+
+    Returns None when the sample can't tell (flat chroma, e.g. a black frame),
+    so the decision is retried on a later frame.
+    """
+    # The last sample of each plane may sit in the unsent row padding.
+    samples = {0, rows // 2, rows - 1}
+    if all(np.array_equal(first[r, :width - 1], second[r, :width - 1]) for r in samples):
+        return None
+    return all(np.array_equal(first[r, 1:width - 1], second[r, :width - 2]) for r in samples)
+
+
+def detect_layout(packet):
+    meta = packet.meta
+    width, rows = meta.width, meta.uv_height
+
+    if meta.u_pixel_stride == 2 and meta.v_pixel_stride == 2 and meta.u_stride == meta.v_stride:
+        vu = _interleaved(packet.v, packet.u, width, rows)
+        if vu is None:
+            return None
+        if vu:
+            return LAYOUT_NV21
+        if _interleaved(packet.u, packet.v, width, rows):
+            return LAYOUT_NV12
+        return LAYOUT_GENERIC
+
+    if meta.u_pixel_stride == 1 and meta.v_pixel_stride == 1:
+        y_size = meta.height * meta.width
+        uv_size = rows * (width // 2)
+        if (meta.y_stride == width and meta.u_stride == meta.v_stride == width // 2
+                and meta.y_len == y_size and meta.u_len == uv_size):
+            return LAYOUT_I420
+
+    return LAYOUT_GENERIC
+
+
+def i420_planes(img, width, height):
+    """Y, U and V views of an (height * 3 // 2, width) I420 image."""
+    flat = img.reshape(-1)
+    y_size, uv_size = width * height, (width // 2) * (height // 2)
+    uv_shape = (height // 2, width // 2)
+    return (img[:height], flat[y_size:y_size + uv_size].reshape(uv_shape),
+            flat[y_size + uv_size:y_size + 2 * uv_size].reshape(uv_shape))
+
+
+def pack_i420(y, u, v, geometry=None, out=None):
+    """Writes three planes into one I420 image, applying ``geometry`` on the
+    way: one pass (or copy) per plane. ``out`` is reused if it has the right
+    shape, otherwise a new buffer is allocated."""
+    height, width = geometry.out_shape() if geometry is not None else y.shape
+    shape = (height * 3 // 2, width)
+    if out is None or out.shape != shape:
+        out = np.empty(shape, dtype=np.uint8)
+
+    y_dst, u_dst, v_dst = i420_planes(out, width, height)
+
+    if geometry is None:
+        np.copyto(y_dst, y)
+        np.copyto(u_dst, u)
+        np.copyto(v_dst, v)
+    else:
+        geometry.apply(y, dst=y_dst)
+        geometry.apply(u, chroma=True, dst=u_dst)
+        geometry.apply(v, chroma=True, dst=v_dst)
+    return out
+
+
+def av_frame_planes(frame):
+    """Y, U and V views over a decoded av.VideoFrame, without copying.
+
+    Frames the decoder produced in another format (e.g. nv12 from a hardware
+    decoder) are first converted to yuv420p with libswscale.
+    """
+    if frame.format.name != 'yuv420p':
+        frame = frame.reformat(format='yuv420p')
+    planes = []
+    for plane in frame.planes:
+        rows = np.frombuffer(plane, dtype=np.uint8, count=plane.height * plane.line_size)
+        planes.append(rows.reshape((plane.height, plane.line_size))[:, :plane.width])
+    return planes
+
+
+class YuvConverter:
+    """Converts VideoPackets to BGR, caching the layout per stream geometry.
+
+    ``geometry_time`` is how long the last to_bgr() spent cropping, scaling
+    and orienting (including the I420 repack on the planar paths), in seconds.
+    """
+
+    def __init__(self):
+        self._key = None
+        self.layout = None
+        self._i420 = None
+        self.geometry_time = 0.0
+
+    def to_bgr(self, packet, geometry=None, dst=None):
+        """Converts ``packet`` to BGR. With a GeometryPlan the planes are
+        cropped, scaled and oriented first, so only output pixels are
+        converted."""
+        meta = packet.meta
+        key = geometry_key(meta)
+        if key != self._key:
+            self._key = key
+            self.layout = None
+
+        layout = self.layout
+        if layout is None:
+            layout = self.layout = detect_layout(packet)
+
+        width, height = meta.width, meta.height
+        uv_width, uv_height = width // 2, meta.uv_height
+        y = packet.y[:, :width]
+
+        if layout in (LAYOUT_NV21, LAYOUT_NV12):
+            if layout == LAYOUT_NV21:
+                # The V view stops one byte short of the last U sample.
+                packet.v[-1, width - 1] = packet.u[-1, width - 2]
+                uv, code = packet.v, cv2.COLOR_YUV2BGR_NV21
+            else:
+                packet.u[-1, width - 1] = packet.v[-1, width - 2]
+                uv, code = packet.u, cv2.COLOR_YUV2BGR_NV12
+            uv = uv[:, :width].reshape((uv_height, uv_width, 2))
+            if geometry is not None:
+                start = time.perf_counter()
+                y = geometry.apply(y)
+                uv = geometry.apply(uv, chroma=True)
+                self.geometry_time = time.perf_counter() - start
+            else:
+                self.geometry_time = 0.0
+            return cv2.cvtColorTwoPlane(y, uv, code, dst=dst)
+
+        if layout == LAYOUT_I420:
+            flat = np.frombuffer(packet.buffer, dtype=np.uint8, count=height * width * 3 // 2)
+            if geometry is None:
+                self.geometry_time = 0.0
+                return cv2.cvtColor(flat.reshape((height * 3 // 2, width)), cv2.COLOR_YUV2BGR_I420, dst=dst)
+            y_size, uv_size = width * height, uv_width * uv_height
+            y = flat[:y_size].reshape((height, width))
+            u = flat[y_size:y_size + uv_size].reshape((uv_height, uv_width))
+            v = flat[y_size + uv_size:].reshape((uv_height, uv_width))
+        else:
+            u = packet.u[:, ::meta.u_pixel_stride][:, :uv_width]
+            v = packet.v[:, ::meta.v_pixel_stride][:, :uv_width]
+
+        start = time.perf_counter()
+        self._i420 = pack_i420(y, u, v, geometry, out=self._i420)
+        self.geometry_time = time.perf_counter() - start
+        return cv2.cvtColor(self._i420, cv2.COLOR_YUV2BGR_I420, dst=dst)